@@ -1,32 +1,75 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 import os
-from models import db, User, Category, Product, Supplier, Customer, Purchase, PurchaseItem, Sale, SaleItem, Inventory, InventoryTransaction, Setting
-from forms import LoginForm, RegisterForm, CategoryForm, ProductForm, SupplierForm, CustomerForm, PasswordResetRequestForm, PasswordResetForm
-from utils import generate_barcode_file, generate_barcode_base64, generate_random_barcode
+import tempfile
+import click
+from models import db, User, Category, Product, Supplier, Customer, Purchase, PurchaseItem, Sale, SaleItem, Inventory, InventoryTransaction, InventoryMovement, UserActivity, Stocktake
+from forms import LoginForm, RegisterForm, CategoryForm, ProductForm, SupplierForm, CustomerForm, SaleForm, PasswordResetRequestForm, PasswordResetForm
+from utils import generate_barcode_file, generate_barcode_base64, generate_random_barcode, get_barcode_types
 from export import generate_product_report, generate_inventory_report, generate_sales_report, generate_purchases_report
+from export import stream_product_report, stream_inventory_report, stream_sales_report, stream_purchases_report
+from summaries import get_daily_sales, rebuild_daily_sales_summary, rebuild_product_daily_sales, apply_sale_to_summary, apply_sale_items_to_product_sales, get_product_profit
+from pagination import keyset_paginate, date_range_conditions
+from labels import is_label_barcode_type, select_label_products, write_label_sheet
+from search import ensure_search_index, index_product, remove_product_from_index, rebuild_search_index, search_products
+from seed import seed_database
+from stocktake import StocktakeError, open_stocktake, parse_scans, record_counts, get_stocktake_summary, get_variances, post_stocktake, cancel_stocktake
+from product_import import IMPORT_CHUNK_SIZE, import_products, read_import_rows
+from database import configure_database, init_database
+from migrations import migrate
+from index_advisor import advise_routes
+from low_stock import count_low_stock, get_low_stock_products, get_low_stock_version, get_low_stock_changes, get_low_stock_last_change, rebuild_low_stock
+from inventory_stats import DEAD_STOCK_DAYS, get_inventory_summary, get_category_values, stock_status_filter
+from audit import init_audit, log_activity
+from user_cache import init_user_cache, load_cached_user
+from settings_registry import SETTINGS, init_settings, get_settings, update_settings
+from reference_data import get_reference_list, reference_choices, search_customers, existing_ids
+from sync import DEFAULT_SYNC_PAGE_SIZE, MAX_SYNC_PAGE_SIZE, compressed_jsonify, get_catalog_changes, get_last_change
+from http_cache import conditional_response
+from sale_batch import MAX_BATCH_SALES, upload_sales
+from stock import InsufficientStockError, load_stock_levels, decrement_stock, increment_stock
+from profiler import init_profiler, get_route_stats, reset_route_stats
+from sqlalchemy import insert, update
+from sqlalchemy.orm import joinedload
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///makhzan.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///makhzan.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# SQL profiling: per-request query counts and N+1 warnings (opt-in)
+app.config['SQL_PROFILER_ENABLED'] = os.environ.get('SQL_PROFILER_ENABLED') == '1'
+app.config['SQL_PROFILER_REPEAT_THRESHOLD'] = int(os.environ.get('SQL_PROFILER_REPEAT_THRESHOLD', 5))
+
+# Activities are queued and inserted by a background writer (set AUDIT_WRITE_BEHIND=0 to insert them inline)
+app.config['AUDIT_WRITE_BEHIND'] = os.environ.get('AUDIT_WRITE_BEHIND', '1') == '1'
+
 # Initialize extensions
+configure_database(app)
 db.init_app(app)
+init_database(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+init_profiler(app)
+init_audit(app)
+init_user_cache(app)
+init_settings(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(user_id)
 
 # Create database tables and admin user
 def create_tables():
     with app.app_context():
         db.create_all()
+        migrate()
+        ensure_search_index()
+        if get_low_stock_version() == 0:
+            rebuild_low_stock()
         # Create admin user if not exists
         if not User.query.filter_by(username='admin').first():
             admin = User(
@@ -40,6 +83,221 @@ def create_tables():
             db.session.add(admin)
             db.session.commit()
 
+@app.cli.command('rebuild-sales-summary')
+def rebuild_sales_summary_command():
+    """Rebuild the daily sales summary tables from existing sales"""
+    count = rebuild_daily_sales_summary()
+    print(f'Rebuilt {count} daily sales summary rows')
+    count = rebuild_product_daily_sales()
+    print(f'Rebuilt {count} product daily sales rows')
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the product full-text search index"""
+    count = rebuild_search_index()
+    print(f'Indexed {count} products')
+
+@app.cli.command('seed')
+@click.option('--products', default=1000, show_default=True, help='Number of products')
+@click.option('--sales', default=5000, show_default=True, help='Number of sales')
+@click.option('--purchases', default=500, show_default=True, help='Number of purchases')
+@click.option('--customers', default=500, show_default=True, help='Number of customers')
+@click.option('--suppliers', default=50, show_default=True, help='Number of suppliers')
+@click.option('--items-per-sale', default=3, show_default=True, help='Average items per sale or purchase')
+@click.option('--days', default=365, show_default=True, help='Spread dates over this many past days')
+@click.option('--seed', 'random_seed', default=42, show_default=True, help='Random seed')
+def seed_command(products, sales, purchases, customers, suppliers, items_per_sale, days, random_seed):
+    """Fill the database with a synthetic dataset"""
+    create_tables()
+    counts = seed_database(
+        products=products,
+        sales=sales,
+        purchases=purchases,
+        customers=customers,
+        suppliers=suppliers,
+        items_per_sale=items_per_sale,
+        days=days,
+        seed=random_seed
+    )
+    for table, count in counts.items():
+        print(f'{table}: {count}')
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per bulk insert and commit')
+def import_products_command(path, chunk_size):
+    """Create or update products from a CSV or XLSX file"""
+    create_tables()
+    with open(path, 'rb') as stream:
+        try:
+            result = import_products(read_import_rows(stream, path), chunk_size=chunk_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    print(f'Created {result.created} products, updated {result.updated}, {result.error_count} rows with errors')
+    for error in result.errors:
+        print(f"  row {error['row']}: {error['error']}")
+
+@app.cli.command('rebuild-low-stock')
+def rebuild_low_stock_command():
+    """Recompute the low-stock flag of every product"""
+    version = rebuild_low_stock()
+    print(f'Low-stock set updated to version {version}' if version else 'Low-stock set is up to date')
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations"""
+    with app.app_context():
+        db.create_all()
+        applied = migrate()
+    print(f'Applied migrations: {applied}' if applied else 'Schema is up to date')
+
+@app.cli.command('index-advisor')
+@click.option('--fail-on-scan', is_flag=True,
+              help='Exit with status 1 if an index could avoid a table scan or a route did not succeed')
+def index_advisor_command(fail_on_scan):
+    """Explain the queries of the hot routes and propose indexes for full table scans"""
+    from benchmark import ROUTES
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    admin = User.query.filter_by(role='admin', is_active=True).first()
+    if admin is None:
+        raise click.ClickException('No active admin user; run the app once first')
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+
+    paths = [(name, path) for name, method, path in ROUTES if method == 'GET']
+    with db.engine.connect() as connection:
+        report = advise_routes(client, list(db.engines.values()), connection, paths)
+
+    # Scans of tables the query neither filters nor sorts are deliberate
+    # full reads (e.g. exports) and are listed without failing
+    scans = 0
+    failed_routes = []
+    for name, (status, results) in report.items():
+        print(f'{name} (HTTP {status}): {len(results)} queries')
+        # An error page runs few or none of the route's queries
+        if not 200 <= status < 300:
+            failed_routes.append(name)
+            print('  warning: the route did not succeed, so its queries were not inspected')
+        for result in results:
+            if not result['scans']:
+                continue
+            if result['proposals']:
+                scans += 1
+                print(f"  full scan of {', '.join(result['scans'])}:")
+            else:
+                print(f"  full read of {', '.join(result['scans'])}:")
+            print(f"    {' '.join(result['statement'].split())}")
+            for proposal in result['proposals']:
+                print(f'    proposed: {proposal}')
+
+    print(f'{scans} queries with avoidable full table scans')
+    if failed_routes:
+        print(f"Routes that did not succeed: {', '.join(failed_routes)}")
+    if fail_on_scan and (scans or failed_routes):
+        raise SystemExit(1)
+
+def wants_json():
+    """Whether a list route was asked for its JSON variant"""
+    return request.args.get('format') == 'json'
+
+def serialize_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'barcode': product.barcode,
+        'sku': product.sku,
+        'category': product.category.name if product.category else None,
+        'purchase_price': product.purchase_price,
+        'sale_price': product.sale_price,
+        'min_quantity': product.min_quantity,
+        'quantity': product.inventory.quantity if product.inventory else 0,
+        'created_at': product.created_at.isoformat() if product.created_at else None
+    }
+
+def serialize_supplier(supplier):
+    return {
+        'id': supplier.id,
+        'name': supplier.name,
+        'contact_person': supplier.contact_person,
+        'phone': supplier.phone,
+        'email': supplier.email,
+        'created_at': supplier.created_at.isoformat() if supplier.created_at else None
+    }
+
+def serialize_customer(customer):
+    return {
+        'id': customer.id,
+        'name': customer.name,
+        'phone': customer.phone,
+        'email': customer.email,
+        'created_at': customer.created_at.isoformat() if customer.created_at else None
+    }
+
+def serialize_purchase(purchase):
+    return {
+        'id': purchase.id,
+        'invoice_number': purchase.invoice_number,
+        'supplier': purchase.supplier.name if purchase.supplier else None,
+        'purchase_date': purchase.purchase_date.isoformat() if purchase.purchase_date else None,
+        'total_amount': purchase.total_amount,
+        'status': purchase.status,
+        'created_at': purchase.created_at.isoformat() if purchase.created_at else None
+    }
+
+def serialize_sale(sale):
+    return {
+        'id': sale.id,
+        'invoice_number': sale.invoice_number,
+        'customer': sale.customer.name if sale.customer else None,
+        'sale_date': sale.sale_date.isoformat() if sale.sale_date else None,
+        'total_amount': sale.total_amount,
+        'status': sale.status,
+        'created_at': sale.created_at.isoformat() if sale.created_at else None
+    }
+
+def serialize_transaction(transaction):
+    return {
+        'id': transaction.id,
+        'product_id': transaction.product_id,
+        'transaction_type': transaction.transaction_type,
+        'quantity_before': transaction.quantity_before,
+        'quantity_change': transaction.quantity_change,
+        'quantity_after': transaction.quantity_after,
+        'reference_type': transaction.reference_type,
+        'reference_id': transaction.reference_id,
+        'notes': transaction.notes,
+        'user_id': transaction.user_id,
+        'timestamp': transaction.timestamp.isoformat() if transaction.timestamp else None
+    }
+
+def serialize_movement(row):
+    movement, inventory, product = row
+    return {
+        'id': movement.id,
+        'timestamp': movement.timestamp.isoformat() if movement.timestamp else None,
+        'product_id': product.id,
+        'product_name': product.name,
+        'movement_type': movement.movement_type,
+        'quantity': movement.quantity,
+        'reference': movement.reference,
+        'notes': movement.notes
+    }
+
+def serialize_activity(row):
+    activity, user = row
+    return {
+        'id': activity.id,
+        'timestamp': activity.timestamp.isoformat() if activity.timestamp else None,
+        'user_id': activity.user_id,
+        'username': user.username if user else None,
+        'activity_type': activity.activity_type,
+        'description': activity.description
+    }
+
 # Routes
 @app.route('/')
 @login_required
@@ -56,23 +314,14 @@ def index():
     recent_purchases = Purchase.query.order_by(Purchase.created_at.desc()).limit(5).all()
 
     # Low stock products
-    low_stock_products = db.session.query(Product, Inventory).join(
-        Inventory, Product.id == Inventory.product_id
-    ).filter(Inventory.quantity <= Product.min_quantity).limit(5).all()
+    low_stock_products = get_low_stock_products(limit=5)
+    low_stock_count = count_low_stock()
 
     # Sales data for chart
     today = datetime.now().date()
     start_date = today - timedelta(days=6)
 
-    sales_data = []
-    for i in range(7):
-        date = start_date + timedelta(days=i)
-        sales_on_date = Sale.query.filter(Sale.sale_date == date).all()
-        total_sales = sum(sale.total_amount for sale in sales_on_date)
-        sales_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'total': total_sales
-        })
+    sales_data = get_daily_sales(start_date, today)
 
     return render_template(
         'index.html',
@@ -82,6 +331,7 @@ def index():
         recent_sales=recent_sales,
         recent_purchases=recent_purchases,
         low_stock_products=low_stock_products,
+        low_stock_count=low_stock_count,
         sales_data=sales_data
     )
 
@@ -95,6 +345,7 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
             login_user(user, remember=form.remember_me.data)
+            log_activity(user.id, 'login', f'تسجيل دخول المستخدم {user.username}')
             next_page = request.args.get('next')
             return redirect(next_page or url_for('index'))
         else:
@@ -106,6 +357,7 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    log_activity(current_user.id, 'logout', f'تسجيل خروج المستخدم {current_user.username}')
     logout_user()
     return redirect(url_for('login'))
 
@@ -210,10 +462,18 @@ def serve_static(filename):
 @app.route('/reports')
 @login_required
 def reports():
-    categories = Category.query.all()
-    return render_template('reports/index.html', categories=categories)
+    return render_template('reports/index.html', categories=get_reference_list('categories'))
 
 # Export routes
+def csv_response(chunks, name):
+    """Send CSV chunks to the client as a streamed attachment"""
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={name}_{timestamp}.csv'}
+    )
+
 @app.route('/export/products/<format>')
 @login_required
 def export_products(format):
@@ -221,8 +481,10 @@ def export_products(format):
         flash('Invalid export format', 'danger')
         return redirect(url_for('products'))
 
-    products = Product.query.all()
-    filepath = generate_product_report(products, format)
+    if format == 'csv':
+        return csv_response(stream_product_report(), 'products_report')
+
+    filepath = generate_product_report(format)
 
     return send_file(filepath, as_attachment=True)
 
@@ -233,8 +495,10 @@ def export_inventory(format):
         flash('Invalid export format', 'danger')
         return redirect(url_for('inventory'))
 
-    inventory_items = Inventory.query.all()
-    filepath = generate_inventory_report(inventory_items, format)
+    if format == 'csv':
+        return csv_response(stream_inventory_report(), 'inventory_report')
+
+    filepath = generate_inventory_report(format)
 
     return send_file(filepath, as_attachment=True)
 
@@ -245,8 +509,10 @@ def export_sales(format):
         flash('Invalid export format', 'danger')
         return redirect(url_for('sales'))
 
-    sales = Sale.query.all()
-    filepath = generate_sales_report(sales, format)
+    if format == 'csv':
+        return csv_response(stream_sales_report(), 'sales_report')
+
+    filepath = generate_sales_report(format)
 
     return send_file(filepath, as_attachment=True)
 
@@ -257,8 +523,10 @@ def export_purchases(format):
         flash('Invalid export format', 'danger')
         return redirect(url_for('purchases'))
 
-    purchases = Purchase.query.all()
-    filepath = generate_purchases_report(purchases, format)
+    if format == 'csv':
+        return csv_response(stream_purchases_report(), 'purchases_report')
+
+    filepath = generate_purchases_report(format)
 
     return send_file(filepath, as_attachment=True)
 
@@ -266,8 +534,108 @@ def export_purchases(format):
 @app.route('/products')
 @login_required
 def products():
-    products = Product.query.all()
-    return render_template('products/index.html', products=products)
+    search_query = request.args.get('q', '').strip()
+    if search_query:
+        results = search_products(search_query, limit=100)
+        if wants_json():
+            return jsonify({'items': [serialize_product(product) for product in results]})
+        return render_template('products/index.html', products=results, page=None, search_query=search_query)
+
+    query = Product.query.options(joinedload(Product.category), joinedload(Product.inventory))
+    page = keyset_paginate(query, Product.created_at, Product.id)
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_product))
+
+    return render_template('products/index.html', products=page.items, page=page, search_query='')
+
+@app.route('/api/products/search')
+@login_required
+def api_products_search():
+    search_query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = search_products(search_query, limit=limit) if search_query else []
+    return jsonify([serialize_product(product) for product in results])
+
+@app.route('/api/products')
+@login_required
+def api_products():
+    # The last change to any product or its stock versions the whole list
+    seq, changed_at = get_last_change()
+    return conditional_response(f'products-{seq}', changed_at, build_products_list)
+
+def build_products_list():
+    rows = db.session.query(
+        Product.id,
+        Product.name,
+        Product.sku,
+        Product.sale_price,
+        Inventory.quantity
+    ).join(
+        Inventory, Inventory.product_id == Product.id
+    ).filter(
+        Inventory.quantity > 0
+    ).all()
+
+    return jsonify([{
+        'id': row.id,
+        'name': row.name,
+        'sku': row.sku,
+        'price': row.sale_price,
+        'quantity': row.quantity
+    } for row in rows])
+
+@app.route('/api/product/<int:id>')
+@login_required
+def api_product(id):
+    # Only the product's and its inventory's timestamps are read to validate the client's copy
+    stamps = db.session.query(
+        Product.updated_at,
+        Inventory.last_updated
+    ).outerjoin(
+        Inventory, Inventory.product_id == Product.id
+    ).filter(
+        Product.id == id
+    ).first()
+    if stamps is None:
+        abort(404)
+
+    changed = [value for value in stamps if value is not None]
+    etag = 'product-{}-{}-{}'.format(
+        id,
+        stamps.updated_at.timestamp() if stamps.updated_at else 0,
+        stamps.last_updated.timestamp() if stamps.last_updated else 0
+    )
+    return conditional_response(etag, max(changed) if changed else None, lambda: build_product(id))
+
+def build_product(id):
+    product = Product.query.options(joinedload(Product.inventory)).get_or_404(id)
+    return jsonify({
+        'id': product.id,
+        'name': product.name,
+        'sku': product.sku,
+        'description': product.description,
+        'purchase_price': product.purchase_price,
+        'sale_price': product.sale_price,
+        'quantity': product.inventory.quantity if product.inventory else 0
+    })
+
+@app.route('/api/sync/products')
+@login_required
+def api_sync_products():
+    limit = max(1, min(request.args.get('limit', DEFAULT_SYNC_PAGE_SIZE, type=int), MAX_SYNC_PAGE_SIZE))
+    try:
+        page = get_catalog_changes(request.args.get('cursor'), limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return compressed_jsonify(page)
+
+@app.route('/api/customers/search')
+@login_required
+def api_customers_search():
+    search_query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    return jsonify([serialize_customer(customer) for customer in search_customers(search_query, limit=limit)])
 
 @app.route('/products/barcode/<int:id>')
 @login_required
@@ -277,6 +645,7 @@ def product_barcode(id):
     # If product doesn't have a barcode, generate one
     if not product.barcode:
         product.barcode = generate_random_barcode()
+        index_product(product)
         db.session.commit()
 
     # Generate barcode image
@@ -290,16 +659,55 @@ def product_barcode(id):
                           barcode_path=barcode_path,
                           barcode_base64=barcode_base64)
 
+@app.route('/products/labels', methods=['GET', 'POST'])
+@login_required
+def product_labels():
+    if request.method == 'POST':
+        selection = request.form.get('selection', 'all')
+        barcode_type = request.form.get('barcode_type', 'code128')
+        category_id = request.form.get('category_id', type=int)
+        product_ids = [int(value) for value in request.form.get('product_ids', '').replace(',', ' ').split() if value.isdigit()]
+
+        # Checked before selecting: the 'missing' selection saves new barcodes
+        if not is_label_barcode_type(barcode_type):
+            flash('نوع الباركود غير مدعوم', 'danger')
+            return redirect(url_for('product_labels'))
+
+        products = select_label_products(selection, category_id=category_id, product_ids=product_ids)
+        if not products:
+            flash('لا توجد منتجات مطابقة لطباعة الملصقات', 'warning')
+            return redirect(url_for('product_labels'))
+
+        # The sheet goes to a temporary file and is sent from disk in chunks,
+        # so the worker does not hold the finished PDF while sending it.
+        # send_file closes (and so deletes) the file when the response closes.
+        sheet = tempfile.TemporaryFile()
+        try:
+            printed, skipped = write_label_sheet(products, sheet, barcode_type)
+        except BaseException:
+            sheet.close()
+            raise
+        sheet.seek(0)
+
+        response = send_file(
+            sheet,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=f'labels_{datetime.now().strftime("%Y%m%d%H%M%S")}.pdf'
+        )
+        response.headers['X-Labels-Printed'] = str(printed)
+        response.headers['X-Labels-Skipped'] = str(skipped)
+        return response
+
+    return render_template('products/labels.html', categories=get_reference_list('categories'), barcode_types=get_barcode_types())
+
 @app.route('/products/add', methods=['GET', 'POST'])
 @login_required
 def add_product():
     form = ProductForm()
 
-    # Get all categories for the dropdown
-    categories = Category.query.all()
-
     # Check if there are any categories
-    if not categories:
+    if not get_reference_list('categories'):
         # Create some default categories if none exist
         default_categories = [
             Category(name='ألبان', description='منتجات الألبان والأجبان'),
@@ -310,11 +718,9 @@ def add_product():
         ]
         db.session.add_all(default_categories)
         db.session.commit()
-        categories = Category.query.all()
 
     # Set the choices for the category dropdown
-    form.category_id.choices = [(c.id, c.name) for c in categories]
-    form.category_id.choices.insert(0, (0, 'بدون تصنيف'))
+    form.category_id.choices = reference_choices('categories', blank='بدون تصنيف')
 
     if form.validate_on_submit():
         product = Product(
@@ -328,7 +734,7 @@ def add_product():
             category_id=form.category_id.data if form.category_id.data != 0 else None
         )
         db.session.add(product)
-        db.session.commit()
+        db.session.flush()
 
         # Create inventory record
         inventory = Inventory(
@@ -351,19 +757,44 @@ def add_product():
             )
             db.session.add(transaction)
 
+        index_product(product)
         db.session.commit()
         flash('تم إضافة المنتج بنجاح', 'success')
         return redirect(url_for('products'))
 
     return render_template('products/add.html', form=form)
 
+@app.route('/products/import', methods=['GET', 'POST'])
+@login_required
+def import_products_file():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('يرجى اختيار ملف للاستيراد', 'danger')
+            return redirect(url_for('import_products_file'))
+
+        try:
+            result = import_products(read_import_rows(upload.stream, upload.filename), user_id=current_user.id)
+        except ValueError:
+            flash('نوع الملف غير مدعوم، يرجى رفع ملف CSV أو XLSX', 'danger')
+            return redirect(url_for('import_products_file'))
+
+        if wants_json():
+            return jsonify(result.to_dict())
+
+        flash(f'تم استيراد المنتجات: {result.created} منتج جديد، {result.updated} منتج محدث', 'success')
+        if result.error_count:
+            flash(f'تم تجاهل {result.error_count} صف بسبب أخطاء', 'warning')
+        return render_template('products/import.html', result=result, chunk_size=IMPORT_CHUNK_SIZE)
+
+    return render_template('products/import.html', result=None, chunk_size=IMPORT_CHUNK_SIZE)
+
 @app.route('/products/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_product(id):
     product = Product.query.get_or_404(id)
     form = ProductForm(obj=product)
-    form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
-    form.category_id.choices.insert(0, (0, 'بدون تصنيف'))
+    form.category_id.choices = reference_choices('categories', blank='بدون تصنيف')
 
     if request.method == 'GET':
         form.category_id.data = product.category_id if product.category_id else 0
@@ -406,6 +837,7 @@ def edit_product(id):
 
                 product.inventory.quantity = form.initial_quantity.data
 
+        index_product(product)
         db.session.commit()
         flash('تم تحديث المنتج بنجاح', 'success')
         return redirect(url_for('products'))
@@ -416,6 +848,7 @@ def edit_product(id):
 @login_required
 def delete_product(id):
     product = Product.query.get_or_404(id)
+    remove_product_from_index(product.id)
     db.session.delete(product)
     db.session.commit()
     flash('تم حذف المنتج بنجاح', 'success')
@@ -425,8 +858,12 @@ def delete_product(id):
 @app.route('/suppliers')
 @login_required
 def suppliers():
-    suppliers = Supplier.query.all()
-    return render_template('suppliers/index.html', suppliers=suppliers)
+    page = keyset_paginate(Supplier.query, Supplier.created_at, Supplier.id)
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_supplier))
+
+    return render_template('suppliers/index.html', suppliers=page.items, page=page)
 
 @app.route('/suppliers/add', methods=['GET', 'POST'])
 @login_required
@@ -480,8 +917,12 @@ def delete_supplier(id):
 @app.route('/customers')
 @login_required
 def customers():
-    customers = Customer.query.all()
-    return render_template('customers/index.html', customers=customers)
+    page = keyset_paginate(Customer.query, Customer.created_at, Customer.id)
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_customer))
+
+    return render_template('customers/index.html', customers=page.items, page=page)
 
 @app.route('/customers/add', methods=['GET', 'POST'])
 @login_required
@@ -533,22 +974,36 @@ def delete_customer(id):
 @app.route('/purchases')
 @login_required
 def purchases():
-    purchases = Purchase.query.order_by(Purchase.created_at.desc()).all()
-    return render_template('purchases/index.html', purchases=purchases)
+    query = Purchase.query.options(joinedload(Purchase.supplier))
+    page = keyset_paginate(query, Purchase.created_at, Purchase.id)
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_purchase))
+
+    return render_template('purchases/index.html', purchases=page.items, page=page)
 
 @app.route('/purchases/add', methods=['GET', 'POST'])
 @login_required
 def add_purchase():
     from forms import PurchaseForm
     form = PurchaseForm()
-    form.supplier_id.choices = [(s.id, s.name) for s in Supplier.query.all()]
-
-    # Get all products for the dropdown
-    products = Product.query.all()
+    form.supplier_id.choices = reference_choices('suppliers')
 
     if request.method == 'POST':
         # Process the form submission
         if form.validate_on_submit():
+            # Products are picked by typeahead, so check the submitted IDs exist
+            product_ids = set()
+            items_count = 0
+            while f'items-{items_count}-product_id' in request.form:
+                product_id = request.form.get(f'items-{items_count}-product_id', type=int)
+                if product_id:
+                    product_ids.add(product_id)
+                items_count += 1
+            if product_ids - existing_ids(Product, product_ids):
+                flash('أحد المنتجات المختارة غير موجود', 'danger')
+                return render_template('purchases/add.html', form=form)
+
             # Create new purchase - remove user_id parameter
             purchase = Purchase(
                 invoice_number=form.invoice_number.data,
@@ -563,9 +1018,10 @@ def add_purchase():
             db.session.flush()  # Get the purchase ID
 
             # Process purchase items
+            received = {}
             items_count = 0
             while f'items-{items_count}-product_id' in request.form:
-                product_id = request.form.get(f'items-{items_count}-product_id')
+                product_id = request.form.get(f'items-{items_count}-product_id', type=int)
                 quantity = int(request.form.get(f'items-{items_count}-quantity', 0))
                 price = float(request.form.get(f'items-{items_count}-price', 0))
 
@@ -575,37 +1031,35 @@ def add_purchase():
                         purchase_id=purchase.id,
                         product_id=product_id,
                         quantity=quantity,
-                        price=price,
-                        total=quantity * price
+                        price=price
                     )
                     db.session.add(item)
-
-                    # Update inventory
-                    inventory = Inventory.query.filter_by(product_id=product_id).first()
-                    if inventory:
-                        old_quantity = inventory.quantity
-                        inventory.quantity += quantity
-
-                        # Create inventory transaction
-                        transaction = InventoryTransaction(
-                            product_id=product_id,
-                            quantity_before=old_quantity,
-                            quantity_change=quantity,
-                            quantity_after=old_quantity + quantity,
-                            transaction_type='purchase',
-                            reference_type='purchase',
-                            reference_id=purchase.id,
-                            user_id=current_user.id
-                        )
-                        db.session.add(transaction)
+                    received[product_id] = received.get(product_id, 0) + quantity
 
                 items_count += 1
 
+            # Update inventory with atomic increments, so a sale committed at
+            # the same time is never overwritten by a stale quantity
+            stock = increment_stock(received)
+            for product_id, quantity in received.items():
+                quantity_after = stock[product_id].quantity
+                transaction = InventoryTransaction(
+                    product_id=product_id,
+                    quantity_before=quantity_after - quantity,
+                    quantity_change=quantity,
+                    quantity_after=quantity_after,
+                    transaction_type='purchase',
+                    reference_type='purchase',
+                    reference_id=purchase.id,
+                    user_id=current_user.id
+                )
+                db.session.add(transaction)
+
             db.session.commit()
             flash('تم إضافة فاتورة الشراء بنجاح', 'success')
             return redirect(url_for('purchases'))
 
-    return render_template('purchases/add.html', form=form, products=products)
+    return render_template('purchases/add.html', form=form)
 
 @app.route('/purchases/view/<int:id>')
 @login_required
@@ -617,14 +1071,192 @@ def view_purchase(id):
 @app.route('/sales')
 @login_required
 def sales():
-    sales = Sale.query.order_by(Sale.created_at.desc()).all()
-    return render_template('sales/index.html', sales=sales)
+    query = Sale.query.options(joinedload(Sale.customer))
+    page = keyset_paginate(query, Sale.created_at, Sale.id)
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_sale))
+
+    return render_template('sales/index.html', sales=page.items, page=page)
 
 @app.route('/sales/add', methods=['GET', 'POST'])
 @login_required
 def add_sale():
-    # This is a placeholder - you'll need to implement the form and logic
-    return render_template('sales/add.html')
+    form = SaleForm()
+
+    if request.method == 'POST':
+        if not form.validate_on_submit():
+            for errors in form.errors.values():
+                flash(errors[0], 'danger')
+            return render_template('sales/add.html', form=form)
+
+        # Parse the invoice lines
+        product_ids = request.form.getlist('product_id[]')
+        quantities = request.form.getlist('quantity[]')
+        unit_prices = request.form.getlist('unit_price[]')
+
+        try:
+            lines = [
+                (int(product_ids[i]), int(quantities[i]), float(unit_prices[i]))
+                for i in range(len(product_ids))
+            ]
+        except (IndexError, ValueError):
+            flash('بيانات عناصر الفاتورة غير صحيحة', 'danger')
+            return render_template('sales/add.html', form=form)
+
+        if any(quantity <= 0 or not 0 <= unit_price < float('inf') for _, quantity, unit_price in lines):
+            flash('يجب أن تكون الكميات أكبر من صفر والأسعار غير سالبة', 'danger')
+            return render_template('sales/add.html', form=form)
+
+        if not lines:
+            flash('يجب إضافة منتج واحد على الأقل إلى الفاتورة', 'danger')
+            return render_template('sales/add.html', form=form)
+
+        # Total quantity per product (a product may appear on several lines)
+        requested = {}
+        for product_id, quantity, _ in lines:
+            requested[product_id] = requested.get(product_id, 0) + quantity
+
+        # Load the stock for every product on the invoice in one query
+        stock = load_stock_levels(requested.keys())
+
+        inventory_error = False
+        for product_id, quantity in requested.items():
+            row = stock.get(product_id)
+            if not row or row.inventory_id is None or row.quantity < quantity:
+                inventory_error = True
+                name = row.name if row else product_id
+                flash(f'المنتج غير متوفر بالكمية المطلوبة: {name}', 'danger')
+
+        if inventory_error:
+            return render_template('sales/add.html', form=form)
+
+        sale = Sale(
+            customer_id=form.customer_id.data,
+            invoice_number=form.invoice_number.data,
+            sale_date=form.sale_date.data,
+            payment_method=form.payment_method.data,
+            notes=form.notes.data,
+            status='completed'
+        )
+        db.session.add(sale)
+        db.session.flush()  # Get the sale ID
+
+        # Conditional atomic decrement, so concurrent sales cannot oversell
+        try:
+            decrement_stock(requested)
+        except InsufficientStockError:
+            db.session.rollback()
+            flash('تغيرت كمية المخزون أثناء حفظ الفاتورة، يرجى المحاولة مرة أخرى', 'danger')
+            return render_template('sales/add.html', form=form)
+
+        total_amount = sum(quantity * unit_price for _, quantity, unit_price in lines)
+        items_sold = sum(requested.values())
+        # The unit cost is stored with the item so profit stays right after the purchase price changes
+        unit_costs = {product_id: stock[product_id].purchase_price or 0 for product_id in requested}
+        total_cost = sum(quantity * unit_costs[product_id] for product_id, quantity in requested.items())
+
+        db.session.execute(insert(SaleItem), [{
+            'sale_id': sale.id,
+            'product_id': product_id,
+            'quantity': quantity,
+            'price': unit_price,
+            'cost': unit_costs[product_id]
+        } for product_id, quantity, unit_price in lines])
+
+        db.session.execute(insert(InventoryMovement), [{
+            'inventory_id': stock[product_id].inventory_id,
+            'movement_type': 'out',
+            'quantity': quantity,
+            'reference': f'INV-{sale.id}',
+            'notes': f'بيع - فاتورة رقم {sale.invoice_number}'
+        } for product_id, quantity, _ in lines])
+
+        sale.total_amount = total_amount
+
+        # Keep the daily summaries current in the same transaction
+        apply_sale_to_summary(sale.sale_date, total_amount, items_sold, total_cost)
+        apply_sale_items_to_product_sales(sale.sale_date, [
+            (product_id, quantity, quantity * unit_price, quantity * unit_costs[product_id])
+            for product_id, quantity, unit_price in lines
+        ])
+
+        log_activity(current_user.id, 'create', f'إنشاء فاتورة بيع جديدة رقم: {sale.invoice_number}', session=db.session)
+
+        db.session.commit()
+        flash('تم إنشاء فاتورة البيع بنجاح!', 'success')
+        return redirect(url_for('sales'))
+
+    return render_template('sales/add.html', form=form)
+
+@app.route('/sales/cancel/<int:id>', methods=['POST'])
+@login_required
+def cancel_sale(id):
+    sale = Sale.query.options(joinedload(Sale.items)).get_or_404(id)
+
+    # Claim the cancellation with a conditional update, so a sale cancelled
+    # twice at the same time only returns its stock once
+    claimed = db.session.execute(
+        update(Sale.__table__).where(
+            Sale.id == id,
+            Sale.status != 'cancelled'
+        ).values(status='cancelled')
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        flash('تم إلغاء هذه الفاتورة بالفعل!', 'warning')
+        return redirect(url_for('sales'))
+
+    # Take the sale off the daily summaries at the unit cost stored when it was sold
+    apply_sale_to_summary(
+        sale.sale_date,
+        -sale.total_amount,
+        -sum(item.quantity for item in sale.items),
+        -sum(item.quantity * (item.cost or 0) for item in sale.items),
+        sales_count=-1
+    )
+    apply_sale_items_to_product_sales(sale.sale_date, [
+        (item.product_id, item.quantity, item.quantity * item.price, item.quantity * (item.cost or 0))
+        for item in sale.items
+    ], sign=-1)
+
+    # Return the stock with atomic increments
+    returned = {}
+    for item in sale.items:
+        returned[item.product_id] = returned.get(item.product_id, 0) + item.quantity
+    stock = increment_stock(returned)
+
+    movements = [{
+        'inventory_id': stock[item.product_id].inventory_id,
+        'movement_type': 'in',
+        'quantity': item.quantity,
+        'reference': f'INV-CANCEL-{sale.id}',
+        'notes': f'إلغاء فاتورة بيع رقم {sale.invoice_number}'
+    } for item in sale.items if item.product_id in stock]
+    if movements:
+        db.session.execute(insert(InventoryMovement), movements)
+
+    log_activity(current_user.id, 'update', f'إلغاء فاتورة بيع رقم: {sale.invoice_number}', session=db.session)
+
+    db.session.commit()
+    flash('تم إلغاء الفاتورة وإعادة المنتجات للمخزون بنجاح!', 'success')
+    return redirect(url_for('sales'))
+
+@app.route('/api/sales/batch', methods=['POST'])
+@login_required
+def api_sales_batch():
+    data = request.get_json(silent=True) or {}
+    sales = data.get('sales') if isinstance(data, dict) else None
+    if not isinstance(sales, list):
+        return jsonify({'error': 'sales must be a list of sale objects'}), 400
+    if len(sales) > MAX_BATCH_SALES:
+        return jsonify({'error': f'At most {MAX_BATCH_SALES} sales can be uploaded at once'}), 413
+
+    results = upload_sales(sales, user_id=current_user.id)
+    counts = {status: 0 for status in ('created', 'duplicate', 'rejected', 'retry')}
+    for result in results:
+        counts[result['status']] += 1
+    return jsonify(dict(counts, results=results))
 
 @app.route('/sales/view/<int:id>')
 @login_required
@@ -642,18 +1274,19 @@ def inventory():
         Inventory, Product.id == Inventory.product_id
     )
 
-    if status == 'low':
-        query = query.filter(Inventory.quantity <= Product.min_quantity, Inventory.quantity > 0)
-    elif status == 'out':
-        query = query.filter(Inventory.quantity <= 0)
+    condition = stock_status_filter(status)
+    if condition is not None:
+        query = query.filter(condition)
 
     inventory_items = query.all()
 
-    total_value = sum(item.quantity * item.product.purchase_price for _, item in inventory_items)
+    # The rows are loaded anyway, so their value needs no second query
+    total_value = sum(inventory.quantity * (product.purchase_price or 0) for product, inventory in inventory_items)
 
     return render_template('inventory/index.html',
                           inventory=inventory_items,
                           total_value=total_value,
+                          low_stock_count=count_low_stock(),
                           status=status)
 
 @app.route('/inventory/adjustment', methods=['GET', 'POST'])
@@ -662,18 +1295,156 @@ def inventory_adjustment():
     # This is a placeholder - you'll need to implement the form and logic
     return render_template('inventory/adjustment.html')
 
+@app.route('/inventory/stocktakes', methods=['GET', 'POST'])
+@login_required
+def stocktakes():
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip() or f'جرد {datetime.now().strftime("%Y-%m-%d")}'
+        category_id = request.form.get('category_id', type=int) or None
+        stocktake = open_stocktake(name, user_id=current_user.id, category_id=category_id,
+                                   notes=request.form.get('notes'))
+        flash('تم بدء جلسة الجرد وحفظ لقطة من المخزون الحالي', 'success')
+        return redirect(url_for('view_stocktake', id=stocktake.id))
+
+    sessions = Stocktake.query.order_by(Stocktake.started_at.desc()).all()
+    return render_template('inventory/stocktakes.html', stocktakes=sessions, categories=get_reference_list('categories'))
+
+@app.route('/inventory/stocktakes/<int:id>', methods=['GET', 'POST'])
+@login_required
+def view_stocktake(id):
+    stocktake = Stocktake.query.get_or_404(id)
+
+    if request.method == 'POST':
+        try:
+            recorded, unknown = record_counts(stocktake, parse_scans(request.form.get('scans')),
+                                              replace=bool(request.form.get('replace')))
+        except ValueError:
+            flash('صيغة الكميات غير صحيحة، استخدم سطراً لكل منتج: الباركود,الكمية', 'danger')
+            return redirect(url_for('view_stocktake', id=id))
+        except StocktakeError:
+            flash('جلسة الجرد مغلقة', 'danger')
+            return redirect(url_for('view_stocktake', id=id))
+
+        flash(f'تم تسجيل جرد {recorded} منتج', 'success')
+        if unknown:
+            flash(f"رموز غير معروفة: {', '.join(unknown[:20])}", 'warning')
+        return redirect(url_for('view_stocktake', id=id))
+
+    return render_template('inventory/stocktake.html',
+                          stocktake=stocktake,
+                          summary=get_stocktake_summary(stocktake),
+                          variances=get_variances(stocktake, limit=500))
+
+@app.route('/api/stocktakes/<int:id>/counts', methods=['POST'])
+@login_required
+def api_stocktake_counts(id):
+    stocktake = Stocktake.query.get_or_404(id)
+    data = request.get_json(silent=True) or {}
+    counts = data.get('counts', []) if isinstance(data, dict) else None
+    if not isinstance(counts, list) or not all(isinstance(item, dict) and 'barcode' in item for item in counts):
+        return jsonify({'error': 'counts must be a list of {barcode, quantity} objects'}), 400
+
+    try:
+        counts = [(item['barcode'], item.get('quantity', 1)) for item in counts]
+        recorded, unknown = record_counts(stocktake, counts, replace=bool(data.get('replace')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except StocktakeError as e:
+        return jsonify({'error': str(e)}), 409
+
+    return jsonify({
+        'recorded': recorded,
+        'unknown': unknown,
+        'summary': get_stocktake_summary(stocktake)
+    })
+
+@app.route('/inventory/stocktakes/<int:id>/post', methods=['POST'])
+@login_required
+def post_stocktake_route(id):
+    if current_user.role != 'admin':
+        flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'danger')
+        return redirect(url_for('index'))
+
+    stocktake = Stocktake.query.get_or_404(id)
+    try:
+        adjusted = post_stocktake(stocktake, user_id=current_user.id)
+    except StocktakeError:
+        flash('جلسة الجرد مغلقة', 'danger')
+        return redirect(url_for('view_stocktake', id=id))
+
+    flash(f'تم ترحيل الجرد وتعديل مخزون {adjusted} منتج', 'success')
+    return redirect(url_for('view_stocktake', id=id))
+
+@app.route('/inventory/stocktakes/<int:id>/cancel', methods=['POST'])
+@login_required
+def cancel_stocktake_route(id):
+    if current_user.role != 'admin':
+        flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'danger')
+        return redirect(url_for('index'))
+
+    stocktake = Stocktake.query.get_or_404(id)
+    try:
+        cancel_stocktake(stocktake)
+    except StocktakeError:
+        flash('جلسة الجرد مغلقة', 'danger')
+        return redirect(url_for('view_stocktake', id=id))
+
+    flash('تم إلغاء جلسة الجرد دون تعديل المخزون', 'info')
+    return redirect(url_for('stocktakes'))
+
 @app.route('/product/transactions/<int:id>')
 @login_required
 def product_transactions(id):
     product = Product.query.get_or_404(id)
-    transactions = InventoryTransaction.query.filter_by(product_id=id).order_by(InventoryTransaction.created_at.desc()).all()
-    return render_template('inventory/transactions.html', product=product, transactions=transactions)
+    query = InventoryTransaction.query.filter_by(product_id=id)
 
-# Reports routes
-@app.route('/reports')
+    transaction_type = request.args.get('type')
+    if transaction_type:
+        query = query.filter(InventoryTransaction.transaction_type == transaction_type)
+    user_id = request.args.get('user_id', type=int)
+    if user_id:
+        query = query.filter(InventoryTransaction.user_id == user_id)
+    query = query.filter(*date_range_conditions(InventoryTransaction.timestamp))
+
+    page = keyset_paginate(query, InventoryTransaction.timestamp, InventoryTransaction.id)
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_transaction))
+
+    return render_template('inventory/transactions.html', product=product, transactions=page.items, page=page)
+
+@app.route('/inventory/movements')
 @login_required
-def reports():
-    return render_template('reports/index.html')
+def inventory_movements():
+    query = db.session.query(
+        InventoryMovement, Inventory, Product
+    ).join(
+        Inventory, InventoryMovement.inventory_id == Inventory.id
+    ).join(
+        Product, Inventory.product_id == Product.id
+    )
+
+    # Filter on inventory_id so the (inventory_id, timestamp) index is used
+    product_id = request.args.get('product_id', type=int)
+    if product_id:
+        inventory_id = db.session.query(Inventory.id).filter_by(product_id=product_id).scalar()
+        query = query.filter(InventoryMovement.inventory_id == inventory_id)
+
+    movement_type = request.args.get('type')
+    if movement_type in ('in', 'out'):
+        query = query.filter(InventoryMovement.movement_type == movement_type)
+
+    query = query.filter(*date_range_conditions(InventoryMovement.timestamp))
+
+    page = keyset_paginate(
+        query, InventoryMovement.timestamp, InventoryMovement.id,
+        row_key=lambda row: (row[0].timestamp, row[0].id)
+    )
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_movement))
+
+    return render_template('inventory/movements.html', movements=page.items, page=page)
 
 @app.route('/reports/sales')
 @login_required
@@ -726,11 +1497,126 @@ def inventory_report():
         Inventory, Product.id == Inventory.product_id
     ).all()
 
-    total_value = sum(item.quantity * item.product.purchase_price for _, item in inventory_items)
+    summary = get_inventory_summary()
 
     return render_template('reports/inventory.html',
                           inventory=inventory_items,
-                          total_value=total_value)
+                          total_value=summary['total_value'],
+                          summary=summary,
+                          category_values=get_category_values())
+
+def report_date(name):
+    """Read an optional YYYY-MM-DD report date from the query string, 400 if malformed"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        abort(400)
+
+def render_product_profit(title, rows, start_date, end_date):
+    """Render (or return as JSON) per-product rows from get_product_profit"""
+    total_sales = sum(row['revenue'] for row in rows)
+    total_cost = sum(row['cost'] for row in rows)
+    totals = {
+        'total_sales': total_sales,
+        'total_cost': total_cost,
+        'total_profit': total_sales - total_cost
+    }
+
+    if wants_json():
+        return jsonify(dict(totals, items=rows))
+
+    return render_template('reports/profit.html',
+                          title=title,
+                          rows=rows,
+                          start_date=start_date,
+                          end_date=end_date,
+                          **totals)
+
+@app.route('/reports/profit')
+@login_required
+def profit_report():
+    start_date = report_date('start_date')
+    end_date = report_date('end_date')
+
+    # One grouped query over product_daily_sales, at the cost stored with each sale item
+    rows = get_product_profit(start_date, end_date)
+    return render_product_profit('تقرير الأرباح', rows, start_date, end_date)
+
+@app.route('/reports/top-selling')
+@login_required
+def top_selling_report():
+    start_date = report_date('start_date')
+    end_date = report_date('end_date')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    rows = get_product_profit(start_date, end_date, limit=limit, order_by='quantity')
+    return render_product_profit('المنتجات الأكثر مبيعاً', rows, start_date, end_date)
+
+@app.route('/reports/customers')
+@login_required
+def customers_report():
+    start_date = report_date('start_date')
+    end_date = report_date('end_date')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    sales_total = db.func.sum(Sale.total_amount)
+    query = db.session.query(
+        Customer.id,
+        Customer.name,
+        Customer.phone,
+        db.func.count(Sale.id).label('sales_count'),
+        sales_total.label('total')
+    ).join(
+        Sale, Sale.customer_id == Customer.id
+    ).filter(Sale.status == 'completed')
+    if start_date:
+        query = query.filter(Sale.sale_date >= start_date)
+    if end_date:
+        query = query.filter(Sale.sale_date <= end_date)
+
+    customers = [row._asdict() for row in query.group_by(Customer.id).order_by(sales_total.desc(), Customer.id).limit(limit)]
+
+    if wants_json():
+        return jsonify({'items': customers})
+
+    return render_template('reports/customers.html',
+                          customers=customers,
+                          start_date=start_date,
+                          end_date=end_date)
+
+@app.route('/api/inventory/summary')
+@login_required
+def api_inventory_summary():
+    dead_stock_days = request.args.get('dead_stock_days', type=int) or DEAD_STOCK_DAYS
+    return jsonify({
+        'summary': get_inventory_summary(dead_stock_days),
+        'categories': get_category_values()
+    })
+
+@app.route('/api/low-stock')
+@login_required
+def api_low_stock():
+    # Without since the whole current set, with it only the changes after that version
+    since = request.args.get('since', type=int)
+    version, changed_at = get_low_stock_last_change()
+    return conditional_response(f'low-stock-{version}', changed_at, lambda: build_low_stock(since))
+
+def build_low_stock(since):
+    version, changes = get_low_stock_changes(since)
+    return jsonify({
+        'version': version,
+        'since': since,
+        'items': [{
+            'id': item['product_id'],
+            'name': item['name'],
+            'quantity': item['quantity'],
+            'min_quantity': item['min_quantity'],
+            'low': item['low']
+        } for item in changes]
+    })
 
 # Users routes
 @app.route('/users')
@@ -744,6 +1630,39 @@ def users():
     users = User.query.all()
     return render_template('users/index.html', users=users)
 
+@app.route('/activities')
+@login_required
+def activities():
+    if current_user.role != 'admin':
+        flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'danger')
+        return redirect(url_for('index'))
+
+    query = db.session.query(
+        UserActivity, User
+    ).outerjoin(
+        User, UserActivity.user_id == User.id
+    )
+
+    user_id = request.args.get('user_id', type=int)
+    if user_id:
+        query = query.filter(UserActivity.user_id == user_id)
+
+    activity_type = request.args.get('type')
+    if activity_type:
+        query = query.filter(UserActivity.activity_type == activity_type)
+
+    query = query.filter(*date_range_conditions(UserActivity.timestamp))
+
+    page = keyset_paginate(
+        query, UserActivity.timestamp, UserActivity.id,
+        row_key=lambda row: (row[0].timestamp, row[0].id)
+    )
+
+    if wants_json():
+        return jsonify(page.to_dict(serialize_activity))
+
+    return render_template('activities/index.html', activities=page.items, page=page, users=User.query.all())
+
 @app.route('/users/add', methods=['GET', 'POST'])
 @login_required
 def add_user():
@@ -829,6 +1748,34 @@ def toggle_user(id):
     flash(f'تم {status} المستخدم بنجاح', 'success')
     return redirect(url_for('users'))
 
+# SQL profile routes
+@app.route('/admin/sql-profile', methods=['GET', 'POST'])
+@login_required
+def sql_profile():
+    # Only admin users should be able to see the SQL profile
+    if current_user.role != 'admin':
+        flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'danger')
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        reset_route_stats()
+        flash('تم مسح إحصائيات الاستعلامات', 'success')
+        return redirect(url_for('sql_profile'))
+
+    sort_by = request.args.get('sort', 'max_queries')
+    if sort_by not in ('max_queries', 'avg_queries', 'max_time', 'avg_time', 'n_plus_one_requests'):
+        sort_by = 'max_queries'
+
+    stats = get_route_stats(sort_by)
+    if wants_json():
+        return jsonify({'enabled': app.config['SQL_PROFILER_ENABLED'], 'routes': stats})
+
+    return render_template('admin/sql_profile.html',
+                          stats=stats,
+                          sort_by=sort_by,
+                          enabled=app.config['SQL_PROFILER_ENABLED'],
+                          threshold=app.config['SQL_PROFILER_REPEAT_THRESHOLD'])
+
 # Settings routes
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -838,64 +1785,35 @@ def settings():
         flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'danger')
         return redirect(url_for('index'))
 
-    # Get or create settings
-    store_name = Setting.query.filter_by(key='store_name').first()
-    if not store_name:
-        store_name = Setting(key='store_name', value='نظام إدارة المخزن')
-        db.session.add(store_name)
-
-    store_address = Setting.query.filter_by(key='store_address').first()
-    if not store_address:
-        store_address = Setting(key='store_address', value='')
-        db.session.add(store_address)
-
-    store_phone = Setting.query.filter_by(key='store_phone').first()
-    if not store_phone:
-        store_phone = Setting(key='store_phone', value='')
-        db.session.add(store_phone)
-
-    store_email = Setting.query.filter_by(key='store_email').first()
-    if not store_email:
-        store_email = Setting(key='store_email', value='')
-        db.session.add(store_email)
-
-    tax_rate = Setting.query.filter_by(key='tax_rate').first()
-    if not tax_rate:
-        tax_rate = Setting(key='tax_rate', value='0')
-        db.session.add(tax_rate)
-
-    currency = Setting.query.filter_by(key='currency').first()
-    if not currency:
-        currency = Setting(key='currency', value='ر.س')
-        db.session.add(currency)
-
-    db.session.commit()
-
     if request.method == 'POST':
-        store_name.value = request.form.get('store_name', '')
-        store_address.value = request.form.get('store_address', '')
-        store_phone.value = request.form.get('store_phone', '')
-        store_email.value = request.form.get('store_email', '')
-        tax_rate.value = request.form.get('tax_rate', '0')
-        currency.value = request.form.get('currency', 'ر.س')
+        values = {key: request.form.get(key, '') for key in SETTINGS}
+        try:
+            if not 0 <= float(values['tax_rate'] or 0) <= 100:
+                raise ValueError(values['tax_rate'])
+            update_settings(values)
+        except ValueError:
+            flash('نسبة الضريبة يجب أن تكون رقماً بين 0 و 100', 'danger')
+            return redirect(url_for('settings'))
 
-        db.session.commit()
         flash('تم تحديث الإعدادات بنجاح', 'success')
         return redirect(url_for('settings'))
 
+    current = get_settings()
     return render_template('settings/index.html',
-                          store_name=store_name.value,
-                          store_address=store_address.value,
-                          store_phone=store_phone.value,
-                          store_email=store_email.value,
-                          tax_rate=tax_rate.value,
-                          currency=currency.value)
+                          store_name=current.store_name,
+                          store_address=current.store_address,
+                          store_phone=current.store_phone,
+                          store_email=current.store_email,
+                          tax_rate=current.tax_rate,
+                          currency=current.currency)
 
 # Profile route
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    form = RegisterForm(obj=current_user)
+    # current_user is a cached snapshot; edit the User row itself
+    user = db.session.get(User, current_user.id)
+    form = RegisterForm(obj=user)
 
     # Don't require password on edit
     form.password.validators = []
@@ -908,17 +1826,17 @@ def profile():
         del form.role
 
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.email = form.email.data
-        current_user.full_name = form.full_name.data
+        user.username = form.username.data
+        user.email = form.email.data
+        user.full_name = form.full_name.data
 
         # Only admin can change role
         if current_user.role == 'admin' and hasattr(form, 'role'):
-            current_user.role = form.role.data
+            user.role = form.role.data
 
         # Only update password if provided
         if form.password.data:
-            current_user.set_password(form.password.data)
+            user.set_password(form.password.data)
 
         db.session.commit()
         flash('تم تحديث الملف الشخصي بنجاح', 'success')
@@ -0,0 +1,279 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, UserActivity
+from database import RoutingSession
+
+logger = logging.getLogger('audit')
+
+# Session.info key holding the activity records of the current transaction
+PENDING_KEY = 'audit_pending'
+
+# Defaults for the AUDIT_* config keys
+AUDIT_FLUSH_SIZE = 200
+AUDIT_FLUSH_INTERVAL_MS = 500
+
+_writer = None
+
+
+class AuditWriter:
+    """
+    Write-behind queue for UserActivity rows
+
+    Records are appended to a journal file and buffered in memory. A
+    background thread inserts the buffer with one executemany statement
+    whenever flush_size records are waiting or flush_interval seconds have
+    passed. Before each insert the journal is renamed to a pending file,
+    which is deleted once the rows are committed; pending files left by a
+    crash or a failed insert are replayed, and the unique event_id makes
+    replaying a committed record a no-op. Files of dead processes are
+    claimed by renaming them to a name of this process, so when several
+    workers start together each file is replayed by one of them.
+    """
+
+    def __init__(self, engine, journal_dir, flush_size=AUDIT_FLUSH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL_MS / 1000, fsync=False):
+        self.engine = engine
+        self.journal_dir = journal_dir
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._sequence = 0
+        self._run_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._journal_path = os.path.join(journal_dir, f'journal-{self._run_id}.jsonl')
+        self._journal = None
+        self._thread = None
+
+        os.makedirs(journal_dir, exist_ok=True)
+        # Files of dead processes (including an earlier run with our PID)
+        self._pending = []
+        for path in sorted(glob.glob(os.path.join(journal_dir, '*.jsonl'))):
+            if not _owned_by_live_process(path):
+                self._claim(path)
+
+    def _next_pending_path(self):
+        self._sequence += 1
+        return os.path.join(self.journal_dir, f'pending-{self._run_id}-{self._sequence:06d}.jsonl')
+
+    def _claim(self, path):
+        """Take over a file of a dead process, unless another worker did first"""
+        claimed = self._next_pending_path()
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return
+        self._pending.append(claimed)
+
+    def start(self):
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, records):
+        """Journal records and queue them for the next flush"""
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with self._condition:
+            self._journal.write(lines)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._buffer.extend(records)
+            if len(self._buffer) >= self.flush_size:
+                self._condition.notify()
+
+    def flush(self):
+        """Insert the buffered records and every pending journal file"""
+        with self._flush_lock:
+            with self._condition:
+                if self._buffer:
+                    self._buffer = []
+                    self._journal.close()
+                    pending = self._next_pending_path()
+                    os.replace(self._journal_path, pending)
+                    self._pending.append(pending)
+                    self._journal = open(self._journal_path, 'a', encoding='utf-8')
+
+            while self._pending:
+                path = self._pending[0]
+                try:
+                    _insert_records(self.engine, _read_journal(path))
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Already replayed and removed
+                    pass
+                except Exception:
+                    # Keep the file; it is retried on the next flush
+                    logger.exception('Could not write audit records from %s', path)
+                    return
+                self._pending.pop(0)
+
+    def close(self):
+        """Stop the background thread and write everything still queued"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._condition:
+            self._journal.close()
+            if os.path.exists(self._journal_path) and not os.path.getsize(self._journal_path):
+                os.remove(self._journal_path)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopping and len(self._buffer) < self.flush_size:
+                    self._condition.wait(self.flush_interval)
+                stopping = self._stopping
+            if stopping:
+                return
+            if self._buffer or self._pending:
+                self.flush()
+
+
+def _owned_by_live_process(path):
+    """Whether a journal file belongs to another running process"""
+    try:
+        pid = int(os.path.basename(path).split('-')[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _read_journal(path):
+    """Read the records of a journal file, skipping a torn last line"""
+    records = []
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning('Skipping a damaged audit record in %s', path)
+    return records
+
+def _insert_records(engine, records):
+    """Insert activity records, ignoring ones already written"""
+    if not records:
+        return
+    table = UserActivity.__table__
+    statement = sqlite_insert(table).on_conflict_do_nothing(index_elements=[table.c.event_id])
+    with engine.begin() as connection:
+        connection.execute(statement, [
+            dict(record, timestamp=datetime.fromisoformat(record['timestamp']))
+            for record in records
+        ])
+
+def init_audit(app):
+    """
+    Start the write-behind audit writer
+
+    Configured with AUDIT_WRITE_BEHIND (default True), AUDIT_FLUSH_SIZE,
+    AUDIT_FLUSH_INTERVAL_MS, AUDIT_JOURNAL_DIR (default instance/audit) and
+    AUDIT_JOURNAL_FSYNC (fsync every journal write, default False).
+
+    Args:
+        app (Flask): The application, after db.init_app()
+    """
+    global _writer
+    if not app.config.get('AUDIT_WRITE_BEHIND', True) or _writer is not None:
+        return
+
+    with app.app_context():
+        engine = db.engine
+
+    settings = {
+        'engine': engine,
+        'journal_dir': app.config.get('AUDIT_JOURNAL_DIR') or os.path.join(app.instance_path, 'audit'),
+        'flush_size': app.config.get('AUDIT_FLUSH_SIZE', AUDIT_FLUSH_SIZE),
+        'flush_interval': app.config.get('AUDIT_FLUSH_INTERVAL_MS', AUDIT_FLUSH_INTERVAL_MS) / 1000,
+        'fsync': app.config.get('AUDIT_JOURNAL_FSYNC', False)
+    }
+    _writer = AuditWriter(**settings)
+    _writer.start()
+    atexit.register(_close_writer)
+
+    # The writer thread does not survive a fork (gunicorn --preload), so
+    # every worker starts its own writer with its own journal
+    os.register_at_fork(after_in_child=lambda: _restart_in_child(settings))
+
+def _restart_in_child(settings):
+    global _writer
+    if _writer is None:
+        return
+    # Connections inherited from the parent must not be used by the child
+    settings['engine'].dispose(close=False)
+    _writer = AuditWriter(**settings)
+    _writer.start()
+
+def _close_writer():
+    if _writer is not None:
+        _writer.close()
+
+def flush_audit():
+    """Write every queued activity record now"""
+    if _writer is not None:
+        _writer.flush()
+
+def log_activity(user_id, activity_type, description, session=None):
+    """
+    Record a user activity
+
+    With a session, the record is queued only when that session commits
+    and dropped if it rolls back, so it never describes a change that was
+    not saved. Without the write-behind writer the row is added to the
+    session instead (and committed right away if no session was given).
+
+    Args:
+        user_id (int): The acting user
+        activity_type (str): login, logout, create, update or delete
+        description (str): What was done
+        session (Session): Tie the record to this session's transaction
+    """
+    record = {
+        'event_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'activity_type': activity_type,
+        'description': description,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+    if _writer is None:
+        target = session or db.session
+        target.add(UserActivity(**dict(record, timestamp=datetime.fromisoformat(record['timestamp']))))
+        if session is None:
+            target.commit()
+    elif session is not None:
+        session.info.setdefault(PENDING_KEY, []).append(record)
+    else:
+        _writer.write([record])
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _queue_committed_activities(session):
+    records = session.info.pop(PENDING_KEY, None)
+    if records and _writer is not None:
+        _writer.write(records)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_activities(session):
+    session.info.pop(PENDING_KEY, None)
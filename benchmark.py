@@ -0,0 +1,257 @@
+"""
+Route benchmark suite
+
+Drives the Flask test client against the hot routes and writes latency
+percentiles and query counts to a JSON baseline, e.g.:
+
+    flask --app app seed --products 200000 --sales 1000000
+    python benchmark.py --output benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json
+
+Run it against the same seeded database on every commit so the numbers
+stay comparable. The add_sale route records real sales, so benchmark a
+copy of the database rather than a live one.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, date
+from profiler import get_route_stats, reset_route_stats
+
+DEFAULT_ITERATIONS = 20
+DEFAULT_WARMUP = 2
+
+# (name, method, path) for every benchmarked route. POST bodies are built
+# by sale_form_data() because they depend on the data in the database.
+# Only routes the app registers belong here: an error page is fast and
+# would be stored as the route's baseline.
+ROUTES = [
+    ('dashboard', 'GET', '/'),
+    ('products', 'GET', '/products'),
+    ('add_sale', 'POST', '/sales/add'),
+    ('export_products_csv', 'GET', '/export/products/csv'),
+    ('export_inventory_csv', 'GET', '/export/inventory/csv'),
+    ('export_sales_csv', 'GET', '/export/sales/csv'),
+    ('export_purchases_csv', 'GET', '/export/purchases/csv'),
+    ('api_products', 'GET', '/api/products'),
+    ('api_inventory_summary', 'GET', '/api/inventory/summary'),
+    ('api_low_stock', 'GET', '/api/low-stock'),
+    ('api_sync_products', 'GET', '/api/sync/products'),
+    ('api_products_search', 'GET', '/api/products/search?q=rice'),
+]
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a list of values by linear interpolation
+
+    Args:
+        values (list): The measured values
+        fraction (float): Percentile as a fraction (0.95 for p95)
+
+    Returns:
+        float: The percentile value
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def git_revision():
+    """Get the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def dataset_size(db, models):
+    """Count the rows of the benchmarked tables"""
+    return {model.__tablename__: db.session.query(model).count() for model in models}
+
+def sale_form_data(db, Product, Inventory):
+    """Build an add-sale form for the product with the most stock"""
+    row = db.session.query(Product.id, Product.sale_price).join(
+        Inventory, Inventory.product_id == Product.id
+    ).order_by(Inventory.quantity.desc()).first()
+    if row is None:
+        return None
+    return {
+        'invoice_number': f'BENCH-{int(time.time() * 1000)}',
+        'sale_date': date.today().strftime('%Y-%m-%d'),
+        'customer_id': '',
+        'payment_method': 'cash',
+        'notes': 'benchmark',
+        'product_id[]': [str(row.id)],
+        'quantity[]': ['1'],
+        'unit_price[]': [str(row.sale_price)]
+    }
+
+def measure(client, method, path, iterations, warmup, form_data=None):
+    """
+    Time repeated requests to one route
+
+    Streamed responses are read to the end so the whole export is measured.
+
+    Returns:
+        dict: Latency percentiles (ms), query counts and status codes
+    """
+    latencies = []
+    queries = []
+    statuses = set()
+
+    for run in range(warmup + iterations):
+        data = form_data() if form_data else None
+        reset_route_stats()
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        body_size = len(response.get_data())
+        elapsed = (time.perf_counter() - started) * 1000
+
+        if run < warmup:
+            continue
+        latencies.append(elapsed)
+        statuses.add(response.status_code)
+        # The route stats hold only this request; they are recorded when
+        # the request ends, after a streamed body was read
+        stats = get_route_stats()
+        if stats:
+            queries.append(stats[0]['total_queries'])
+
+    return {
+        'method': method,
+        'path': path,
+        'iterations': iterations,
+        'status': sorted(statuses),
+        'bytes': body_size,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p90_ms': round(percentile(latencies, 0.90), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries': int(statistics.median(queries)) if queries else None
+    }
+
+def is_success(status, method):
+    """Whether a response status means the route did its work (a POST may redirect)"""
+    return 200 <= status < 300 or (method == 'POST' and status in (302, 303))
+
+def run_benchmarks(iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, only=None):
+    """
+    Benchmark every route in ROUTES
+
+    Routes that answer with an error status are left out of the report's
+    routes and listed under failed_routes instead, so an error page is
+    never stored as a baseline.
+
+    Args:
+        iterations (int): Measured requests per route
+        warmup (int): Unmeasured requests per route before measuring
+        only (list): Route names to run (default: all)
+
+    Returns:
+        dict: The benchmark report
+    """
+    # Query counts come from the SQL profiler, streamed bodies included
+    os.environ['SQL_PROFILER_ENABLED'] = '1'
+    from app import app
+    from models import db, User, Product, Inventory, Customer, Supplier, Sale, SaleItem, Purchase, PurchaseItem
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        admin = User.query.filter_by(role='admin', is_active=True).first()
+        if admin is None:
+            raise SystemExit('No active admin user; run the app once (or flask seed) first')
+
+        report = {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'database': app.config['SQLALCHEMY_DATABASE_URI'],
+            'iterations': iterations,
+            'warmup': warmup,
+            'dataset': dataset_size(db, [Product, Inventory, Customer, Supplier, Sale, SaleItem, Purchase, PurchaseItem]),
+            'routes': {},
+            'failed_routes': {}
+        }
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin.id)
+            session['_fresh'] = True
+
+        for name, method, path in ROUTES:
+            if only and name not in only:
+                continue
+            form_data = (lambda: sale_form_data(db, Product, Inventory)) if method == 'POST' else None
+            result = measure(client, method, path, iterations, warmup, form_data)
+            if not all(is_success(status, method) for status in result['status']):
+                report['failed_routes'][name] = result['status']
+                print(f"{name:24} FAILED with status {result['status']}; not recorded")
+                continue
+            report['routes'][name] = result
+            print(f"{name:24} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                  f"queries {result['queries']}  status {result['status']}")
+
+    return report
+
+def compare(report, baseline):
+    """Print the p50/p95 and query count changes against a baseline report"""
+    print(f"\nCompared with {baseline.get('git_revision') or 'baseline'} ({baseline.get('created_at')}):")
+    # add_sale grows the sales tables a little on every run; only warn about real differences
+    previous_dataset = baseline.get('dataset', {})
+    for table, count in report['dataset'].items():
+        previous_count = previous_dataset.get(table, 0)
+        if abs(count - previous_count) > max(100, previous_count * 0.01):
+            print(f'  warning: {table} has {count} rows, the baseline had {previous_count}; results are not comparable')
+
+    for name, result in report['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms'):
+            if previous[key]:
+                changes.append(f'{key} {(result[key] - previous[key]) / previous[key] * 100:+.1f}%')
+        if result['queries'] is not None and previous.get('queries') is not None:
+            changes.append(f"queries {previous['queries']} -> {result['queries']}")
+        print(f"  {name:24} {'  '.join(changes)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot routes')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--only', nargs='*', help='Route names to run')
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.iterations, args.warmup, args.only)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f'\nWrote {args.output}')
+
+    if report['failed_routes']:
+        print(f"\n{len(report['failed_routes'])} routes failed: {', '.join(report['failed_routes'])}")
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
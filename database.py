@@ -0,0 +1,152 @@
+import sqlite3
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.elements import TextClause
+
+# Bind key of the read-only engine
+READ_ONLY_BIND = 'readonly'
+
+# Applied to every new SQLite connection; override any of them with the
+# SQLITE_PRAGMAS config dict
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',          # readers and the writer no longer block each other
+    'synchronous': 'NORMAL',        # safe with WAL, fsync only at checkpoints
+    'cache_size': -64000,           # 64 MB page cache per connection
+    'mmap_size': 268435456,         # 256 MB memory-mapped I/O
+    'temp_store': 'MEMORY',         # sorts and temp b-trees stay in memory
+    'busy_timeout': 15000           # wait up to 15 s for a lock instead of failing
+}
+
+# GET requests under these paths run their queries on the read-only engine
+READ_ONLY_PATH_PREFIXES = ('/reports', '/export', '/api/')
+
+
+class RoutingSession(Session):
+    """
+    Session that sends a request's reads to the read-only engine
+
+    Reads go to the read-only engine only while g.db_read_only is set (see
+    init_database) and the engine exists. Flushes and INSERT/UPDATE/DELETE
+    statements always use the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None
+                and not self._flushing
+                and _is_read(clause)
+                and has_app_context()
+                and g.get('db_read_only')):
+            engine = self._db.engines.get(READ_ONLY_BIND)
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_read(clause):
+    """Whether a statement only reads (text() statements must start with SELECT or WITH)"""
+    if clause is None:
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return not getattr(clause, 'is_dml', False)
+
+def _is_file_sqlite(uri):
+    """Whether a database URI points at an on-disk SQLite database"""
+    return uri.startswith('sqlite:///') and ':memory:' not in uri and uri != 'sqlite://'
+
+def read_only_uri(uri):
+    """
+    Build the URI of a read-only connection to an on-disk SQLite database
+
+    Args:
+        uri (str): The primary database URI, e.g. sqlite:///makhzan.db
+
+    Returns:
+        str: A URI opening the same file with mode=ro
+    """
+    path = uri[len('sqlite:///'):]
+    separator = '&' if '?' in path else '?'
+    return f'sqlite:///file:{path}{separator}mode=ro&uri=true'
+
+def configure_database(app):
+    """
+    Add the read-only bind and SQLite engine options to the app config
+
+    Must be called before db.init_app(app). Does nothing for non-SQLite or
+    in-memory databases, which have no file to share between engines.
+
+    Args:
+        app (Flask): The application
+    """
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    if not uri.startswith('sqlite'):
+        return
+
+    pragmas = dict(SQLITE_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {}))
+    app.config['SQLITE_PRAGMAS'] = pragmas
+
+    # sqlite3's own lock wait, matching busy_timeout
+    engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    engine_options.setdefault('connect_args', {}).setdefault('timeout', pragmas['busy_timeout'] / 1000)
+
+    if _is_file_sqlite(uri) and app.config.get('SQLITE_READ_ONLY_ENGINE', True):
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(READ_ONLY_BIND, {
+            'url': read_only_uri(uri),
+            'connect_args': {'timeout': pragmas['busy_timeout'] / 1000}
+        })
+
+def apply_pragmas(dbapi_connection, pragmas, read_only=False):
+    """
+    Apply PRAGMA settings to a new SQLite connection
+
+    Args:
+        dbapi_connection: The sqlite3 connection
+        pragmas (dict): PRAGMA name -> value
+        read_only (bool): Skip journal_mode (a read-only connection cannot
+            change it) and set query_only
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if read_only and name == 'journal_mode':
+                continue
+            cursor.execute(f'PRAGMA {name}={value}')
+        if read_only:
+            cursor.execute('PRAGMA query_only=1')
+    finally:
+        cursor.close()
+
+def _mark_read_only_request():
+    g.db_read_only = request.method == 'GET' and request.path.startswith(READ_ONLY_PATH_PREFIXES)
+
+def init_database(app, db):
+    """
+    Apply the SQLite pragmas to every engine and route read-only requests
+
+    Must be called after db.init_app(app).
+
+    Args:
+        app (Flask): The application
+        db (SQLAlchemy): The extension instance
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            read_only = bind_key == READ_ONLY_BIND
+            event.listen(
+                engine, 'connect',
+                lambda dbapi_connection, record, read_only=read_only: apply_pragmas(dbapi_connection, pragmas, read_only)
+            )
+
+    app.before_request(_mark_read_only_request)
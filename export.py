@@ -4,6 +4,16 @@ import pandas as pd
 from fpdf import FPDF
 from io import StringIO, BytesIO
 import datetime
+from sqlalchemy import func, select
+from models import db, Category, Product, Inventory, Customer, Sale, SaleItem, Supplier, Purchase, PurchaseItem
+
+# Number of rows fetched per database round trip and encoded per CSV chunk
+STREAM_BATCH_SIZE = 500
+
+PRODUCT_HEADERS = ['ID', 'Name', 'Category', 'Barcode', 'SKU', 'Purchase Price', 'Sale Price', 'Quantity']
+INVENTORY_HEADERS = ['ID', 'Product', 'Category', 'Quantity', 'Last Updated']
+SALES_HEADERS = ['ID', 'Customer', 'Date', 'Total Amount', 'Items Count', 'Status']
+PURCHASES_HEADERS = ['ID', 'Supplier', 'Date', 'Total Amount', 'Items Count', 'Status']
 
 class PDF(FPDF):
     """Custom PDF class with header and footer"""
@@ -108,35 +118,194 @@ def export_to_pdf(data, headers, filename, title="Report"):
     
     return filepath
 
-def generate_product_report(products, format='csv'):
+def stream_csv(headers, rows, chunk_rows=STREAM_BATCH_SIZE):
+    """
+    Encode rows as CSV text chunks without building the whole file
+
+    The header line is yielded on its own so a response can start
+    immediately; after that, every chunk holds up to chunk_rows rows.
+
+    Args:
+        headers (list): List of column headers
+        rows (iterable): Data rows, consumed lazily
+        chunk_rows (int): Number of rows per yielded chunk
+
+    Yields:
+        str: CSV encoded text
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(headers)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    if pending:
+        yield buffer.getvalue()
+
+def product_report_query():
+    """
+    Build the product report query
+
+    Category name and stock quantity are joined in, so the whole report is
+    a single SELECT no matter how many products there are.
+    """
+    return select(
+        Product.id,
+        Product.name,
+        Category.name.label('category_name'),
+        Product.barcode,
+        Product.sku,
+        Product.purchase_price,
+        Product.sale_price,
+        func.coalesce(Inventory.quantity, 0).label('quantity')
+    ).outerjoin(
+        Category, Product.category_id == Category.id
+    ).outerjoin(
+        Inventory, Inventory.product_id == Product.id
+    ).order_by(Product.id)
+
+def inventory_report_query():
+    """Build the inventory report query (one SELECT with product and category joined)"""
+    return select(
+        Inventory.id,
+        Product.name.label('product_name'),
+        Category.name.label('category_name'),
+        Inventory.quantity,
+        Inventory.last_updated
+    ).join(
+        Product, Inventory.product_id == Product.id
+    ).outerjoin(
+        Category, Product.category_id == Category.id
+    ).order_by(Inventory.id)
+
+def sales_report_query():
+    """Build the sales report query, counting items with a correlated subquery"""
+    items_count = select(func.count(SaleItem.id)).where(
+        SaleItem.sale_id == Sale.id
+    ).correlate(Sale).scalar_subquery()
+
+    return select(
+        Sale.id,
+        Customer.name.label('customer_name'),
+        Sale.sale_date,
+        Sale.total_amount,
+        items_count.label('items_count'),
+        Sale.status
+    ).outerjoin(
+        Customer, Sale.customer_id == Customer.id
+    ).order_by(Sale.id)
+
+def purchases_report_query():
+    """Build the purchases report query, counting items with a correlated subquery"""
+    items_count = select(func.count(PurchaseItem.id)).where(
+        PurchaseItem.purchase_id == Purchase.id
+    ).correlate(Purchase).scalar_subquery()
+
+    return select(
+        Purchase.id,
+        Supplier.name.label('supplier_name'),
+        Purchase.purchase_date,
+        Purchase.total_amount,
+        items_count.label('items_count'),
+        Purchase.status
+    ).outerjoin(
+        Supplier, Purchase.supplier_id == Supplier.id
+    ).order_by(Purchase.id)
+
+def product_rows(rows):
+    """Yield product report rows from product_report_query() results"""
+    for row in rows:
+        yield [
+            row.id,
+            row.name,
+            row.category_name or 'N/A',
+            row.barcode or 'N/A',
+            row.sku or 'N/A',
+            row.purchase_price,
+            row.sale_price,
+            row.quantity
+        ]
+
+def inventory_rows(rows):
+    """Yield inventory report rows from inventory_report_query() results"""
+    for row in rows:
+        yield [
+            row.id,
+            row.product_name,
+            row.category_name or 'N/A',
+            row.quantity,
+            row.last_updated.strftime("%Y-%m-%d %H:%M:%S") if row.last_updated else 'N/A'
+        ]
+
+def sales_rows(rows):
+    """Yield sales report rows from sales_report_query() results"""
+    for row in rows:
+        yield [
+            row.id,
+            row.customer_name or 'N/A',
+            row.sale_date.strftime("%Y-%m-%d") if row.sale_date else 'N/A',
+            row.total_amount,
+            row.items_count,
+            row.status
+        ]
+
+def purchases_rows(rows):
+    """Yield purchases report rows from purchases_report_query() results"""
+    for row in rows:
+        yield [
+            row.id,
+            row.supplier_name or 'N/A',
+            row.purchase_date.strftime("%Y-%m-%d") if row.purchase_date else 'N/A',
+            row.total_amount,
+            row.items_count,
+            row.status
+        ]
+
+def stream_rows(query):
+    """Execute a report query, fetching STREAM_BATCH_SIZE rows per round trip"""
+    return db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+def stream_product_report():
+    """Stream the product report as CSV chunks"""
+    return stream_csv(PRODUCT_HEADERS, product_rows(stream_rows(product_report_query())))
+
+def stream_inventory_report():
+    """Stream the inventory report as CSV chunks"""
+    return stream_csv(INVENTORY_HEADERS, inventory_rows(stream_rows(inventory_report_query())))
+
+def stream_sales_report():
+    """Stream the sales report as CSV chunks"""
+    return stream_csv(SALES_HEADERS, sales_rows(stream_rows(sales_report_query())))
+
+def stream_purchases_report():
+    """Stream the purchases report as CSV chunks"""
+    return stream_csv(PURCHASES_HEADERS, purchases_rows(stream_rows(purchases_report_query())))
+
+def generate_product_report(format='csv'):
     """
     Generate a product report in the specified format
     
     Args:
-        products (list): List of Product objects
         format (str): Output format ('csv' or 'pdf')
         
     Returns:
         str: Path to the saved report file
     """
     # Prepare data
-    headers = ['ID', 'Name', 'Category', 'Barcode', 'SKU', 'Purchase Price', 'Sale Price', 'Quantity']
-    data = []
-    
-    for product in products:
-        category_name = product.category.name if product.category else 'N/A'
-        quantity = product.inventory.quantity if product.inventory else 0
-        
-        data.append([
-            product.id,
-            product.name,
-            category_name,
-            product.barcode or 'N/A',
-            product.sku or 'N/A',
-            product.purchase_price,
-            product.sale_price,
-            quantity
-        ])
+    headers = PRODUCT_HEADERS
+    data = list(product_rows(db.session.execute(product_report_query())))
     
     # Generate filename
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
@@ -150,31 +319,19 @@ def generate_product_report(products, format='csv'):
     else:
         raise ValueError(f"Unsupported format: {format}")
 
-def generate_inventory_report(inventory_items, format='csv'):
+def generate_inventory_report(format='csv'):
     """
     Generate an inventory report in the specified format
     
     Args:
-        inventory_items (list): List of Inventory objects
         format (str): Output format ('csv' or 'pdf')
         
     Returns:
         str: Path to the saved report file
     """
     # Prepare data
-    headers = ['ID', 'Product', 'Category', 'Quantity', 'Last Updated']
-    data = []
-    
-    for item in inventory_items:
-        category_name = item.product.category.name if item.product.category else 'N/A'
-        
-        data.append([
-            item.id,
-            item.product.name,
-            category_name,
-            item.quantity,
-            item.updated_at.strftime("%Y-%m-%d %H:%M:%S") if item.updated_at else 'N/A'
-        ])
+    headers = INVENTORY_HEADERS
+    data = list(inventory_rows(db.session.execute(inventory_report_query())))
     
     # Generate filename
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
@@ -188,33 +345,19 @@ def generate_inventory_report(inventory_items, format='csv'):
     else:
         raise ValueError(f"Unsupported format: {format}")
 
-def generate_sales_report(sales, format='csv'):
+def generate_sales_report(format='csv'):
     """
     Generate a sales report in the specified format
     
     Args:
-        sales (list): List of Sale objects
         format (str): Output format ('csv' or 'pdf')
         
     Returns:
         str: Path to the saved report file
     """
     # Prepare data
-    headers = ['ID', 'Customer', 'Date', 'Total Amount', 'Items Count', 'Status']
-    data = []
-    
-    for sale in sales:
-        customer_name = sale.customer.name if sale.customer else 'N/A'
-        items_count = len(sale.items) if sale.items else 0
-        
-        data.append([
-            sale.id,
-            customer_name,
-            sale.date.strftime("%Y-%m-%d") if sale.date else 'N/A',
-            sale.total_amount,
-            items_count,
-            sale.status
-        ])
+    headers = SALES_HEADERS
+    data = list(sales_rows(db.session.execute(sales_report_query())))
     
     # Generate filename
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
@@ -228,33 +371,19 @@ def generate_sales_report(sales, format='csv'):
     else:
         raise ValueError(f"Unsupported format: {format}")
 
-def generate_purchases_report(purchases, format='csv'):
+def generate_purchases_report(format='csv'):
     """
     Generate a purchases report in the specified format
     
     Args:
-        purchases (list): List of Purchase objects
         format (str): Output format ('csv' or 'pdf')
         
     Returns:
         str: Path to the saved report file
     """
     # Prepare data
-    headers = ['ID', 'Supplier', 'Date', 'Total Amount', 'Items Count', 'Status']
-    data = []
-    
-    for purchase in purchases:
-        supplier_name = purchase.supplier.name if purchase.supplier else 'N/A'
-        items_count = len(purchase.items) if purchase.items else 0
-        
-        data.append([
-            purchase.id,
-            supplier_name,
-            purchase.date.strftime("%Y-%m-%d") if purchase.date else 'N/A',
-            purchase.total_amount,
-            items_count,
-            purchase.status
-        ])
+    headers = PURCHASES_HEADERS
+    data = list(purchases_rows(db.session.execute(purchases_report_query())))
     
     # Generate filename
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
@@ -3,6 +3,7 @@ from wtforms import StringField, PasswordField, BooleanField, TextAreaField, Flo
 from wtforms.validators import DataRequired, Email, EqualTo, Optional, Length, NumberRange, ValidationError
 from datetime import datetime
 import re
+from models import db, Customer
 
 def password_check(form, field):
     """
@@ -30,6 +31,18 @@ def password_check(form, field):
     if not re.search(r"[ !#$%&'()*+,-./[\\\]^_`{|}~"+r'"]', password):
         raise ValidationError("كلمة المرور يجب أن تحتوي على حرف خاص واحد على الأقل")
 
+def record_exists(model, message):
+    """
+    Validate that an ID field names an existing row
+
+    Used instead of a SelectField for lists too large to enumerate; the
+    value is picked through a typeahead endpoint.
+    """
+    def _record_exists(form, field):
+        if field.data and db.session.get(model, field.data) is None:
+            raise ValidationError(message)
+    return _record_exists
+
 class LoginForm(FlaskForm):
     username = StringField('اسم المستخدم', validators=[DataRequired()])
     password = PasswordField('كلمة المرور', validators=[DataRequired()])
@@ -86,7 +99,7 @@ class PurchaseForm(FlaskForm):
 
 class SaleForm(FlaskForm):
     invoice_number = StringField('رقم الفاتورة', validators=[DataRequired(), Length(max=50)])
-    customer_id = SelectField('العميل', coerce=int, validators=[Optional()])
+    customer_id = IntegerField('العميل', validators=[Optional(), record_exists(Customer, 'العميل المختار غير موجود')])
     sale_date = DateField('تاريخ البيع', validators=[DataRequired()])
     payment_method = SelectField('طريقة الدفع', choices=[
         ('cash', 'نقدي'),
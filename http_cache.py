@@ -0,0 +1,60 @@
+from datetime import timezone
+from flask import make_response, request
+
+
+def _as_http_date(value):
+    """Drop the microseconds HTTP dates cannot carry and mark a naive UTC time as UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Whether the request's validators show the client has the current version
+
+    If-None-Match wins over If-Modified-Since when both are sent.
+
+    Args:
+        etag (str): The current entity tag, without quotes
+        last_modified (datetime): When the resource last changed (UTC)
+
+    Returns:
+        bool: True if a 304 response should be sent
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    last_modified = _as_http_date(last_modified)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+def conditional_response(etag, last_modified, build):
+    """
+    Answer a GET with 304 Not Modified, or build the full response
+
+    The validators must come from a query much cheaper than the response
+    itself, such as the maximum of an indexed version column; build is only
+    called when the client's copy is out of date.
+
+    Args:
+        etag (str): Strong entity tag of the current version, without quotes
+        last_modified (datetime): When the resource last changed (UTC), or None
+        build (callable): Returns the full response (anything Flask accepts)
+
+    Returns:
+        Response: The 304 or full response, with ETag and Last-Modified set
+    """
+    if is_not_modified(etag, last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _as_http_date(last_modified)
+    # Clients may keep the response but must revalidate it on every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,231 @@
+import re
+from sqlalchemy import event
+
+# Small lookup tables where a full scan is cheaper than an index
+IGNORED_TABLES = {'categories', 'settings', 'users', 'schema_migrations', 'products_fts'}
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_TOKENS = re.compile(r'\(|\)|\b(?:WHERE|ORDER\s+BY|GROUP\s+BY|HAVING|LIMIT|FROM|UNION)\b', re.IGNORECASE)
+_EQUALITY = r'{table}\.(\w+)\s*(?:=|IN\b|IS\b)'
+_RANGE = r'{table}\.(\w+)\s*(?:<|>|BETWEEN\b)'
+_ORDER = r'{table}\.(\w+)'
+
+
+def capture_queries(engines, func, unique=True):
+    """
+    Record every SELECT the engines run while func executes
+
+    Args:
+        engines (list): The engines to listen on
+        func (callable): Code that issues the queries
+        unique (bool): Keep only the first run of each statement; pass False
+            to count every execution (e.g. to catch N+1 queries)
+
+    Returns:
+        list: (statement, parameters) pairs, in execution order
+    """
+    captured = {}
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.setdefault(statement, parameters)
+            executed.append((statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func()
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return list(captured.items()) if unique else executed
+
+def explain(connection, statement, parameters=()):
+    """
+    Run EXPLAIN QUERY PLAN for a statement
+
+    Args:
+        connection (Connection): A SQLAlchemy connection
+        statement (str): The SQL statement as sent to the driver
+        parameters: The statement's driver parameters
+
+    Returns:
+        list: The plan's detail lines
+    """
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+    return [row[-1] for row in rows]
+
+def find_scans(plan):
+    """
+    Find the tables a query plan reads with a full table scan
+
+    Index scans ('SCAN t USING INDEX ...') are not reported.
+
+    Args:
+        plan (list): Plan detail lines from explain()
+
+    Returns:
+        list: Names of the scanned tables
+    """
+    tables = []
+    for detail in plan:
+        match = _SCAN.match(detail.strip())
+        if match and match.group(1) not in IGNORED_TABLES:
+            tables.append(match.group(1))
+    return tables
+
+def _clauses(statement, name):
+    """
+    Get the text of every WHERE/ORDER BY/... clause of a statement
+
+    Each clause ends at the next clause keyword of its own (sub)query or at
+    the parenthesis closing it, so JOIN ... ON conditions are never included.
+
+    Args:
+        statement (str): The SQL statement
+        name (str): Clause keyword, e.g. 'WHERE'
+
+    Returns:
+        list: The clause texts, one per (sub)query that has the clause
+    """
+    found = []
+    open_clauses = {}
+    depth = 0
+    for match in _TOKENS.finditer(statement):
+        token = match.group(0).upper()
+        if token == '(':
+            depth += 1
+            continue
+        start = open_clauses.pop(depth, None)
+        if start is not None:
+            found.append(statement[start:match.start()])
+        if token == ')':
+            depth -= 1
+        elif ' '.join(token.split()) == name:
+            open_clauses[depth] = match.end()
+
+    found.extend(statement[start:] for start in open_clauses.values())
+    return found
+
+def existing_indexes(connection, table):
+    """
+    Get the column lists of a table's indexes
+
+    Args:
+        connection (Connection): A SQLAlchemy connection
+        table (str): Table name
+
+    Returns:
+        list: One list of column names per index, in index order
+    """
+    indexes = []
+    for row in connection.exec_driver_sql(f'PRAGMA index_list({table})'):
+        columns = connection.exec_driver_sql(f'PRAGMA index_info({row[1]})')
+        indexes.append([column[2] for column in sorted(columns, key=lambda column: column[0])])
+    return indexes
+
+def propose_index(statement, table, existing=()):
+    """
+    Propose a composite index for a scanned table
+
+    Columns compared with = or IN come first, then either one range column
+    or the ORDER BY columns, which is the order SQLite can use them in.
+
+    Args:
+        statement (str): The SQL statement
+        table (str): The scanned table
+        existing (list): Column lists of the table's indexes (see
+            existing_indexes()); an index they already cover is not proposed
+
+    Returns:
+        str: A CREATE INDEX statement, or None if the statement does not
+            filter or sort on the table (a deliberate full read) or an
+            existing index already has the proposed columns
+    """
+    where = ' '.join(_clauses(statement, 'WHERE'))
+    group_by = _clauses(statement, 'GROUP BY')
+    # ORDER BY after GROUP BY sorts the groups, not the table's rows
+    order_by = ' '.join(group_by or _clauses(statement, 'ORDER BY'))
+    escaped = re.escape(table)
+
+    def unique(names, exclude=()):
+        result = []
+        for name in names:
+            if name not in result and name not in exclude:
+                result.append(name)
+        return result
+
+    equality = unique(re.findall(_EQUALITY.format(table=escaped), where))
+    ranges = unique(re.findall(_RANGE.format(table=escaped), where), equality)
+    order = unique(re.findall(_ORDER.format(table=escaped), order_by), equality)
+
+    # An aggregate over every row of the table reads it all with any index
+    if group_by and not equality and not ranges:
+        return None
+
+    # Columns after a range column cannot narrow the search or the sort
+    columns = equality + (ranges[:1] if ranges else order)
+
+    # A scan in rowid order needs no index
+    if columns == ['id']:
+        return None
+
+    if not columns:
+        return None
+    # The planner chose the scan over an index that already exists
+    if any(index[:len(columns)] == columns for index in existing):
+        return None
+    return f"CREATE INDEX ix_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})"
+
+def analyze_queries(connection, queries):
+    """
+    Explain captured queries and propose indexes for their full scans
+
+    Args:
+        connection (Connection): A SQLAlchemy connection
+        queries (list): (statement, parameters) pairs from capture_queries()
+
+    Returns:
+        list: One dict per query with statement, plan, scans and proposals
+    """
+    results = []
+    indexes = {}
+    for statement, parameters in queries:
+        plan = explain(connection, statement, parameters)
+        scans = find_scans(plan)
+        proposals = []
+        for table in scans:
+            if table not in indexes:
+                indexes[table] = existing_indexes(connection, table)
+            proposal = propose_index(statement, table, indexes[table])
+            if proposal and proposal not in proposals:
+                proposals.append(proposal)
+        results.append({
+            'statement': statement,
+            'plan': plan,
+            'scans': scans,
+            'proposals': proposals
+        })
+    return results
+
+def advise_routes(client, engines, connection, paths):
+    """
+    Request each path and analyze the queries it runs
+
+    Args:
+        client (FlaskClient): A logged-in test client
+        engines (list): The engines the app queries through
+        connection (Connection): Connection used to run EXPLAIN
+        paths (list): (name, path) pairs of GET routes
+
+    Returns:
+        dict: Route name -> (status code, analyze_queries() results)
+    """
+    report = {}
+    for name, path in paths:
+        responses = []
+        queries = capture_queries(engines, lambda: responses.append(client.get(path)))
+        report[name] = (responses[0].status_code, analyze_queries(connection, queries))
+    return report
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, exists, func, select
+from models import db, Category, Product, Inventory, ProductDailySales
+from low_stock import is_low_condition
+
+# Stock counts as dead when the product has not sold for this many days
+DEAD_STOCK_DAYS = 90
+
+
+def stock_status_filter(status):
+    """
+    Get the filter condition for a stock status
+
+    'low' is the low-stock set of the low_stock module (at or below the
+    minimum quantity), so it includes out-of-stock products.
+
+    Args:
+        status (str): 'low', 'out' or anything else for no filter
+
+    Returns:
+        The SQL condition over Inventory and Product, or None
+    """
+    if status == 'low':
+        return is_low_condition()
+    if status == 'out':
+        return Inventory.quantity <= 0
+    return None
+
+def get_inventory_value(status='all'):
+    """
+    Get the purchase value of the stock, optionally for one stock status
+
+    Args:
+        status (str): 'all', 'low' or 'out'
+
+    Returns:
+        float: Sum of quantity * purchase price
+    """
+    query = select(
+        func.coalesce(func.sum(Inventory.quantity * Product.purchase_price), 0)
+    ).select_from(Inventory).join(Product, Inventory.product_id == Product.id)
+
+    condition = stock_status_filter(status)
+    if condition is not None:
+        query = query.where(condition)
+
+    return db.session.execute(query).scalar()
+
+def get_inventory_summary(dead_stock_days=DEAD_STOCK_DAYS):
+    """
+    Get the stock totals in a single aggregate query
+
+    Dead stock is stock of products without sales in the last
+    dead_stock_days days, taken from the product_daily_sales table.
+
+    Args:
+        dead_stock_days (int): Days without sales before stock counts as dead
+
+    Returns:
+        dict: products, units, total_value, low_stock (out-of-stock
+            products included), out_of_stock, dead_stock_products and
+            dead_stock_value
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=dead_stock_days)).date()
+    sold_recently = exists().where(
+        ProductDailySales.product_id == Inventory.product_id,
+        ProductDailySales.date >= cutoff,
+        ProductDailySales.quantity > 0
+    )
+    value = Inventory.quantity * Product.purchase_price
+    is_dead = and_(Inventory.quantity > 0, ~sold_recently)
+
+    row = db.session.execute(select(
+        func.count(Inventory.id).label('products'),
+        func.coalesce(func.sum(Inventory.quantity), 0).label('units'),
+        func.coalesce(func.sum(value), 0).label('total_value'),
+        func.coalesce(func.sum(case((stock_status_filter('low'), 1), else_=0)), 0).label('low_stock'),
+        func.coalesce(func.sum(case((stock_status_filter('out'), 1), else_=0)), 0).label('out_of_stock'),
+        func.coalesce(func.sum(case((is_dead, 1), else_=0)), 0).label('dead_stock_products'),
+        func.coalesce(func.sum(case((is_dead, value), else_=0)), 0).label('dead_stock_value')
+    ).select_from(Inventory).join(Product, Inventory.product_id == Product.id)).one()
+
+    return {
+        'products': row.products,
+        'units': row.units,
+        'total_value': row.total_value,
+        'low_stock': row.low_stock,
+        'out_of_stock': row.out_of_stock,
+        'dead_stock_products': row.dead_stock_products,
+        'dead_stock_value': row.dead_stock_value,
+        'dead_stock_days': dead_stock_days
+    }
+
+def get_category_values():
+    """
+    Get the stock value per category in a single grouped query
+
+    Returns:
+        list: One dict per category (category_id None for uncategorized
+            products) with name, products, units and value, highest value first
+    """
+    value = func.coalesce(func.sum(Inventory.quantity * Product.purchase_price), 0)
+    rows = db.session.execute(select(
+        Category.id,
+        Category.name,
+        func.count(Inventory.id).label('products'),
+        func.coalesce(func.sum(Inventory.quantity), 0).label('units'),
+        value.label('value')
+    ).select_from(Inventory).join(
+        Product, Inventory.product_id == Product.id
+    ).outerjoin(
+        Category, Product.category_id == Category.id
+    ).group_by(Category.id).order_by(value.desc()))
+
+    return [{
+        'category_id': row.id,
+        'name': row.name,
+        'products': row.products,
+        'units': row.units,
+        'value': row.value
+    } for row in rows]
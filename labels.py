@@ -0,0 +1,229 @@
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from fpdf import FPDF
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, Product
+from utils import barcode_cache, generate_random_barcode, get_barcode_types
+from search import index_products
+
+# A4 sheet with a 3 x 8 grid of 70 x 37 mm labels
+PAGE_WIDTH = 210
+PAGE_HEIGHT = 297
+LABEL_COLUMNS = 3
+LABEL_ROWS = 8
+LABEL_WIDTH = 70
+LABEL_HEIGHT = 37
+LABEL_PADDING = 2
+
+# Label-sized barcodes: a lower resolution keeps the images small, which
+# matters more for sheet build time than rendering does
+LABEL_WRITER_OPTIONS = {
+    'dpi': 150,
+    'module_height': 10,
+    'font_size': 7,
+    'text_distance': 3,
+    'quiet_zone': 2
+}
+
+MAX_LABELS = 10000
+
+# Below this many labels the process pool start-up costs more than it saves
+POOL_THRESHOLD = 50
+
+# Times barcodes are generated for products that lack one before giving up
+# when another writer keeps taking the same values
+BARCODE_ATTEMPTS = 3
+
+
+def _unused_barcodes(count):
+    """
+    Generate random barcodes that no product has yet
+
+    Args:
+        count (int): Number of barcodes
+
+    Returns:
+        list: count distinct barcodes
+    """
+    barcodes = set()
+    while len(barcodes) < count:
+        candidates = {generate_random_barcode() for _ in range(count - len(barcodes))} - barcodes
+        taken = set(db.session.execute(select(Product.barcode).where(Product.barcode.in_(candidates))).scalars())
+        barcodes |= candidates - taken
+    return list(barcodes)
+
+def select_label_products(selection='all', category_id=None, product_ids=None):
+    """
+    Load the products to print labels for
+
+    Products selected with 'missing' have no barcode yet; a random unused
+    one is generated and saved for each of them before printing. If a
+    concurrent writer takes one of the barcodes first, new ones are
+    generated.
+
+    Args:
+        selection (str): 'all', 'category', 'ids' or 'missing'
+        category_id (int): Category to print when selection is 'category'
+        product_ids (list): Product IDs to print when selection is 'ids'
+
+    Returns:
+        list: Product objects, at most MAX_LABELS of them
+    """
+    query = Product.query
+
+    if selection == 'category':
+        query = query.filter(Product.category_id == category_id)
+    elif selection == 'ids':
+        query = query.filter(Product.id.in_(product_ids or []))
+    elif selection == 'missing':
+        query = query.filter(db.or_(Product.barcode.is_(None), Product.barcode == ''))
+
+    query = query.order_by(Product.id).limit(MAX_LABELS)
+    products = query.all()
+
+    if selection == 'missing' and products:
+        for attempt in range(BARCODE_ATTEMPTS):
+            for product, barcode in zip(products, _unused_barcodes(len(products))):
+                product.barcode = barcode
+            index_products([{
+                'id': product.id,
+                'name': product.name,
+                'description': product.description,
+                'barcode': product.barcode,
+                'sku': product.sku
+            } for product in products])
+            product_ids = [product.id for product in products]
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == BARCODE_ATTEMPTS - 1:
+                    raise
+                products = query.all()
+
+        # The commit expired the products; reload them in one query
+        # instead of one SELECT per product
+        products = Product.query.filter(Product.id.in_(product_ids)).order_by(Product.id).all()
+
+    return [product for product in products if product.barcode]
+
+def _render_label_image(job):
+    """Render one barcode into the shared disk cache (runs in a worker process)"""
+    barcode_value, barcode_type = job
+    try:
+        return barcode_cache.get_file(barcode_value, barcode_type, LABEL_WRITER_OPTIONS)
+    except Exception:
+        # The value is not valid for this symbology (e.g. wrong EAN length)
+        return None
+
+def render_label_images(barcode_values, barcode_type='code128', max_workers=None):
+    """
+    Render many barcodes, in parallel across CPU cores
+
+    Args:
+        barcode_values (list): Values to encode
+        barcode_type (str): The type of barcode to generate
+        max_workers (int): Number of worker processes (default: CPU count)
+
+    Returns:
+        list: PNG file path for each value, or None where rendering failed
+    """
+    jobs = [(value, barcode_type) for value in barcode_values]
+
+    if len(jobs) < POOL_THRESHOLD:
+        return [_render_label_image(job) for job in jobs]
+
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_label_image, jobs, chunksize=chunksize))
+
+def _png_size(path):
+    """Read the pixel width and height from a PNG file header"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    return struct.unpack('>II', header[16:24])
+
+def _pdf_text(value):
+    """Return value if the core PDF fonts can draw it, otherwise an empty string"""
+    value = str(value or '')
+    try:
+        value.encode('latin-1')
+    except UnicodeEncodeError:
+        return ''
+    return value
+
+def is_label_barcode_type(barcode_type):
+    """Whether labels can be printed with this barcode type"""
+    return barcode_type in {code for code, _ in get_barcode_types()}
+
+def write_label_sheet(products, output, barcode_type='code128', max_workers=None):
+    """
+    Lay out barcode labels for products on A4 label sheets
+
+    Args:
+        products (list): Product objects with barcodes
+        output: Binary file object the PDF is written to
+        barcode_type (str): The type of barcode to generate
+        max_workers (int): Number of worker processes for rendering
+
+    Returns:
+        tuple: (number of labels printed, number of products skipped)
+    """
+    if not is_label_barcode_type(barcode_type):
+        raise ValueError(f'Unsupported barcode type: {barcode_type}')
+
+    image_paths = render_label_images([product.barcode for product in products], barcode_type, max_workers)
+
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.set_auto_page_break(False)
+    pdf.set_font('Arial', '', 8)
+
+    margin_x = (PAGE_WIDTH - LABEL_COLUMNS * LABEL_WIDTH) / 2
+    margin_y = (PAGE_HEIGHT - LABEL_ROWS * LABEL_HEIGHT) / 2
+    per_page = LABEL_COLUMNS * LABEL_ROWS
+
+    printed = 0
+    for product, image_path in zip(products, image_paths):
+        if image_path is None:
+            continue
+
+        slot = printed % per_page
+        if slot == 0:
+            pdf.add_page()
+
+        x = margin_x + (slot % LABEL_COLUMNS) * LABEL_WIDTH
+        y = margin_y + (slot // LABEL_COLUMNS) * LABEL_HEIGHT
+
+        # Scale the barcode to fit the label without distorting it
+        box_width = LABEL_WIDTH - 2 * LABEL_PADDING
+        box_height = LABEL_HEIGHT - 2 * LABEL_PADDING - 5
+        pixel_width, pixel_height = _png_size(image_path)
+        scale = min(box_width / pixel_width, box_height / pixel_height)
+        image_width = pixel_width * scale
+        image_height = pixel_height * scale
+
+        pdf.image(
+            image_path,
+            x + LABEL_PADDING + (box_width - image_width) / 2,
+            y + LABEL_PADDING + (box_height - image_height) / 2,
+            w=image_width,
+            h=image_height,
+            type='PNG'
+        )
+
+        pdf.set_xy(x + LABEL_PADDING, y + LABEL_HEIGHT - LABEL_PADDING - 5)
+        caption = ' - '.join(part for part in (_pdf_text(product.name), f'{product.sale_price:.2f}') if part)
+        pdf.cell(LABEL_WIDTH - 2 * LABEL_PADDING, 5, caption[:45], 0, 0, 'C')
+
+        printed += 1
+
+    if printed == 0:
+        pdf.add_page()
+
+    pdf.output(output)
+
+    return printed, len(products) - printed
@@ -0,0 +1,228 @@
+from datetime import datetime
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Product, Inventory, LowStockFlag
+from database import RoutingSession
+
+# Session.info key holding the product IDs whose stock changed in the
+# current transaction
+DIRTY_KEY = 'low_stock_dirty'
+
+
+def is_low_condition():
+    """
+    SQL condition for a product being at or below its minimum quantity
+
+    A product without an inventory record (NULL quantity over an outer
+    join) is not low.
+    """
+    return Inventory.quantity <= func.coalesce(Product.min_quantity, 0)
+
+def mark_stock_changed(product_ids, session=None):
+    """
+    Record that the stock or minimum quantity of products changed
+
+    ORM changes to Inventory and Product rows are picked up automatically;
+    code that updates inventory with Core statements must call this so the
+    low-stock flags are refreshed when the transaction commits.
+
+    Args:
+        product_ids (iterable): IDs of the changed products
+        session (Session): The session (default: db.session)
+    """
+    session = session or db.session
+    session.info.setdefault(DIRTY_KEY, set()).update(product_ids)
+
+def get_low_stock_version():
+    """Get the version of the last change to the low-stock set"""
+    return db.session.query(func.coalesce(func.max(LowStockFlag.version), 0)).scalar()
+
+def get_low_stock_last_change():
+    """
+    Get the version and time of the last change to the low-stock set
+
+    Returns:
+        tuple: (version, updated_at), or (0, None) if no flag was written yet
+    """
+    row = db.session.execute(
+        select(LowStockFlag.version, LowStockFlag.updated_at).order_by(LowStockFlag.version.desc()).limit(1)
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+def refresh_low_stock(product_ids, session=None):
+    """
+    Recompute the low-stock flag of some products
+
+    Flags that change are written with a new version number, shared by
+    every change in the call, so clients can ask for changes since the
+    version they last saw.
+
+    Args:
+        product_ids (iterable): IDs of the products to recompute
+        session (Session): The session (default: db.session)
+
+    Returns:
+        int: The new version, or None if no flag changed
+    """
+    session = session or db.session
+    product_ids = set(product_ids)
+    if not product_ids:
+        return None
+
+    current = {
+        row.id: bool(row.is_low)
+        for row in session.execute(select(
+            Product.id,
+            is_low_condition().label('is_low')
+        ).outerjoin(
+            Inventory, Inventory.product_id == Product.id
+        ).where(Product.id.in_(product_ids)))
+    }
+    flags = dict(session.execute(select(
+        LowStockFlag.product_id, LowStockFlag.is_low
+    ).where(LowStockFlag.product_id.in_(product_ids))).all())
+
+    # Deleted products leave the set; products never flagged need no row
+    # until they become low
+    changed = {
+        product_id: current.get(product_id, False)
+        for product_id in product_ids
+        if current.get(product_id, False) != flags.get(product_id, False)
+    }
+    if not changed:
+        return None
+
+    version = session.execute(select(func.coalesce(func.max(LowStockFlag.version), 0))).scalar() + 1
+    now = datetime.utcnow()
+
+    table = LowStockFlag.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={
+            'is_low': statement.excluded.is_low,
+            'version': statement.excluded.version,
+            'updated_at': statement.excluded.updated_at
+        }
+    )
+    session.execute(statement, [
+        {'product_id': product_id, 'is_low': is_low, 'version': version, 'updated_at': now}
+        for product_id, is_low in changed.items()
+    ])
+    return version
+
+def rebuild_low_stock():
+    """
+    Recompute the low-stock flag of every product
+
+    Returns:
+        int: The new version, or None if no flag changed
+    """
+    product_ids = {row[0] for row in db.session.execute(select(Product.id))}
+    product_ids.update(row[0] for row in db.session.execute(select(LowStockFlag.product_id)))
+    version = refresh_low_stock(product_ids)
+    db.session.commit()
+    return version
+
+def get_low_stock_changes(since=None):
+    """
+    Get the low-stock set, or the changes to it since a version
+
+    The version is read before the flags. Flag changes commit in version
+    order, so any change the flag query misses has a higher version and is
+    returned by the next call with since set to the returned version. A
+    change may be listed twice; applying it again is harmless.
+
+    Args:
+        since (int): Version the client last saw (default: the full set)
+
+    Returns:
+        tuple: (current version, list of dicts with product_id, name,
+            quantity, min_quantity and low). Without since, only products
+            that are low are listed; with it, every flag changed after that
+            version, including products that stopped being low.
+    """
+    version = get_low_stock_version()
+
+    query = select(
+        LowStockFlag.product_id,
+        LowStockFlag.is_low,
+        LowStockFlag.version,
+        Product.name,
+        Product.min_quantity,
+        Inventory.quantity
+    ).select_from(LowStockFlag).outerjoin(
+        Product, LowStockFlag.product_id == Product.id
+    ).outerjoin(
+        Inventory, Inventory.product_id == LowStockFlag.product_id
+    )
+
+    if since is None:
+        query = query.where(LowStockFlag.is_low.is_(True)).order_by(LowStockFlag.product_id)
+    else:
+        query = query.where(LowStockFlag.version > since).order_by(LowStockFlag.version, LowStockFlag.product_id)
+
+    changes = [{
+        'product_id': row.product_id,
+        'name': row.name,
+        'quantity': row.quantity,
+        'min_quantity': row.min_quantity,
+        'low': bool(row.is_low),
+        'version': row.version
+    } for row in db.session.execute(query)]
+
+    return version, changes
+
+def get_low_stock_products(limit=None):
+    """
+    Get (Product, Inventory) pairs of the products in the low-stock set
+
+    Args:
+        limit (int): Maximum number of products
+
+    Returns:
+        list: (Product, Inventory) tuples, lowest quantity first
+    """
+    query = db.session.query(Product, Inventory).join(
+        LowStockFlag, LowStockFlag.product_id == Product.id
+    ).join(
+        Inventory, Inventory.product_id == Product.id
+    ).filter(
+        LowStockFlag.is_low.is_(True)
+    ).order_by(Inventory.quantity, Product.id)
+
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+def count_low_stock():
+    """Get the number of products in the low-stock set"""
+    return db.session.query(func.count(LowStockFlag.product_id)).filter(LowStockFlag.is_low.is_(True)).scalar()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_stock_changes(session, flush_context):
+    """Record products whose inventory or minimum quantity was flushed"""
+    product_ids = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Inventory):
+            product_ids.add(instance.product_id)
+        elif isinstance(instance, Product):
+            state = inspect(instance)
+            if instance in session.new or instance in session.deleted or state.attrs.min_quantity.history.has_changes():
+                product_ids.add(instance.id)
+    product_ids.discard(None)
+    if product_ids:
+        mark_stock_changed(product_ids, session)
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _refresh_changed_flags(session):
+    """Refresh the flags of changed products in the committing transaction"""
+    session.flush()
+    product_ids = session.info.pop(DIRTY_KEY, None)
+    if product_ids:
+        refresh_low_stock(product_ids, session)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_stock_changes(session):
+    session.info.pop(DIRTY_KEY, None)
@@ -0,0 +1,137 @@
+from datetime import datetime
+from sqlalchemy import text
+from models import db
+
+
+def add_column(table, column, definition):
+    """
+    Build a migration step that adds a column unless the table already has it
+
+    SQLite has no ADD COLUMN IF NOT EXISTS, so the step checks PRAGMA
+    table_info first.
+
+    Args:
+        table (str): Table name
+        column (str): Column name
+        definition (str): Column type and constraints, e.g. 'INTEGER NOT NULL DEFAULT 1'
+
+    Returns:
+        callable: The migration step
+    """
+    def step():
+        columns = {row[1] for row in db.session.execute(text(f'PRAGMA table_info({table})'))}
+        if column not in columns:
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {definition}'))
+    return step
+
+
+# Versioned schema changes for databases created before the change was made.
+# They run after db.create_all(), which already gives new databases the same
+# schema, so every step must be safe to run against a schema that has it
+# (IF NOT EXISTS, or add_column()). Never edit an applied migration; add a
+# new version.
+MIGRATIONS = [
+    (1, 'Add indexes for the hot query paths', [
+        'CREATE INDEX IF NOT EXISTS ix_products_created_at_id ON products (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_products_category_id ON products (category_id)',
+        'CREATE INDEX IF NOT EXISTS ix_suppliers_created_at_id ON suppliers (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_customers_created_at_id ON customers (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_purchases_created_at_id ON purchases (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_purchases_purchase_date_id ON purchases (purchase_date, id)',
+        'CREATE INDEX IF NOT EXISTS ix_purchases_status_purchase_date ON purchases (status, purchase_date)',
+        'CREATE INDEX IF NOT EXISTS ix_purchases_supplier_id ON purchases (supplier_id)',
+        'CREATE INDEX IF NOT EXISTS ix_purchase_items_purchase_id ON purchase_items (purchase_id)',
+        'CREATE INDEX IF NOT EXISTS ix_purchase_items_product_id ON purchase_items (product_id)',
+        'CREATE INDEX IF NOT EXISTS ix_sales_created_at_id ON sales (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_sales_sale_date_id ON sales (sale_date, id)',
+        'CREATE INDEX IF NOT EXISTS ix_sales_status_sale_date ON sales (status, sale_date)',
+        'CREATE INDEX IF NOT EXISTS ix_sales_customer_id ON sales (customer_id)',
+        'CREATE INDEX IF NOT EXISTS ix_sale_items_sale_id ON sale_items (sale_id)',
+        'CREATE INDEX IF NOT EXISTS ix_sale_items_product_id ON sale_items (product_id)',
+        'CREATE INDEX IF NOT EXISTS ix_inventory_quantity ON inventory (quantity)',
+        'CREATE INDEX IF NOT EXISTS ix_inventory_transactions_product_timestamp '
+        'ON inventory_transactions (product_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_inventory_movements_inventory_timestamp '
+        'ON inventory_movements (inventory_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_product_daily_sales_date_covering '
+        'ON product_daily_sales (date, product_id, quantity, revenue, cost)',
+        'ANALYZE'
+    ]),
+    (2, 'Add indexes for the paginated history views', [
+        'CREATE INDEX IF NOT EXISTS ix_inventory_movements_timestamp_id ON inventory_movements (timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS ix_user_activities_timestamp_id ON user_activities (timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS ix_user_activities_user_timestamp ON user_activities (user_id, timestamp)',
+        'ANALYZE'
+    ]),
+    (3, 'Add a version counter to users', [
+        add_column('users', 'version', 'INTEGER NOT NULL DEFAULT 1')
+    ]),
+    (4, 'Add prefix search indexes for the customer typeahead', [
+        'CREATE INDEX IF NOT EXISTS ix_customers_name ON customers (name)',
+        'CREATE INDEX IF NOT EXISTS ix_customers_phone ON customers (phone)',
+        'ANALYZE'
+    ]),
+    (5, 'Record the unit cost of sale items', [
+        add_column('sale_items', 'cost', 'FLOAT'),
+        # Older items did not store it; the current purchase price is the best estimate left
+        'UPDATE sale_items SET cost = (SELECT purchase_price FROM products WHERE products.id = sale_items.product_id) '
+        'WHERE cost IS NULL'
+    ]),
+]
+
+
+def ensure_migrations_table():
+    """Create the schema_migrations table if it does not exist"""
+    db.session.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at DATETIME NOT NULL)'
+    ))
+
+def get_schema_version():
+    """
+    Get the version of the last applied migration
+
+    Returns:
+        int: The schema version (0 if no migration has run)
+    """
+    ensure_migrations_table()
+    return db.session.execute(text('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')).scalar()
+
+def migrate(target=None):
+    """
+    Apply every pending migration, in version order
+
+    A migration's version is recorded only after all of its statements have
+    run; since they are idempotent, a migration that failed part-way is
+    simply run again from the start.
+
+    Args:
+        target (int): Stop after this version (default: the latest)
+
+    Returns:
+        list: Versions applied by this call
+    """
+    current = get_schema_version()
+    db.session.commit()
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement()
+                else:
+                    db.session.execute(text(statement))
+            db.session.execute(text(
+                'INSERT INTO schema_migrations (version, description, applied_at) '
+                'VALUES (:version, :description, :applied_at)'
+            ), {'version': version, 'description': description, 'applied_at': datetime.utcnow()})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(version)
+
+    return applied
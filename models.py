@@ -4,8 +4,9 @@ from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import os
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
@@ -20,6 +21,15 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     reset_token = db.Column(db.String(100), nullable=True)
     reset_token_expiry = db.Column(db.DateTime, nullable=True)
+    # Bumped by every ORM update of the row; cached user snapshots are
+    # dropped when it changes (see user_cache.py). As version_id_col it also
+    # turns on optimistic locking for every User update (profile edits,
+    # password resets, activation): the UPDATE matches the version that was
+    # loaded, and a row changed in between raises StaleDataError instead of
+    # being overwritten.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -66,6 +76,10 @@ class Category(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_category_id', 'category_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -102,6 +116,9 @@ class Product(db.Model):
 
 class Supplier(db.Model):
     __tablename__ = 'suppliers'
+    __table_args__ = (
+        db.Index('ix_suppliers_created_at_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -121,6 +138,11 @@ class Supplier(db.Model):
 
 class Customer(db.Model):
     __tablename__ = 'customers'
+    __table_args__ = (
+        db.Index('ix_customers_created_at_id', 'created_at', 'id'),
+        db.Index('ix_customers_name', 'name'),
+        db.Index('ix_customers_phone', 'phone'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -139,6 +161,12 @@ class Customer(db.Model):
 
 class Purchase(db.Model):
     __tablename__ = 'purchases'
+    __table_args__ = (
+        db.Index('ix_purchases_created_at_id', 'created_at', 'id'),
+        db.Index('ix_purchases_purchase_date_id', 'purchase_date', 'id'),
+        db.Index('ix_purchases_status_purchase_date', 'status', 'purchase_date'),
+        db.Index('ix_purchases_supplier_id', 'supplier_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(50), nullable=False)
@@ -159,6 +187,10 @@ class Purchase(db.Model):
 
 class PurchaseItem(db.Model):
     __tablename__ = 'purchase_items'
+    __table_args__ = (
+        db.Index('ix_purchase_items_purchase_id', 'purchase_id'),
+        db.Index('ix_purchase_items_product_id', 'product_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     purchase_id = db.Column(db.Integer, db.ForeignKey('purchases.id'), nullable=False)
@@ -172,6 +204,12 @@ class PurchaseItem(db.Model):
 
 class Sale(db.Model):
     __tablename__ = 'sales'
+    __table_args__ = (
+        db.Index('ix_sales_created_at_id', 'created_at', 'id'),
+        db.Index('ix_sales_sale_date_id', 'sale_date', 'id'),
+        db.Index('ix_sales_status_sale_date', 'status', 'sale_date'),
+        db.Index('ix_sales_customer_id', 'customer_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(50), nullable=False)
@@ -192,19 +230,42 @@ class Sale(db.Model):
 
 class SaleItem(db.Model):
     __tablename__ = 'sale_items'
+    __table_args__ = (
+        db.Index('ix_sale_items_sale_id', 'sale_id'),
+        db.Index('ix_sale_items_product_id', 'product_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     price = db.Column(db.Float, nullable=False, default=0)
+    # Unit purchase cost when the sale was made
+    cost = db.Column(db.Float, nullable=True)
 
     def __repr__(self):
         return f'<SaleItem {self.id}>'
 
 
+class SaleUploadKey(db.Model):
+    __tablename__ = 'sale_upload_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Generated by the till for each offline sale; a repeated upload of the
+    # same sale is answered with the sale already created
+    key = db.Column(db.String(64), unique=True, nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SaleUploadKey {self.key}>'
+
+
 class Inventory(db.Model):
     __tablename__ = 'inventory'
+    __table_args__ = (
+        db.Index('ix_inventory_quantity', 'quantity'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, unique=True)
@@ -217,6 +278,9 @@ class Inventory(db.Model):
 
 class InventoryTransaction(db.Model):
     __tablename__ = 'inventory_transactions'
+    __table_args__ = (
+        db.Index('ix_inventory_transactions_product_timestamp', 'product_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
@@ -238,6 +302,163 @@ class InventoryTransaction(db.Model):
         return f'<InventoryTransaction {self.id}>'
 
 
+class InventoryMovement(db.Model):
+    __tablename__ = 'inventory_movements'
+    __table_args__ = (
+        db.Index('ix_inventory_movements_inventory_timestamp', 'inventory_id', 'timestamp'),
+        db.Index('ix_inventory_movements_timestamp_id', 'timestamp', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
+    movement_type = db.Column(db.String(20), nullable=False)  # in, out
+    quantity = db.Column(db.Integer, nullable=False)
+    reference = db.Column(db.String(50), nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InventoryMovement {self.id}>'
+
+
+class UserActivity(db.Model):
+    __tablename__ = 'user_activities'
+    __table_args__ = (
+        db.Index('ix_user_activities_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_user_activities_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Set when the record is queued, so replaying the audit journal never
+    # inserts it twice
+    event_id = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    activity_type = db.Column(db.String(20), nullable=False)  # login, logout, create, update, delete
+    description = db.Column(db.Text, nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserActivity {self.activity_type} {self.user_id}>'
+
+
+class DailySalesSummary(db.Model):
+    __tablename__ = 'daily_sales_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, unique=True, nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DailySalesSummary {self.date}>'
+
+
+class ProductDailySales(db.Model):
+    __tablename__ = 'product_daily_sales'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'date', name='uq_product_daily_sales_product_date'),
+        # Covers date-range aggregations without touching the table
+        db.Index('ix_product_daily_sales_date_covering', 'date', 'product_id', 'quantity', 'revenue', 'cost'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0)  # purchase cost at the time of sale
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProductDailySales {self.product_id} {self.date}>'
+
+
+class LowStockFlag(db.Model):
+    __tablename__ = 'low_stock_flags'
+    __table_args__ = (
+        db.Index('ix_low_stock_flags_version', 'version'),
+        db.Index('ix_low_stock_flags_is_low', 'is_low'),
+    )
+
+    # No foreign key: the flag of a deleted product is kept (cleared) so
+    # clients polling for changes see it leave the set
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    is_low = db.Column(db.Boolean, nullable=False, default=False)
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LowStockFlag {self.product_id} {self.is_low}>'
+
+
+class ProductChange(db.Model):
+    __tablename__ = 'product_changes'
+    __table_args__ = (
+        db.Index('ix_product_changes_seq', 'seq', unique=True),
+    )
+
+    # No foreign key: the row of a deleted product is kept as a tombstone
+    # so offline clients syncing changes see it disappear
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    seq = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProductChange {self.product_id} #{self.seq}>'
+
+class Stocktake(db.Model):
+    __tablename__ = 'stocktakes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)  # None = all products
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, posted, cancelled
+    notes = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    posted_at = db.Column(db.DateTime, nullable=True)
+    posted_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # Relationships
+    category = db.relationship('Category', lazy=True)
+    lines = db.relationship('StocktakeLine', backref='stocktake', lazy='dynamic', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Stocktake {self.id} {self.status}>'
+
+
+class StocktakeLine(db.Model):
+    __tablename__ = 'stocktake_lines'
+    __table_args__ = (
+        db.UniqueConstraint('stocktake_id', 'product_id', name='uq_stocktake_lines_stocktake_product'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stocktake_id = db.Column(db.Integer, db.ForeignKey('stocktakes.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    snapshot_quantity = db.Column(db.Integer, nullable=False, default=0)  # stock when the session started
+    expected_quantity = db.Column(db.Integer, nullable=True)  # stock when the count was last recorded
+    counted_quantity = db.Column(db.Integer, nullable=True)  # None = not counted yet
+    counted_at = db.Column(db.DateTime, nullable=True)
+    adjustment = db.Column(db.Integer, nullable=True)  # change applied when the session was posted
+
+    # Relationships
+    product = db.relationship('Product', lazy=True)
+
+    @property
+    def variance(self):
+        if self.counted_quantity is None:
+            return None
+        return self.counted_quantity - self.expected_quantity
+
+    def __repr__(self):
+        return f'<StocktakeLine {self.stocktake_id} {self.product_id}>'
+
+
 class Setting(db.Model):
     __tablename__ = 'settings'
 
@@ -0,0 +1,200 @@
+import base64
+import json
+from datetime import date, datetime, timedelta
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key of a row as an opaque URL-safe cursor
+
+    Args:
+        values (tuple): Sort key values (e.g. created_at, id)
+
+    Returns:
+        str: The encoded cursor
+    """
+    payload = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Args:
+        cursor (str): The encoded cursor
+        columns (list): Sort columns, used to restore date/datetime values
+
+    Returns:
+        tuple: The sort key values, or None if the cursor is invalid
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        return None
+
+    values = []
+    for column, value in zip(columns, payload):
+        python_type = column.type.python_type
+        try:
+            if value is not None and python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif value is not None and python_type is date:
+                value = date.fromisoformat(value)
+        except (ValueError, TypeError):
+            return None
+        values.append(value)
+
+    return tuple(values)
+
+def get_page_size(default=DEFAULT_PAGE_SIZE):
+    """Read the requested page size from the query string, clamped to MAX_PAGE_SIZE"""
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+def date_range_conditions(column):
+    """
+    Build filter conditions from the start_date/end_date query string arguments
+
+    Both dates are inclusive and given as YYYY-MM-DD; invalid dates are
+    ignored. The conditions are plain range bounds on the column, so they
+    narrow the same index range as the keyset cursor.
+
+    Args:
+        column: The date or datetime column to filter
+
+    Returns:
+        list: SQL conditions (empty if no valid date was given)
+    """
+    conditions = []
+    for name, build in (
+        ('start_date', lambda day: column >= datetime.combine(day, datetime.min.time())),
+        ('end_date', lambda day: column < datetime.combine(day + timedelta(days=1), datetime.min.time()))
+    ):
+        value = request.args.get(name)
+        if value:
+            try:
+                conditions.append(build(date.fromisoformat(value)))
+            except ValueError:
+                pass
+    return conditions
+
+
+class KeysetPage:
+    """A single page of keyset-paginated results"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def _url(self, key, cursor):
+        args = request.args.to_dict()
+        args.pop('after', None)
+        args.pop('before', None)
+        args[key] = cursor
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    def next_url(self):
+        """URL of the next (older) page, keeping the current filters"""
+        return self._url('after', self.next_cursor) if self.has_next else None
+
+    def prev_url(self):
+        """URL of the previous (newer) page, keeping the current filters"""
+        return self._url('before', self.prev_cursor) if self.has_prev else None
+
+    def to_dict(self, serialize):
+        """
+        Build a JSON-serializable representation of the page
+
+        Args:
+            serialize (callable): Converts one item to a dict
+
+        Returns:
+            dict: Items plus cursor information
+        """
+        return {
+            'items': [serialize(item) for item in self.items],
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev
+        }
+
+
+def keyset_paginate(query, sort_column, id_column, row_key=None, per_page=None):
+    """
+    Paginate a query newest-first on (sort_column, id_column) using cursors
+
+    The cursor comes from the ``after`` or ``before`` query string argument.
+    Each page is a bounded index range scan, so the cost of a page does not
+    depend on how deep into the result set it is.
+
+    Args:
+        query: SQLAlchemy query to paginate
+        sort_column: Column to sort by, descending (e.g. Sale.created_at)
+        id_column: Unique tie-breaker column (e.g. Sale.id)
+        row_key (callable): Returns the (sort, id) values of a result row
+            (default: reads the column attributes from the row)
+        per_page (int): Page size (default: from the query string)
+
+    Returns:
+        KeysetPage: The requested page
+    """
+    if per_page is None:
+        per_page = get_page_size()
+    if row_key is None:
+        row_key = lambda row: (getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    columns = [sort_column, id_column]
+    after = request.args.get('after')
+    before = request.args.get('before')
+    after_key = decode_cursor(after, columns) if after else None
+    before_key = decode_cursor(before, columns) if before else None
+
+    if before_key:
+        sort_value, id_value = before_key
+        # The redundant bound lets SQLite seek the index instead of
+        # scanning it from one end
+        rows = query.filter(sort_column >= sort_value, or_(
+            sort_column > sort_value,
+            and_(sort_column == sort_value, id_column > id_value)
+        )).order_by(sort_column.asc(), id_column.asc()).limit(per_page + 1).all()
+
+        has_newer = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_older = True
+    else:
+        if after_key:
+            sort_value, id_value = after_key
+            query = query.filter(sort_column <= sort_value, or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < id_value)
+            ))
+        rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+
+        has_older = len(rows) > per_page
+        items = rows[:per_page]
+        has_newer = after_key is not None
+
+    next_cursor = encode_cursor(row_key(items[-1])) if items and has_older else None
+    prev_cursor = encode_cursor(row_key(items[0])) if items and has_newer else None
+
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
@@ -0,0 +1,352 @@
+import csv
+import io
+import math
+import os
+from datetime import datetime
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Category, Product, Inventory, InventoryTransaction
+from search import index_products
+from low_stock import mark_stock_changed
+from sync import mark_products_changed
+
+# Rows written per executemany and per commit
+IMPORT_CHUNK_SIZE = 2000
+
+# Accepted header names (English or Arabic) for each product field
+COLUMN_ALIASES = {
+    'name': ('name', 'product', 'product name', 'اسم المنتج', 'الاسم'),
+    'description': ('description', 'الوصف'),
+    'barcode': ('barcode', 'الباركود'),
+    'sku': ('sku', 'رمز المنتج', 'رمز المنتج (sku)'),
+    'purchase_price': ('purchase_price', 'purchase price', 'cost', 'سعر الشراء'),
+    'sale_price': ('sale_price', 'sale price', 'price', 'سعر البيع'),
+    'min_quantity': ('min_quantity', 'min quantity', 'الحد الأدنى للكمية'),
+    'quantity': ('quantity', 'initial_quantity', 'initial quantity', 'الكمية', 'الكمية الأولية'),
+    'category': ('category', 'category_id', 'التصنيف')
+}
+
+# Maximum lengths, as in ProductForm
+MAX_LENGTHS = {'name': 100, 'barcode': 50, 'sku': 50}
+
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportResult:
+    """Counts and per-row errors of a product import"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.error_count = 0
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+
+def _normalize_header(header):
+    """Map a file header to a product field name, or None if unknown"""
+    header = str(header or '').strip().lower()
+    for field, aliases in COLUMN_ALIASES.items():
+        if header in aliases:
+            return field
+    return None
+
+def read_csv_rows(stream):
+    """
+    Stream the rows of a CSV file
+
+    Args:
+        stream: A binary file object
+
+    Yields:
+        tuple: (row number, dict of field -> raw value); the header is row 1
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    fields = [_normalize_header(header) for header in next(reader, [])]
+    for row_number, values in enumerate(reader, start=2):
+        if any(value.strip() for value in values):
+            yield row_number, {field: value for field, value in zip(fields, values) if field}
+
+def read_xlsx_rows(stream):
+    """
+    Stream the rows of the first sheet of an XLSX workbook
+
+    Args:
+        stream: A binary file object
+
+    Yields:
+        tuple: (row number, dict of field -> raw value); the header is row 1
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import requires the openpyxl package')
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        fields = [_normalize_header(header) for header in next(rows, ())]
+        for row_number, values in enumerate(rows, start=2):
+            if any(value not in (None, '') for value in values):
+                yield row_number, {field: value for field, value in zip(fields, values) if field}
+    finally:
+        workbook.close()
+
+def read_import_rows(stream, filename):
+    """
+    Stream the rows of an uploaded CSV or XLSX file
+
+    Args:
+        stream: A binary file object
+        filename (str): The uploaded file name, used to pick the format
+
+    Returns:
+        iterator: (row number, dict of field -> raw value) tuples
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return read_csv_rows(stream)
+    if extension in ('.xlsx', '.xlsm'):
+        return read_xlsx_rows(stream)
+    raise ValueError(f'Unsupported file type: {extension or filename}')
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.endswith('.0') and value[:-2].isdigit():
+        # Spreadsheets turn numeric barcodes into floats
+        value = value[:-2]
+    return value or None
+
+def _number(value, field, cast):
+    if value is None or str(value).strip() == '':
+        raise ValueError(f'{field} is required')
+    try:
+        number = cast(float(value)) if cast is int else cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{field} must be a number')
+    if not math.isfinite(number):
+        raise ValueError(f'{field} must be a finite number')
+    if cast is int and float(value) != number:
+        raise ValueError(f'{field} must be a whole number')
+    if number < 0:
+        raise ValueError(f'{field} must not be negative')
+    return number
+
+def validate_row(raw, categories):
+    """
+    Validate an import row with the rules of ProductForm
+
+    Only the columns present in the file are returned, so updates leave the
+    other fields of existing products unchanged.
+
+    Args:
+        raw (dict): field -> raw value
+        categories (dict): Lower-cased category name or ID string -> category ID
+
+    Returns:
+        dict: The cleaned values
+
+    Raises:
+        ValueError: If the row is invalid
+    """
+    values = {}
+
+    for field in ('name', 'description', 'barcode', 'sku'):
+        if field in raw:
+            values[field] = _text(raw[field])
+            if values[field] and field in MAX_LENGTHS and len(values[field]) > MAX_LENGTHS[field]:
+                raise ValueError(f'{field} is longer than {MAX_LENGTHS[field]} characters')
+
+    if not values.get('name'):
+        raise ValueError('name is required')
+
+    for field, cast in (('purchase_price', float), ('sale_price', float), ('min_quantity', int), ('quantity', int)):
+        if field in raw:
+            values[field] = _number(raw[field], field, cast)
+
+    if 'category' in raw:
+        category = _text(raw['category'])
+        if category is None:
+            values['category_id'] = None
+        elif category.lower() in categories:
+            values['category_id'] = categories[category.lower()]
+        else:
+            raise ValueError(f'Unknown category: {category}')
+
+    return values
+
+def import_products(rows, user_id=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Create or update products from import rows
+
+    Rows are matched to existing products by barcode, then SKU, using an
+    in-memory map of the existing keys. New products need a purchase price,
+    sale price and quantity and get an Inventory row and, for a positive
+    quantity, an initial InventoryTransaction; updates never change stock.
+    Everything is written with Core bulk statements and committed every
+    chunk_size rows. Invalid rows are reported and skipped.
+
+    Args:
+        rows (iterable): (row number, raw dict) tuples from read_import_rows()
+        user_id (int): User recorded on the inventory transactions
+        chunk_size (int): Rows per bulk write and commit
+
+    Returns:
+        ImportResult: Created/updated counts and the row errors
+    """
+    result = ImportResult()
+
+    categories = {}
+    for category_id, name in db.session.execute(select(Category.id, Category.name)):
+        categories[str(category_id)] = category_id
+        categories[name.strip().lower()] = category_id
+
+    by_barcode = {}
+    by_sku = {}
+    for product_id, barcode, sku in db.session.execute(select(Product.id, Product.barcode, Product.sku)):
+        if barcode:
+            by_barcode[barcode] = product_id
+        if sku:
+            by_sku[sku] = product_id
+
+    # New products are keyed by negative placeholders until their chunk is
+    # written; the real IDs are taken in that chunk's transaction
+    next_placeholder = -1
+    new_ids = set()
+    inserts = {}
+    updates = {}
+    quantities = {}
+
+    def write_rows(ids):
+        now = datetime.utcnow()
+        if inserts:
+            db.session.execute(insert(Product.__table__), [
+                dict(values, id=ids[placeholder], created_at=now, updated_at=now)
+                for placeholder, values in inserts.items()
+            ])
+            db.session.execute(insert(Inventory.__table__), [
+                {'product_id': ids[placeholder], 'quantity': quantities.get(placeholder, 0), 'last_updated': now}
+                for placeholder in inserts
+            ])
+            transactions = [{
+                'product_id': ids[placeholder],
+                'quantity_before': 0,
+                'quantity_change': quantity,
+                'quantity_after': quantity,
+                'transaction_type': 'adjustment',
+                'reference_type': 'adjustment',
+                'notes': 'الكمية الأولية عند استيراد المنتج',
+                'timestamp': now,
+                'user_id': user_id
+            } for placeholder, quantity in quantities.items() if placeholder in inserts and quantity > 0]
+            if transactions:
+                db.session.execute(insert(InventoryTransaction.__table__), transactions)
+
+        if updates:
+            # Group by the set of columns so every executemany has the same shape
+            groups = {}
+            for values in updates.values():
+                groups.setdefault(tuple(sorted(values)), []).append(dict(values, updated_at=now))
+            for group in groups.values():
+                db.session.execute(update(Product), group)
+
+        changed_ids = list(ids.values()) + list(updates)
+        if changed_ids:
+            index_products([
+                row._asdict() for row in db.session.execute(select(
+                    Product.id, Product.name, Product.description, Product.barcode, Product.sku
+                ).where(Product.id.in_(changed_ids)))
+            ])
+            mark_stock_changed(changed_ids)
+            mark_products_changed(changed_ids)
+
+        db.session.commit()
+
+    def write_chunk():
+        # A product created concurrently can take an ID between reading the
+        # maximum and inserting; the chunk is then rolled back and retried
+        for attempt in range(3):
+            start = (db.session.query(func.max(Product.id)).scalar() or 0) + 1
+            ids = {placeholder: start + offset for offset, placeholder in enumerate(inserts)}
+            try:
+                write_rows(ids)
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == 2:
+                    raise
+
+        # Later rows must match the new products by their real IDs
+        for placeholder, product_id in ids.items():
+            for key, index in (('barcode', by_barcode), ('sku', by_sku)):
+                value = inserts[placeholder].get(key)
+                if value and index.get(value) == placeholder:
+                    index[value] = product_id
+        new_ids.update(ids.values())
+
+        result.created += len(inserts)
+        # Products created in an earlier chunk count as created only
+        result.updated += len(updates.keys() - new_ids)
+        inserts.clear()
+        updates.clear()
+        quantities.clear()
+
+    pending = 0
+    for row_number, raw in rows:
+        try:
+            values = validate_row(raw, categories)
+
+            barcode = values.get('barcode')
+            sku = values.get('sku')
+            barcode_match = by_barcode.get(barcode) if barcode else None
+            sku_match = by_sku.get(sku) if sku else None
+            if barcode_match and sku_match and barcode_match != sku_match:
+                raise ValueError('barcode and SKU belong to different products')
+            product_id = barcode_match or sku_match
+
+            if product_id is None:
+                missing = [field for field in ('purchase_price', 'sale_price', 'quantity') if field not in values]
+                if missing:
+                    raise ValueError(f"{', '.join(missing)} required for new products")
+                product_id = next_placeholder
+                next_placeholder -= 1
+                quantities[product_id] = values.pop('quantity')
+                values.setdefault('min_quantity', 0)
+                inserts[product_id] = values
+            else:
+                values.pop('quantity', None)
+                if product_id in inserts:
+                    inserts[product_id].update(values)
+                else:
+                    updates.setdefault(product_id, {'id': product_id}).update(values)
+        except ValueError as e:
+            result.add_error(row_number, str(e))
+            continue
+
+        # Remember the new keys, so later rows match them
+        if barcode:
+            by_barcode[barcode] = product_id
+        if sku:
+            by_sku[sku] = product_id
+
+        pending += 1
+        if pending >= chunk_size:
+            write_chunk()
+            pending = 0
+
+    write_chunk()
+    return result
@@ -0,0 +1,168 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('sql_profiler')
+
+_route_stats = {}
+_route_stats_lock = threading.Lock()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+# WSGI environ key of the request's profile. The environ outlives the
+# application context, so queries run while a response streams are counted.
+PROFILE_KEY = 'sql_profiler.profile'
+
+
+def fingerprint(statement):
+    """
+    Normalize a SQL statement so that repeated queries compare equal
+
+    Literals become ``?``, IN lists collapse to a single placeholder and
+    whitespace is collapsed.
+
+    Args:
+        statement (str): The SQL statement
+
+    Returns:
+        str: The statement fingerprint
+    """
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('(?)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The start time lives on the execution context, so a statement that
+    # raises leaves nothing behind on the connection
+    if context is not None:
+        context._profiler_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    if not has_request_context():
+        return
+    profile = request.environ.get(PROFILE_KEY)
+    if profile is None:
+        return
+
+    profile['count'] += 1
+    profile['time'] += elapsed
+    profile['fingerprints'][fingerprint(statement)] += 1
+
+def _start_request_profile():
+    request.environ[PROFILE_KEY] = {'count': 0, 'time': 0.0, 'fingerprints': Counter(), 'finished': False}
+
+def _add_profile_headers(response):
+    # A streamed body runs more queries after the headers are sent, so its
+    # count is only final in the log and the route stats
+    profile = request.environ.get(PROFILE_KEY)
+    if profile is not None and not response.is_streamed:
+        response.headers['X-DB-Queries'] = str(profile['count'])
+        response.headers['X-DB-Time'] = f"{profile['time'] * 1000:.1f}"
+    return response
+
+def _finish_request_profile(app):
+    """
+    Log and aggregate the request's profile
+
+    Runs on request teardown, which for a response streamed with
+    stream_with_context is after the last chunk was produced.
+    """
+    profile = request.environ.get(PROFILE_KEY)
+    if profile is None or profile['finished']:
+        return
+    profile['finished'] = True
+
+    threshold = app.config.get('SQL_PROFILER_REPEAT_THRESHOLD', 5)
+    repeated = [
+        (statement, count)
+        for statement, count in profile['fingerprints'].most_common()
+        if count > threshold
+    ]
+    endpoint = request.endpoint or request.path
+    db_time_ms = profile['time'] * 1000
+
+    logger.info('%s %s: %d queries, %.1f ms', request.method, endpoint, profile['count'], db_time_ms)
+    for statement, count in repeated:
+        logger.warning('Possible N+1 in %s: %d executions of %s', endpoint, count, statement)
+
+    with _route_stats_lock:
+        stats = _route_stats.setdefault(endpoint, {
+            'endpoint': endpoint,
+            'requests': 0,
+            'total_queries': 0,
+            'max_queries': 0,
+            'total_time': 0.0,
+            'max_time': 0.0,
+            'n_plus_one_requests': 0,
+            'last_repeated': None
+        })
+        stats['requests'] += 1
+        stats['total_queries'] += profile['count']
+        stats['max_queries'] = max(stats['max_queries'], profile['count'])
+        stats['total_time'] += db_time_ms
+        stats['max_time'] = max(stats['max_time'], db_time_ms)
+        if repeated:
+            stats['n_plus_one_requests'] += 1
+            stats['last_repeated'] = repeated[0]
+
+def init_profiler(app):
+    """
+    Enable per-request SQL profiling when SQL_PROFILER_ENABLED is set
+
+    Every request then gets a log line with its query count and a warning
+    for each statement fingerprint executed more than
+    SQL_PROFILER_REPEAT_THRESHOLD times. Responses that are not streamed
+    also get X-DB-Queries and X-DB-Time headers; for streamed responses the
+    count is only known when the stream ends, in the log and get_route_stats().
+
+    Args:
+        app (Flask): The application
+    """
+    if not app.config.get('SQL_PROFILER_ENABLED'):
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(_start_request_profile)
+    app.after_request(_add_profile_headers)
+    app.teardown_request(lambda exc: _finish_request_profile(app))
+
+def get_route_stats(sort_by='max_queries'):
+    """
+    Get the aggregated profile of every route seen so far in this process
+
+    Args:
+        sort_by (str): Stats key to sort by, descending
+
+    Returns:
+        list: One dict per endpoint, worst first
+    """
+    with _route_stats_lock:
+        stats = [dict(item) for item in _route_stats.values()]
+
+    for item in stats:
+        item['avg_queries'] = item['total_queries'] / item['requests']
+        item['avg_time'] = item['total_time'] / item['requests']
+
+    return sorted(stats, key=lambda item: item.get(sort_by) or 0, reverse=True)
+
+def reset_route_stats():
+    """Clear the aggregated route statistics"""
+    with _route_stats_lock:
+        _route_stats.clear()
@@ -0,0 +1,218 @@
+import threading
+from collections import namedtuple
+from flask import g, has_request_context
+from sqlalchemy import Integer, Text, cast, event, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Category, Customer, Setting, Supplier
+from database import RoutingSession
+
+# Small lists cached in every process, by name
+REFERENCE_MODELS = {
+    'categories': Category,
+    'suppliers': Supplier
+}
+
+# Session.info keys holding the names of lists flushed and not yet bumped,
+# and of lists bumped in the current transaction
+PENDING_KEY = 'reference_data_pending'
+CHANGED_KEY = 'reference_data_changed'
+
+# Sorts after every other character, so it bounds a prefix range from above
+PREFIX_END = '\U0010ffff'
+
+ReferenceItem = namedtuple('ReferenceItem', ['id', 'name'])
+
+_lists = {}
+_lists_lock = threading.Lock()
+
+
+def version_key(name):
+    """Key of the settings row counting writes to a reference list"""
+    return f'{name}_version'
+
+def _read_versions():
+    keys = {version_key(name): name for name in REFERENCE_MODELS}
+    rows = db.session.execute(select(Setting.key, Setting.value).where(Setting.key.in_(keys)))
+    versions = dict.fromkeys(REFERENCE_MODELS, 0)
+    for key, value in rows:
+        versions[keys[key]] = int(value or 0)
+    return versions
+
+def load_reference_list(name, version=None):
+    """
+    Load a reference list in one query and cache it
+
+    Args:
+        name (str): categories or suppliers
+        version (int): The list's version, if it was just read
+
+    Returns:
+        tuple: ReferenceItem(id, name) for every row, ordered by name
+    """
+    model = REFERENCE_MODELS[name]
+    if version is None:
+        version = _read_versions()[name]
+    items = tuple(
+        ReferenceItem(*row)
+        for row in db.session.execute(select(model.id, model.name).order_by(model.name, model.id))
+    )
+    with _lists_lock:
+        _lists[name] = (items, version)
+    return items
+
+def get_reference_list(name):
+    """
+    Get a cached reference list
+
+    The versions of the lists are read in one query at most once per
+    request, and a list is reloaded only when its version has changed.
+
+    Args:
+        name (str): categories or suppliers
+
+    Returns:
+        tuple: ReferenceItem(id, name) for every row, ordered by name
+    """
+    cached = _lists.get(name)
+    if has_request_context():
+        if g.get('reference_versions') is None:
+            g.reference_versions = _read_versions()
+        version = g.reference_versions[name]
+    else:
+        version = _read_versions()[name]
+
+    if cached is None or cached[1] != version:
+        return load_reference_list(name, version)
+    return cached[0]
+
+def reference_choices(name, blank=None):
+    """
+    Get SelectField choices for a reference list
+
+    Args:
+        name (str): categories or suppliers
+        blank (str): Label of a leading choice with the value 0
+
+    Returns:
+        list: (id, name) tuples
+    """
+    choices = [(item.id, item.name) for item in get_reference_list(name)]
+    if blank is not None:
+        choices.insert(0, (0, blank))
+    return choices
+
+def invalidate_reference_list(name=None):
+    """
+    Drop a reference list from this process's cache
+
+    Args:
+        name (str): The list (default: every list)
+    """
+    with _lists_lock:
+        if name is None:
+            _lists.clear()
+        else:
+            _lists.pop(name, None)
+
+def mark_reference_changed(names, session=None):
+    """
+    Bump the versions of reference lists in the current transaction
+
+    Changes made through the ORM are tracked automatically; call this after
+    writing categories or suppliers with Core statements.
+
+    Args:
+        names (iterable): List names
+        session (Session): The session (default: db.session)
+    """
+    session = session or db.session
+    table = Setting.__table__
+    for name in names:
+        # Incremented in SQL, so concurrent writers never reuse a version
+        bump = sqlite_insert(table).values(key=version_key(name), value='1')
+        session.execute(bump.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'value': cast(cast(table.c.value, Integer) + 1, Text)}
+        ))
+    session.info.setdefault(CHANGED_KEY, set()).update(names)
+
+def prefix_filter(column, prefix):
+    """
+    Match values starting with prefix using a range an index can seek
+
+    Unlike LIKE, which SQLite compares case-insensitively, the range works
+    with an ordinary index on the column.
+    """
+    return (column >= prefix) & (column < prefix + PREFIX_END)
+
+def search_customers(query, limit=20):
+    """
+    Find customers whose name or phone starts with the query
+
+    Args:
+        query (str): The typed prefix
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Customer objects, ordered by name
+    """
+    query = query.strip()
+    if not query:
+        return []
+    return (
+        Customer.query
+        .filter(or_(prefix_filter(Customer.name, query), prefix_filter(Customer.phone, query)))
+        .order_by(Customer.name, Customer.id)
+        .limit(limit)
+        .all()
+    )
+
+def existing_ids(model, ids):
+    """
+    Get which of the given IDs exist, in one query
+
+    Args:
+        model: The model class
+        ids (iterable): Submitted IDs
+
+    Returns:
+        set: The IDs that have a row
+    """
+    ids = set(ids)
+    if not ids:
+        return set()
+    return set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changed_lists(session, flush_context):
+    """Record reference lists that had rows added, changed or deleted"""
+    names = {
+        name
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted)
+        for name, model in REFERENCE_MODELS.items()
+        if isinstance(instance, model)
+    }
+    if names:
+        session.info.setdefault(PENDING_KEY, set()).update(names)
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _bump_changed_lists(session):
+    """Bump the versions of changed lists in the committing transaction"""
+    session.flush()
+    names = session.info.pop(PENDING_KEY, None)
+    if names:
+        mark_reference_changed(names, session)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _evict_changed_lists(session):
+    names = session.info.pop(CHANGED_KEY, ())
+    for name in names:
+        invalidate_reference_list(name)
+    if names and has_request_context():
+        g.pop('reference_versions', None)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_changed_lists(session):
+    session.info.pop(CHANGED_KEY, None)
+    session.info.pop(PENDING_KEY, None)
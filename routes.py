@@ -1,15 +1,25 @@
 from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from app import db, login_manager
-from models import User, Product, Category, Supplier, Customer, Purchase, PurchaseItem, Sale, SaleItem, Inventory, InventoryMovement, UserActivity
-from forms import LoginForm, RegisterForm, ProductForm, CategoryForm, SupplierForm, CustomerForm, PurchaseForm, SaleForm
+from app import db, login_manager, wants_json
+from models import User, Product, Category, Supplier, Customer, Purchase, PurchaseItem, Sale, Inventory, InventoryMovement
+from forms import LoginForm, RegisterForm, ProductForm, CategoryForm, SupplierForm, CustomerForm, PurchaseForm
 from datetime import datetime
+from sqlalchemy import insert, update
 from sqlalchemy.sql import func
+from pagination import keyset_paginate
+from stock import increment_stock
+from search import index_product, remove_product_from_index, search_products
+from audit import log_activity
+from user_cache import load_cached_user
+from low_stock import count_low_stock, get_low_stock_products
+from reference_data import reference_choices, search_customers, existing_ids
+from sync import DEFAULT_SYNC_PAGE_SIZE, MAX_SYNC_PAGE_SIZE, compressed_jsonify, get_catalog_changes
+from sale_batch import MAX_BATCH_SALES, upload_sales
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(user_id)
 
 def register_routes(app):
     # مسارات المصادقة
@@ -25,13 +35,7 @@ def register_routes(app):
                 login_user(user, remember=form.remember.data)
                 
                 # تسجيل نشاط تسجيل الدخول
-                activity = UserActivity(
-                    user_id=user.id,
-                    activity_type='login',
-                    description=f'تسجيل دخول المستخدم {user.username}'
-                )
-                db.session.add(activity)
-                db.session.commit()
+                log_activity(user.id, 'login', f'تسجيل دخول المستخدم {user.username}')
                 
                 next_page = request.args.get('next')
                 return redirect(next_page or url_for('dashboard'))
@@ -44,13 +48,7 @@ def register_routes(app):
     @login_required
     def logout():
         # تسجيل نشاط تسجيل الخروج
-        activity = UserActivity(
-            user_id=current_user.id,
-            activity_type='logout',
-            description=f'تسجيل خروج المستخدم {current_user.username}'
-        )
-        db.session.add(activity)
-        db.session.commit()
+        log_activity(current_user.id, 'logout', f'تسجيل خروج المستخدم {current_user.username}')
         
         logout_user()
         return redirect(url_for('login'))
@@ -83,7 +81,7 @@ def register_routes(app):
     def dashboard():
         # إحصائيات سريعة
         products_count = Product.query.count()
-        low_stock_count = Inventory.query.filter(Inventory.quantity <= Inventory.min_quantity).count()
+        low_stock_count = count_low_stock()
         sales_today = Sale.query.filter(Sale.sale_date >= datetime.today().date()).count()
         purchases_pending = Purchase.query.filter_by(status='pending').count()
         
@@ -94,9 +92,7 @@ def register_routes(app):
         recent_purchases = Purchase.query.order_by(Purchase.purchase_date.desc()).limit(5).all()
         
         # المنتجات منخفضة المخزون
-        low_stock_products = db.session.query(Product, Inventory).join(Inventory).filter(
-            Inventory.quantity <= Inventory.min_quantity
-        ).limit(5).all()
+        low_stock_products = get_low_stock_products(limit=5)
         
         return render_template('dashboard.html', 
                               products_count=products_count,
@@ -111,14 +107,26 @@ def register_routes(app):
     @app.route('/products')
     @login_required
     def products():
-        products = db.session.query(Product, Inventory).outerjoin(Inventory).all()
-        return render_template('products/index.html', products=products)
+        query = db.session.query(Product, Inventory).outerjoin(Inventory)
+        page = keyset_paginate(query, Product.created_at, Product.id,
+                               row_key=lambda row: (row[0].created_at, row[0].id))
+        
+        if request.args.get('format') == 'json':
+            return jsonify(page.to_dict(lambda row: {
+                'id': row[0].id,
+                'name': row[0].name,
+                'sku': row[0].sku,
+                'price': row[0].selling_price,
+                'quantity': row[1].quantity if row[1] else 0
+            }))
+        
+        return render_template('products/index.html', products=page.items, page=page)
 
     @app.route('/products/add', methods=['GET', 'POST'])
     @login_required
     def add_product():
         form = ProductForm()
-        form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+        form.category_id.choices = reference_choices('categories')
         
         if form.validate_on_submit():
             product = Product(
@@ -152,12 +160,10 @@ def register_routes(app):
                 db.session.add(movement)
             
             # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='create',
-                description=f'إضافة منتج جديد: {product.name}'
-            )
-            db.session.add(activity)
+            log_activity(current_user.id, 'create', f'إضافة منتج جديد: {product.name}', session=db.session)
+            
+            # تحديث فهرس البحث
+            index_product(product)
             
             db.session.commit()
             flash('تمت إضافة المنتج بنجاح!', 'success')
@@ -172,7 +178,7 @@ def register_routes(app):
         inventory = Inventory.query.filter_by(product_id=id).first()
         
         form = ProductForm(obj=product)
-        form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+        form.category_id.choices = reference_choices('categories')
         
         if form.validate_on_submit():
             product.name = form.name.data
@@ -220,12 +226,10 @@ def register_routes(app):
                     db.session.add(movement)
             
             # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='update',
-                description=f'تعديل منتج: {product.name}'
-            )
-            db.session.add(activity)
+            log_activity(current_user.id, 'update', f'تعديل منتج: {product.name}', session=db.session)
+            
+            # تحديث فهرس البحث
+            index_product(product)
             
             db.session.commit()
             flash('تم تحديث المنتج بنجاح!', 'success')
@@ -250,13 +254,9 @@ def register_routes(app):
             db.session.delete(inventory)
         
         # تسجيل نشاط المستخدم
-        activity = UserActivity(
-            user_id=current_user.id,
-            activity_type='delete',
-            description=f'حذف منتج: {product.name}'
-        )
-        db.session.add(activity)
+        log_activity(current_user.id, 'delete', f'حذف منتج: {product.name}', session=db.session)
         
+        remove_product_from_index(product.id)
         db.session.delete(product)
         db.session.commit()
         
@@ -283,12 +283,7 @@ def register_routes(app):
             db.session.add(category)
             
             # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='create',
-                description=f'إضافة فئة جديدة: {category.name}'
-            )
-            db.session.add(activity)
+            log_activity(current_user.id, 'create', f'إضافة فئة جديدة: {category.name}', session=db.session)
             
             db.session.commit()
             flash('تمت إضافة الفئة بنجاح!', 'success')
@@ -300,8 +295,18 @@ def register_routes(app):
     @app.route('/suppliers')
     @login_required
     def suppliers():
-        suppliers = Supplier.query.all()
-        return render_template('suppliers/index.html', suppliers=suppliers)
+        page = keyset_paginate(Supplier.query, Supplier.created_at, Supplier.id)
+        
+        if request.args.get('format') == 'json':
+            return jsonify(page.to_dict(lambda supplier: {
+                'id': supplier.id,
+                'name': supplier.name,
+                'contact_person': supplier.contact_person,
+                'phone': supplier.phone,
+                'email': supplier.email
+            }))
+        
+        return render_template('suppliers/index.html', suppliers=page.items, page=page)
 
     @app.route('/suppliers/add', methods=['GET', 'POST'])
     @login_required
@@ -319,12 +324,7 @@ def register_routes(app):
             db.session.add(supplier)
             
             # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='create',
-                description=f'إضافة مورد جديد: {supplier.name}'
-            )
-            db.session.add(activity)
+            log_activity(current_user.id, 'create', f'إضافة مورد جديد: {supplier.name}', session=db.session)
             
             db.session.commit()
             flash('تمت إضافة المورد بنجاح!', 'success')
@@ -336,8 +336,17 @@ def register_routes(app):
     @app.route('/customers')
     @login_required
     def customers():
-        customers = Customer.query.all()
-        return render_template('customers/index.html', customers=customers)
+        page = keyset_paginate(Customer.query, Customer.created_at, Customer.id)
+        
+        if request.args.get('format') == 'json':
+            return jsonify(page.to_dict(lambda customer: {
+                'id': customer.id,
+                'name': customer.name,
+                'phone': customer.phone,
+                'email': customer.email
+            }))
+        
+        return render_template('customers/index.html', customers=page.items, page=page)
 
     @app.route('/customers/add', methods=['GET', 'POST'])
     @login_required
@@ -354,12 +363,7 @@ def register_routes(app):
             db.session.add(customer)
             
             # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='create',
-                description=f'إضافة عميل جديد: {customer.name}'
-            )
-            db.session.add(activity)
+            log_activity(current_user.id, 'create', f'إضافة عميل جديد: {customer.name}', session=db.session)
             
             db.session.commit()
             flash('تمت إضافة العميل بنجاح!', 'success')
@@ -371,16 +375,36 @@ def register_routes(app):
     @app.route('/purchases')
     @login_required
     def purchases():
-        purchases = Purchase.query.order_by(Purchase.purchase_date.desc()).all()
-        return render_template('purchases/index.html', purchases=purchases)
+        page = keyset_paginate(Purchase.query, Purchase.purchase_date, Purchase.id)
+        
+        if request.args.get('format') == 'json':
+            return jsonify(page.to_dict(lambda purchase: {
+                'id': purchase.id,
+                'invoice_number': purchase.invoice_number,
+                'supplier_id': purchase.supplier_id,
+                'purchase_date': purchase.purchase_date.isoformat(),
+                'total_amount': purchase.total_amount,
+                'status': purchase.status
+            }))
+        
+        return render_template('purchases/index.html', purchases=page.items, page=page)
 
     @app.route('/purchases/add', methods=['GET', 'POST'])
     @login_required
     def add_purchase():
         form = PurchaseForm()
-        form.supplier_id.choices = [(s.id, s.name) for s in Supplier.query.all()]
+        form.supplier_id.choices = reference_choices('suppliers')
         
         if request.method == 'POST':
+            # التحقق من المورد ومن وجود المنتجات المختارة بالبحث
+            product_ids = {int(product_id) for product_id in request.form.getlist('product_id[]')}
+            if not form.supplier_id.validate(form):
+                flash('المورد المختار غير موجود', 'danger')
+                return redirect(url_for('add_purchase'))
+            if product_ids - existing_ids(Product, product_ids):
+                flash('أحد المنتجات المختارة غير موجود', 'danger')
+                return redirect(url_for('add_purchase'))
+            
             supplier_id = request.form.get('supplier_id')
             invoice_number = request.form.get('invoice_number')
             purchase_date = datetime.strptime(request.form.get('purchase_date'), '%Y-%m-%d')
@@ -426,74 +450,49 @@ def register_routes(app):
             purchase.total_amount = total_amount
             
             # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='create',
-                description=f'إنشاء طلب شراء جديد رقم: {purchase.invoice_number}'
-            )
-            db.session.add(activity)
+            log_activity(current_user.id, 'create', f'إنشاء طلب شراء جديد رقم: {purchase.invoice_number}', session=db.session)
             
             db.session.commit()
             flash('تم إنشاء طلب الشراء بنجاح!', 'success')
             return redirect(url_for('purchases'))
         
-        products = Product.query.all()
-        return render_template('purchases/add.html', form=form, products=products)
+        return render_template('purchases/add.html', form=form)
 
     @app.route('/purchases/receive/<int:id>', methods=['POST'])
     @login_required
     def receive_purchase(id):
         purchase = Purchase.query.get_or_404(id)
         
-        if purchase.status == 'received':
+        # تحديث الحالة بشرط، حتى لا يُستلم الطلب مرتين عند تزامن طلبين
+        claimed = db.session.execute(
+            update(Purchase.__table__).where(
+                Purchase.id == id,
+                Purchase.status != 'received'
+            ).values(status='received')
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
             flash('تم استلام هذا الطلب بالفعل!', 'warning')
             return redirect(url_for('purchases'))
         
-        purchase.status = 'received'
-        
-        # تحديث المخزون
+        # تحديث المخزون بزيادة ذرية (ينشئ سجل المخزون إذا لم يكن موجودًا)
+        received = {}
         for item in purchase.items:
-            inventory = Inventory.query.filter_by(product_id=item.product_id).first()
-            
-            if inventory:
-                # تسجيل حركة المخزون
-                movement = InventoryMovement(
-                    inventory_id=inventory.id,
-                    movement_type='in',
-                    quantity=item.quantity,
-                    reference=f'PO-{purchase.id}',
-                    notes=f'استلام طلب شراء رقم {purchase.invoice_number}'
-                )
-                db.session.add(movement)
-                
-                # تحديث كمية المخزون
-                inventory.quantity += item.quantity
-                inventory.last_stock_update = datetime.utcnow()
-            else:
-                # إنشاء سجل مخزون جديد إذا لم يكن موجودًا
-                inventory = Inventory(
-                    product_id=item.product_id,
-                    quantity=item.quantity
-                )
-                db.session.add(inventory)
-                db.session.flush()
-                
-                movement = InventoryMovement(
-                    inventory_id=inventory.id,
-                    movement_type='in',
-                    quantity=item.quantity,
-                    reference=f'PO-{purchase.id}',
-                    notes=f'استلام طلب شراء رقم {purchase.invoice_number}'
-                )
-                db.session.add(movement)
+            received[item.product_id] = received.get(item.product_id, 0) + item.quantity
+        stock = increment_stock(received)
+        
+        movements = [{
+            'inventory_id': stock[item.product_id].inventory_id,
+            'movement_type': 'in',
+            'quantity': item.quantity,
+            'reference': f'PO-{purchase.id}',
+            'notes': f'استلام طلب شراء رقم {purchase.invoice_number}'
+        } for item in purchase.items if item.product_id in stock]
+        if movements:
+            db.session.execute(insert(InventoryMovement), movements)
         
         # تسجيل نشاط المستخدم
-        activity = UserActivity(
-            user_id=current_user.id,
-            activity_type='update',
-            description=f'استلام طلب شراء رقم: {purchase.invoice_number}'
-        )
-        db.session.add(activity)
+        log_activity(current_user.id, 'update', f'استلام طلب شراء رقم: {purchase.invoice_number}', session=db.session)
         
         db.session.commit()
         flash('تم استلام الطلب وتحديث المخزون بنجاح!', 'success')
@@ -503,100 +502,37 @@ def register_routes(app):
     @app.route('/sales')
     @login_required
     def sales():
-        sales = Sale.query.order_by(Sale.sale_date.desc()).all()
-        return render_template('sales/index.html', sales=sales)
-
-    @app.route('/sales/add', methods=['GET', 'POST'])
-    @login_required
-    def add_sale():
-        form = SaleForm()
-        form.customer_id.choices = [(c.id, c.name) for c in Customer.query.all()]
-        
-        if request.method == 'POST':
-            customer_id = request.form.get('customer_id')
-            invoice_number = request.form.get('invoice_number')
-            sale_date = datetime.strptime(request.form.get('sale_date'), '%Y-%m-%d')
-            notes = request.form.get('notes')
-            
-            # إنشاء فاتورة بيع جديدة
-            sale = Sale(
-                customer_id=customer_id,
-                invoice_number=invoice_number,
-                sale_date=sale_date,
-                notes=notes,
-                created_by=current_user.id,
-                status='completed'
-            )
-            db.session.add(sale)
-            db.session.flush()  # للصول على معرف الفاتورة
-            
-            # معالجة عناصر الفاتورة
-            product_ids = request.form.getlist('product_id[]')
-            quantities = request.form.getlist('quantity[]')
-            unit_prices = request.form.getlist('unit_price[]')
-            
-            total_amount = 0
-            inventory_error = False
-            
-            for i in range(len(product_ids)):
-                product_id = int(product_ids[i])
-                quantity = int(quantities[i])
-                unit_price = float(unit_prices[i])
-                total_price = quantity * unit_price
-                
-                # التحقق من توفر المخزون
-                inventory = Inventory.query.filter_by(product_id=product_id).first()
-                if not inventory or inventory.quantity < quantity:
-                    inventory_error = True
-                    flash(f'المنتج غير متوفر بالكمية المطلوبة: {Product.query.get(product_id).name}', 'danger')
-                    continue
-                
-                # إضافة عنصر الفاتورة
-                sale_item = SaleItem(
-                    sale_id=sale.id,
-                    product_id=product_id,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    total_price=total_price
-                )
-                db.session.add(sale_item)
-                
-                # تحديث المخزون
-                inventory.quantity -= quantity
-                inventory.last_stock_update = datetime.utcnow()
-                
-                # تسجيل حركة المخزون
-                movement = InventoryMovement(
-                    inventory_id=inventory.id,
-                    movement_type='out',
-                    quantity=quantity,
-                    reference=f'INV-{sale.id}',
-                    notes=f'بيع - فاتورة رقم {sale.invoice_number}'
-                )
-                db.session.add(movement)
-                
-                total_amount += total_price
-            
-            if inventory_error:
-                db.session.rollback()
-                return redirect(url_for('add_sale'))
-            
-            sale.total_amount = total_amount
-            
-            # تسجيل نشاط المستخدم
-            activity = UserActivity(
-                user_id=current_user.id,
-                activity_type='create',
-                description=f'إنشاء فاتورة بيع جديدة رقم: {sale.invoice_number}'
-            )
-            db.session.add(activity)
-            
-            db.session.commit()
-            flash('تم إنشاء فاتورة البيع بنجاح!', 'success')
-            return redirect(url_for('sales'))
-        
-        products = db.session.query(Product, Inventory).join(Inventory).filter(Inventory.quantity > 0).all()
-        return render_template('sales/add.html', form=form, products=products)
+        page = keyset_paginate(Sale.query, Sale.sale_date, Sale.id)
+        
+        if request.args.get('format') == 'json':
+            return jsonify(page.to_dict(lambda sale: {
+                'id': sale.id,
+                'invoice_number': sale.invoice_number,
+                'customer_id': sale.customer_id,
+                'sale_date': sale.sale_date.isoformat(),
+                'total_amount': sale.total_amount,
+                'status': sale.status
+            }))
+        
+        return render_template('sales/index.html', sales=page.items, page=page)
+
+    @app.route('/api/sales/batch', methods=['POST'])
+    @login_required
+    def api_sales_batch():
+        # رفع فواتير البيع المسجلة أثناء انقطاع الاتصال، مع مفتاح فريد لكل فاتورة
+        data = request.get_json(silent=True) or {}
+        sales = data.get('sales') if isinstance(data, dict) else None
+        if not isinstance(sales, list):
+            return jsonify({'error': 'sales must be a list of sale objects'}), 400
+        if len(sales) > MAX_BATCH_SALES:
+            return jsonify({'error': f'At most {MAX_BATCH_SALES} sales can be uploaded at once'}), 413
+        
+        results = upload_sales(sales, user_id=current_user.id)
+        counts = {status: 0 for status in ('created', 'duplicate', 'rejected', 'retry')}
+        for result in results:
+            counts[result['status']] += 1
+        
+        return jsonify(dict(counts, results=results))
 
     @app.route('/sales/view/<int:id>')
     @login_required
@@ -604,48 +540,6 @@ def register_routes(app):
         sale = Sale.query.get_or_404(id)
         return render_template('sales/view.html', sale=sale)
 
-    @app.route('/sales/cancel/<int:id>', methods=['POST'])
-    @login_required
-    def cancel_sale(id):
-        sale = Sale.query.get_or_404(id)
-        
-        if sale.status == 'cancelled':
-            flash('تم إلغاء هذه الفاتورة بالفعل!', 'warning')
-            return redirect(url_for('sales'))
-        
-        sale.status = 'cancelled'
-        
-        # إعادة المنتجات للمخزون
-        for item in sale.items:
-            inventory = Inventory.query.filter_by(product_id=item.product_id).first()
-            
-            if inventory:
-                # تسجيل حركة المخزون
-                movement = InventoryMovement(
-                    inventory_id=inventory.id,
-                    movement_type='in',
-                    quantity=item.quantity,
-                    reference=f'INV-CANCEL-{sale.id}',
-                    notes=f'إلغاء فاتورة بيع رقم {sale.invoice_number}'
-                )
-                db.session.add(movement)
-                
-                # تحديث كمية المخزون
-                inventory.quantity += item.quantity
-                inventory.last_stock_update = datetime.utcnow()
-        
-        # تسجيل نشاط المستخدم
-        activity = UserActivity(
-            user_id=current_user.id,
-            activity_type='update',
-            description=f'إلغاء فاتورة بيع رقم: {sale.invoice_number}'
-        )
-        db.session.add(activity)
-        
-        db.session.commit()
-        flash('تم إلغاء الفاتورة وإعادة المنتجات للمخزون بنجاح!', 'success')
-        return redirect(url_for('sales'))
-
     # مسارات المخزون والجرد
     @app.route('/inventory')
     @login_required
@@ -653,21 +547,6 @@ def register_routes(app):
         inventory_items = db.session.query(Product, Inventory).join(Inventory).all()
         return render_template('inventory/index.html', inventory_items=inventory_items)
 
-    @app.route('/inventory/movements')
-    @login_required
-    def inventory_movements():
-        movements = db.session.query(
-            InventoryMovement, Inventory, Product
-        ).join(
-            Inventory, InventoryMovement.inventory_id == Inventory.id
-        ).join(
-            Product, Inventory.product_id == Product.id
-        ).order_by(
-            InventoryMovement.timestamp.desc()
-        ).all()
-        
-        return render_template('inventory/movements.html', movements=movements)
-
     @app.route('/inventory/adjust/<int:product_id>', methods=['GET', 'POST'])
     @login_required
     def adjust_inventory(product_id):
@@ -700,12 +579,7 @@ def register_routes(app):
                     inventory.last_stock_update = datetime.utcnow()
                     
                     # تسجيل نشاط المستخدم
-                    activity = UserActivity(
-                        user_id=current_user.id,
-                        activity_type='update',
-                        description=f'تعديل مخزون المنتج: {product.name} من {old_quantity} إلى {new_quantity}'
-                    )
-                    db.session.add(activity)
+                    log_activity(current_user.id, 'update', f'تعديل مخزون المنتج: {product.name} من {old_quantity} إلى {new_quantity}', session=db.session)
                     
                     db.session.commit()
                     flash('تم تعديل المخزون بنجاح!', 'success')
@@ -788,65 +662,6 @@ def register_routes(app):
         
         return render_template('reports/inventory.html', inventory_items=inventory_items)
 
-    @app.route('/reports/profit')
-    @login_required
-    def profit_report():
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        # استعلام المبيعات
-        sales_query = db.session.query(
-            SaleItem.product_id,
-            func.sum(SaleItem.quantity).label('sold_quantity'),
-            func.sum(SaleItem.total_price).label('sales_amount')
-        ).join(
-            Sale, SaleItem.sale_id == Sale.id
-        ).filter(
-            Sale.status == 'completed'
-        )
-        
-        if start_date:
-            sales_query = sales_query.filter(Sale.sale_date >= datetime.strptime(start_date, '%Y-%m-%d'))
-        
-        if end_date:
-            sales_query = sales_query.filter(Sale.sale_date <= datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-        
-        sales_data = sales_query.group_by(SaleItem.product_id).all()
-        
-        # استعلام تكلفة المنتجات المباعة
-        product_costs = {}
-        total_sales = 0
-        total_cost = 0
-        total_profit = 0
-        
-        profit_data = []
-        
-        for product_id, sold_quantity, sales_amount in sales_data:
-            product = Product.query.get(product_id)
-            cost_amount = sold_quantity * product.purchase_price
-            profit = sales_amount - cost_amount
-            
-            profit_data.append({
-                'product': product,
-                'sold_quantity': sold_quantity,
-                'sales_amount': sales_amount,
-                'cost_amount': cost_amount,
-                'profit': profit,
-                'profit_margin': (profit / sales_amount) * 100 if sales_amount > 0 else 0
-            })
-            
-            total_sales += sales_amount
-            total_cost += cost_amount
-            total_profit += profit
-        
-        return render_template('reports/profit.html', 
-                              profit_data=profit_data,
-                              total_sales=total_sales,
-                              total_cost=total_cost,
-                              total_profit=total_profit,
-                              start_date=start_date,
-                              end_date=end_date)
-
     # مسارات المستخدمين والأنشطة
     @app.route('/users')
     @login_required
@@ -858,89 +673,45 @@ def register_routes(app):
         users = User.query.all()
         return render_template('users/index.html', users=users)
 
-    @app.route('/activities')
-    @login_required
-    def activities():
-        if current_user.role != 'admin':
-            flash('ليس لديك صلاحية للوصول إلى هذه الصفحة.', 'danger')
-            return redirect(url_for('dashboard'))
-        
-        activities = db.session.query(
-            UserActivity, User
-        ).join(
-            User, UserActivity.user_id == User.id
-        ).order_by(
-            UserActivity.timestamp.desc()
-        ).limit(100).all()
-        
-        return render_template('activities/index.html', activities=activities)
-
     # واجهات برمجة التطبيقات API
-    @app.route('/api/products')
+    @app.route('/api/products/search')
     @login_required
-    def api_products():
-        products = db.session.query(
-            Product.id,
-            Product.name,
-            Product.sku,
-            Product.selling_price,
-            Inventory.quantity
-        ).join(
-            Inventory
-        ).filter(
-            Inventory.quantity > 0
-        ).all()
-        
-        products_list = [{
-            'id': p.id,
-            'name': p.name,
-            'sku': p.sku,
-            'price': p.selling_price,
-            'quantity': p.quantity
-        } for p in products]
+    def api_products_search():
+        search_query = request.args.get('q', '').strip()
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        results = search_products(search_query, limit=limit) if search_query else []
         
-        return jsonify(products_list)
-
-    @app.route('/api/product/<int:id>')
-    @login_required
-    def api_product(id):
-        product = Product.query.get_or_404(id)
-        inventory = Inventory.query.filter_by(product_id=id).first()
-        
-        product_data = {
+        return jsonify([{
             'id': product.id,
             'name': product.name,
             'sku': product.sku,
-            'description': product.description,
-            'purchase_price': product.purchase_price,
-            'selling_price': product.selling_price,
-            'quantity': inventory.quantity if inventory else 0
-        }
-        
-        return jsonify(product_data)
+            'barcode': product.barcode,
+            'price': product.selling_price
+        } for product in results])
 
-    @app.route('/api/low-stock')
+    @app.route('/api/sync/products')
     @login_required
-    def api_low_stock():
-        low_stock = db.session.query(
-            Product.id,
-            Product.name,
-            Inventory.quantity,
-            Inventory.min_quantity
-        ).join(
-            Inventory
-        ).filter(
-            Inventory.quantity <= Inventory.min_quantity
-        ).all()
+    def api_sync_products():
+        # تغييرات المنتجات والأسعار والمخزون منذ آخر مزامنة لنقاط البيع
+        limit = max(1, min(request.args.get('limit', DEFAULT_SYNC_PAGE_SIZE, type=int), MAX_SYNC_PAGE_SIZE))
+        try:
+            page = get_catalog_changes(request.args.get('cursor'), limit=limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        low_stock_list = [{
-            'id': p.id,
-            'name': p.name,
-            'quantity': p.quantity,
-            'min_quantity': p.min_quantity
-        } for p in low_stock]
+        return compressed_jsonify(page)
+
+    @app.route('/api/customers/search')
+    @login_required
+    def api_customers_search():
+        search_query = request.args.get('q', '')
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
         
-        return jsonify(low_stock_list)
+        return jsonify([{
+            'id': customer.id,
+            'name': customer.name,
+            'phone': customer.phone
+        } for customer in search_customers(search_query, limit=limit)])
 
     # صفحة الطباعة
     @app.route('/print/invoice/<int:id>')
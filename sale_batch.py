@@ -0,0 +1,327 @@
+import math
+from datetime import date, datetime
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DBAPIError
+from models import db, Customer, Sale, SaleItem, SaleUploadKey, InventoryMovement
+from stock import load_stock_levels, decrement_stock, InsufficientStockError
+from summaries import apply_sale_to_summary, apply_sale_items_to_product_sales
+from reference_data import existing_ids
+from audit import log_activity
+
+# Sales validated and written per transaction
+SALE_BATCH_CHUNK_SIZE = 100
+
+# Largest number of sales accepted in one upload
+MAX_BATCH_SALES = 1000
+
+MAX_KEY_LENGTH = 64
+
+PAYMENT_METHODS = ('cash', 'card', 'transfer')
+
+# SQLite errors a concurrent upload or sale can cause; the chunk is retried
+CONFLICT_ERRORS = ('UNIQUE constraint failed', 'database is locked', 'database table is locked')
+
+
+def _parse_date(value):
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).date() if 'T' in value else date.fromisoformat(value)
+        except ValueError:
+            pass
+    raise ValueError('sale_date must be an ISO date')
+
+def _whole_number(value):
+    if isinstance(value, bool):
+        raise TypeError('not a number')
+    if isinstance(value, int):
+        return value
+    number = float(value)
+    if not math.isfinite(number) or not number.is_integer():
+        raise ValueError('not a whole number')
+    return int(number)
+
+def _finite_number(value):
+    if isinstance(value, bool):
+        raise TypeError('not a number')
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError('not a finite number')
+    return number
+
+def _is_conflict(error):
+    """Whether a failed chunk collided with a concurrent writer rather than holding bad data"""
+    if isinstance(error, InsufficientStockError):
+        return True
+    message = str(getattr(error, 'orig', error))
+    return any(conflict in message for conflict in CONFLICT_ERRORS)
+
+def parse_sale(data):
+    """
+    Validate one uploaded sale
+
+    Args:
+        data (dict): key, invoice_number, sale_date, items (list of
+            {product_id, quantity, price}) and optionally customer_id,
+            payment_method and notes
+
+    Returns:
+        dict: The cleaned sale
+
+    Raises:
+        ValueError: If the sale is invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError('sale must be an object')
+
+    key = data.get('key')
+    if not isinstance(key, str) or not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f'key must be a string of 1 to {MAX_KEY_LENGTH} characters')
+
+    invoice_number = str(data.get('invoice_number') or '').strip()
+    if not invoice_number or len(invoice_number) > 50:
+        raise ValueError('invoice_number must be 1 to 50 characters')
+
+    payment_method = data.get('payment_method') or 'cash'
+    if payment_method not in PAYMENT_METHODS:
+        raise ValueError(f'payment_method must be one of {", ".join(PAYMENT_METHODS)}')
+
+    customer_id = data.get('customer_id')
+    if customer_id is not None and (not isinstance(customer_id, int) or isinstance(customer_id, bool)):
+        raise ValueError('customer_id must be an integer')
+
+    notes = data.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        raise ValueError('notes must be a string')
+
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('items must be a non-empty list')
+    lines = []
+    for item in items:
+        try:
+            product_id = _whole_number(item['product_id'])
+            quantity = _whole_number(item['quantity'])
+            price = _finite_number(item['price'])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise ValueError('each item needs a whole product_id and quantity and a finite numeric price')
+        if quantity <= 0 or price < 0:
+            raise ValueError('item quantities must be positive and prices not negative')
+        if not math.isfinite(quantity * price):
+            raise ValueError('item total is too large')
+        lines.append((product_id, quantity, price))
+
+    return {
+        'key': key.strip(),
+        'invoice_number': invoice_number,
+        'sale_date': _parse_date(data.get('sale_date')),
+        'customer_id': customer_id or None,
+        'payment_method': payment_method,
+        'notes': notes,
+        'lines': lines
+    }
+
+def _apply_chunk(chunk, user_id):
+    """
+    Write the new sales of a chunk in the current transaction
+
+    Args:
+        chunk (list): (index, parsed sale) tuples
+        user_id (int): The uploading user
+
+    Returns:
+        dict: index -> result dict
+
+    Raises:
+        IntegrityError: If another upload stored one of the keys first
+        InsufficientStockError: If a concurrent sale took the stock first
+        OperationalError: If another writer holds or took the write lock
+    """
+    results = {}
+
+    keys = [sale['key'] for _, sale in chunk]
+    stored = dict(db.session.execute(
+        select(SaleUploadKey.key, SaleUploadKey.sale_id).where(SaleUploadKey.key.in_(keys))
+    ).all())
+
+    pending = []
+    for index, sale in chunk:
+        if sale['key'] in stored:
+            results[index] = {'index': index, 'key': sale['key'], 'status': 'duplicate', 'sale_id': stored[sale['key']]}
+        else:
+            pending.append((index, sale))
+    if not pending:
+        return results
+
+    customers = existing_ids(Customer, {sale['customer_id'] for _, sale in pending if sale['customer_id']})
+    stock = load_stock_levels({product_id for _, sale in pending for product_id, _, _ in sale['lines']})
+    available = {product_id: row.quantity for product_id, row in stock.items() if row.inventory_id is not None}
+
+    # Sales are accepted in upload order while the stock lasts
+    accepted = []
+    for index, sale in pending:
+        requested = {}
+        for product_id, quantity, _ in sale['lines']:
+            requested[product_id] = requested.get(product_id, 0) + quantity
+
+        error = None
+        if sale['customer_id'] and sale['customer_id'] not in customers:
+            error = f'Unknown customer: {sale["customer_id"]}'
+        else:
+            for product_id, quantity in requested.items():
+                if product_id not in stock:
+                    error = f'Unknown product: {product_id}'
+                elif available.get(product_id, 0) < quantity:
+                    error = f'Insufficient stock for product: {stock[product_id].name}'
+                if error:
+                    break
+
+        if error:
+            results[index] = {'index': index, 'key': sale['key'], 'status': 'rejected', 'error': error}
+            continue
+        for product_id, quantity in requested.items():
+            available[product_id] -= quantity
+        accepted.append((index, sale, requested))
+    if not accepted:
+        return results
+
+    # One conditional decrement per product for the whole chunk. It is the
+    # chunk's first write, so the transaction now holds SQLite's write lock
+    # and the sale IDs below cannot be taken by another writer.
+    totals = {}
+    for _, _, requested in accepted:
+        for product_id, quantity in requested.items():
+            totals[product_id] = totals.get(product_id, 0) + quantity
+    decrement_stock(totals)
+
+    next_id = (db.session.execute(select(func.max(Sale.id))).scalar() or 0) + 1
+    sale_ids = list(range(next_id, next_id + len(accepted)))
+
+    db.session.execute(insert(Sale.__table__), [{
+        'id': sale_id,
+        'invoice_number': sale['invoice_number'],
+        'customer_id': sale['customer_id'],
+        'sale_date': sale['sale_date'],
+        'total_amount': sum(quantity * price for _, quantity, price in sale['lines']),
+        'payment_method': sale['payment_method'],
+        'status': 'completed',
+        'notes': sale['notes']
+    } for (_, sale, _), sale_id in zip(accepted, sale_ids)])
+
+    db.session.execute(insert(SaleUploadKey.__table__), [
+        {'key': sale['key'], 'sale_id': sale_id}
+        for (_, sale, _), sale_id in zip(accepted, sale_ids)
+    ])
+
+    # The unit cost is stored with each item so later price changes do not rewrite the profit
+    unit_costs = {product_id: stock[product_id].purchase_price or 0 for product_id in totals}
+    db.session.execute(insert(SaleItem.__table__), [
+        {'sale_id': sale_id, 'product_id': product_id, 'quantity': quantity, 'price': price,
+         'cost': unit_costs[product_id]}
+        for (_, sale, _), sale_id in zip(accepted, sale_ids)
+        for product_id, quantity, price in sale['lines']
+    ])
+
+    db.session.execute(insert(InventoryMovement.__table__), [{
+        'inventory_id': stock[product_id].inventory_id,
+        'movement_type': 'out',
+        'quantity': quantity,
+        'reference': f'INV-{sale_id}',
+        'notes': f'بيع - فاتورة رقم {sale["invoice_number"]}'
+    } for (_, sale, requested), sale_id in zip(accepted, sale_ids) for product_id, quantity in requested.items()])
+
+    # Summary rows are upserted once per sale date
+    by_date = {}
+    for _, sale, _ in accepted:
+        by_date.setdefault(sale['sale_date'], []).append(sale)
+    for sale_date, sales in by_date.items():
+        lines = [
+            (product_id, quantity, quantity * price, quantity * unit_costs[product_id])
+            for sale in sales for product_id, quantity, price in sale['lines']
+        ]
+        apply_sale_to_summary(
+            sale_date,
+            sum(line[2] for line in lines),
+            sum(line[1] for line in lines),
+            sum(line[3] for line in lines),
+            sales_count=len(sales)
+        )
+        apply_sale_items_to_product_sales(sale_date, lines)
+
+    log_activity(user_id, 'create', f'رفع {len(accepted)} فاتورة بيع من نقطة البيع', session=db.session)
+
+    for (index, sale, _), sale_id in zip(accepted, sale_ids):
+        results[index] = {'index': index, 'key': sale['key'], 'status': 'created', 'sale_id': sale_id}
+    return results
+
+def upload_sales(sales, user_id=None, chunk_size=SALE_BATCH_CHUNK_SIZE):
+    """
+    Create a batch of sales recorded offline, skipping ones already uploaded
+
+    Each sale carries a key generated by the till. A key that is already
+    stored is answered with its sale, so an upload can be retried safely.
+    Sales are validated and written chunk_size at a time, each chunk in one
+    transaction with bulk statements; a sale that is invalid or short of
+    stock is rejected without affecting the others. A chunk that collides
+    with a concurrent upload or sale is rolled back and tried once more; a
+    chunk that fails for any other reason is written one sale at a time so
+    only the sale at fault is rejected.
+
+    Args:
+        sales (list): Sale dicts, as described in parse_sale()
+        user_id (int): The uploading user
+        chunk_size (int): Sales per transaction
+
+    Returns:
+        list: One result per sale, in upload order, with index, key, status
+            (created, duplicate, rejected or retry) and sale_id or error
+    """
+    results = [None] * len(sales)
+    chunk = []
+    seen = set()
+
+    def flush(chunk):
+        for attempt in range(2):
+            try:
+                chunk_results = _apply_chunk(chunk, user_id)
+                db.session.commit()
+                break
+            except (DBAPIError, InsufficientStockError) as e:
+                db.session.rollback()
+                if _is_conflict(e):
+                    continue
+                if len(chunk) > 1:
+                    for item in chunk:
+                        flush([item])
+                    return
+                index, sale = chunk[0]
+                chunk_results = {index: {'index': index, 'key': sale['key'], 'status': 'rejected',
+                                         'error': 'The sale could not be stored'}}
+                break
+        else:
+            chunk_results = {
+                index: {'index': index, 'key': sale['key'], 'status': 'retry', 'error': 'Conflicting update, upload again'}
+                for index, sale in chunk
+            }
+        for index, result in chunk_results.items():
+            results[index] = result
+
+    for index, data in enumerate(sales):
+        try:
+            sale = parse_sale(data)
+        except ValueError as e:
+            key = data.get('key') if isinstance(data, dict) else None
+            results[index] = {'index': index, 'key': key, 'status': 'rejected', 'error': str(e)}
+            continue
+        if sale['key'] in seen:
+            results[index] = {'index': index, 'key': sale['key'], 'status': 'rejected', 'error': 'Key repeated in the upload'}
+            continue
+        seen.add(sale['key'])
+
+        chunk.append((index, sale))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    return results
@@ -0,0 +1,217 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import OperationalError
+from models import db, Product
+
+# Arabic diacritics (tashkeel), superscript alef and tatweel
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+
+ARABIC_LETTER_MAP = str.maketrans({
+    '\u0623': '\u0627',  # alef with hamza above
+    '\u0625': '\u0627',  # alef with hamza below
+    '\u0622': '\u0627',  # alef with madda
+    '\u0671': '\u0627',  # alef wasla
+    '\u0624': '\u0648',  # waw with hamza
+    '\u0626': '\u064A',  # yeh with hamza
+    '\u0649': '\u064A',  # alef maqsura
+    '\u0629': '\u0647',  # taa marbuta
+})
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Column weights for bm25 ranking: name, description, barcode, sku
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+
+def normalize_arabic(value):
+    """
+    Normalize text for searching
+
+    Strips Arabic diacritics and tatweel, unifies the alef/hamza forms,
+    alef maqsura and taa marbuta, and lowercases Latin characters.
+
+    Args:
+        value (str): Text to normalize
+
+    Returns:
+        str: The normalized text
+    """
+    if not value:
+        return ''
+    value = ARABIC_DIACRITICS.sub('', value)
+    return value.translate(ARABIC_LETTER_MAP).lower()
+
+def ensure_search_index():
+    """Create the products_fts virtual table if it does not exist"""
+    db.session.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+        "name, description, barcode, sku, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    db.session.commit()
+
+def index_product(product):
+    """
+    Add or refresh a product in the search index
+
+    Runs in the current session, so it is committed with the product change.
+
+    Args:
+        product (Product): The product to index (must have an id)
+    """
+    remove_product_from_index(product.id)
+    db.session.execute(text(
+        "INSERT INTO products_fts (rowid, name, description, barcode, sku) "
+        "VALUES (:id, :name, :description, :barcode, :sku)"
+    ), {
+        'id': product.id,
+        'name': normalize_arabic(product.name),
+        'description': normalize_arabic(product.description),
+        'barcode': normalize_arabic(product.barcode),
+        'sku': normalize_arabic(product.sku)
+    })
+
+def index_products(products):
+    """
+    Add or refresh many products in the search index
+
+    Args:
+        products (list): Dicts with id, name, description, barcode and sku
+    """
+    if not products:
+        return
+    db.session.execute(
+        text("DELETE FROM products_fts WHERE rowid = :id"),
+        [{'id': product['id']} for product in products]
+    )
+    db.session.execute(text(
+        "INSERT INTO products_fts (rowid, name, description, barcode, sku) "
+        "VALUES (:id, :name, :description, :barcode, :sku)"
+    ), [{
+        'id': product['id'],
+        'name': normalize_arabic(product.get('name')),
+        'description': normalize_arabic(product.get('description')),
+        'barcode': normalize_arabic(product.get('barcode')),
+        'sku': normalize_arabic(product.get('sku'))
+    } for product in products])
+
+def remove_product_from_index(product_id):
+    """Remove a product from the search index"""
+    db.session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {'id': product_id})
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Rebuild the search index from the products table
+
+    Args:
+        batch_size (int): Number of products inserted per statement
+
+    Returns:
+        int: Number of products indexed
+    """
+    ensure_search_index()
+    db.session.execute(text("DELETE FROM products_fts"))
+
+    statement = text(
+        "INSERT INTO products_fts (rowid, name, description, barcode, sku) "
+        "VALUES (:id, :name, :description, :barcode, :sku)"
+    )
+    rows = db.session.query(
+        Product.id, Product.name, Product.description, Product.barcode, Product.sku
+    ).execution_options(yield_per=batch_size)
+
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append({
+            'id': row.id,
+            'name': normalize_arabic(row.name),
+            'description': normalize_arabic(row.description),
+            'barcode': normalize_arabic(row.barcode),
+            'sku': normalize_arabic(row.sku)
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(statement, batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        db.session.execute(statement, batch)
+        count += len(batch)
+
+    db.session.commit()
+    return count
+
+def build_match_query(query):
+    """
+    Build an FTS5 MATCH expression from user input
+
+    Every token becomes a quoted prefix term, and all terms must match.
+
+    Args:
+        query (str): The raw search text
+
+    Returns:
+        str: The MATCH expression, or None if the query has no tokens
+    """
+    tokens = TOKEN_PATTERN.findall(normalize_arabic(query))
+    if not tokens:
+        return None
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+def search_product_ids(query, limit=20):
+    """
+    Search the product index
+
+    Args:
+        query (str): The raw search text
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Matching product IDs, best match first
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    try:
+        rows = db.session.execute(text(
+            "SELECT rowid FROM products_fts WHERE products_fts MATCH :match "
+            "ORDER BY bm25(products_fts, {}) LIMIT :limit".format(', '.join(str(w) for w in RANK_WEIGHTS))
+        ), {'match': match, 'limit': limit})
+        return [row[0] for row in rows]
+    except OperationalError:
+        # The index is missing (e.g. SQLite built without FTS5); fall back to a plain scan
+        db.session.rollback()
+        pattern = f'%{query}%'
+        rows = db.session.query(Product.id).filter(db.or_(
+            Product.name.like(pattern),
+            Product.barcode.like(pattern),
+            Product.sku.like(pattern)
+        )).limit(limit)
+        return [row.id for row in rows]
+
+def search_products(query, limit=20):
+    """
+    Search for products, ranked by relevance
+
+    Args:
+        query (str): The raw search text
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Matching Product objects with their category and inventory
+            loaded, best match first
+    """
+    product_ids = search_product_ids(query, limit)
+    if not product_ids:
+        return []
+
+    products = {
+        product.id: product
+        for product in Product.query.options(
+            joinedload(Product.category), joinedload(Product.inventory)
+        ).filter(Product.id.in_(product_ids))
+    }
+    return [products[product_id] for product_id in product_ids if product_id in products]
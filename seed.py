@@ -0,0 +1,255 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from models import (db, Category, Product, Supplier, Customer, Purchase, PurchaseItem, Sale, SaleItem,
+                    Inventory, InventoryMovement)
+from summaries import rebuild_daily_sales_summary, rebuild_product_daily_sales
+from search import rebuild_search_index
+from low_stock import rebuild_low_stock
+from reference_data import mark_reference_changed
+
+# Rows per executemany round trip
+SEED_BATCH_SIZE = 5000
+
+CATEGORY_NAMES = [
+    'مواد غذائية', 'مشروبات', 'منظفات', 'أدوات منزلية', 'قرطاسية', 'إلكترونيات',
+    'ملابس', 'أحذية', 'مستحضرات تجميل', 'أدوية', 'ألعاب', 'عطور'
+]
+PRODUCT_WORDS = [
+    'أرز', 'سكر', 'شاي', 'قهوة', 'زيت', 'حليب', 'صابون', 'شامبو', 'دفتر', 'قلم',
+    'Rice', 'Sugar', 'Tea', 'Coffee', 'Oil', 'Milk', 'Soap', 'Shampoo', 'Notebook', 'Pen'
+]
+PRODUCT_SIZES = ['صغير', 'متوسط', 'كبير', '250g', '500g', '1kg', '2kg', '1L', '2L']
+FIRST_NAMES = ['محمد', 'أحمد', 'علي', 'فاطمة', 'عائشة', 'خالد', 'سارة', 'عمر', 'مريم', 'يوسف']
+LAST_NAMES = ['الطرابلسي', 'المصراتي', 'البنغازي', 'الزاوي', 'السبهاوي', 'الغرياني']
+PAYMENT_METHODS = ['cash', 'cash', 'cash', 'card', 'transfer']
+
+
+def _next_id(model):
+    """Get the first free primary key of a table"""
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+def _insert_batches(model, rows, batch_size):
+    """
+    Insert rows with one executemany per batch
+
+    Args:
+        model: The model whose table receives the rows
+        rows (iterable): Row dicts, consumed lazily
+        batch_size (int): Number of rows per executemany
+
+    Returns:
+        int: Number of rows inserted
+    """
+    statement = insert(model.__table__)
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(statement, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(statement, batch)
+        count += len(batch)
+    return count
+
+def seed_database(products=1000, sales=5000, purchases=500, customers=500, suppliers=50,
+                  items_per_sale=3, days=365, seed=42, batch_size=SEED_BATCH_SIZE):
+    """
+    Bulk-insert a synthetic dataset
+
+    Rows are generated from a fixed random seed, so the same arguments give
+    the same data on every run and benchmark results stay comparable across
+    commits. Everything is inserted with Core executemany statements; new
+    rows get IDs after the existing ones, so seeding an empty database twice
+    doubles it.
+
+    Args:
+        products (int): Number of products (each gets an inventory row)
+        sales (int): Number of sales
+        purchases (int): Number of purchases
+        customers (int): Number of customers
+        suppliers (int): Number of suppliers
+        items_per_sale (int): Average number of items per sale or purchase
+        days (int): Spread sale and purchase dates over this many past days
+        seed (int): Random seed
+        batch_size (int): Number of rows per executemany
+
+    Returns:
+        dict: Number of rows inserted per table
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    today = now.date()
+    counts = {}
+
+    # Categories
+    category_start = _next_id(Category)
+    counts['categories'] = _insert_batches(Category, (
+        {'id': category_start + i, 'name': name, 'description': None}
+        for i, name in enumerate(CATEGORY_NAMES)
+    ), batch_size)
+    category_ids = list(range(category_start, category_start + len(CATEGORY_NAMES)))
+
+    # Products and their inventory rows
+    product_start = _next_id(Product)
+    inventory_start = _next_id(Inventory)
+    product_ids = list(range(product_start, product_start + products))
+    purchase_prices = {}
+    sale_prices = {}
+    for product_id in product_ids:
+        purchase_price = round(rng.uniform(0.5, 200), 2)
+        purchase_prices[product_id] = purchase_price
+        sale_prices[product_id] = round(purchase_price * rng.uniform(1.1, 1.6), 2)
+
+    def product_rows():
+        for product_id in product_ids:
+            created_at = now - timedelta(days=rng.randint(0, days), seconds=rng.randint(0, 86399))
+            yield {
+                'id': product_id,
+                'name': f'{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_SIZES)} {product_id}',
+                'description': None,
+                'barcode': f'{6000000000000 + product_id}',
+                'sku': f'SKU-{product_id:08d}',
+                'purchase_price': purchase_prices[product_id],
+                'sale_price': sale_prices[product_id],
+                'min_quantity': rng.choice((0, 5, 10, 20)),
+                'category_id': rng.choice(category_ids),
+                'created_at': created_at,
+                'updated_at': created_at
+            }
+
+    counts['products'] = _insert_batches(Product, product_rows(), batch_size)
+    counts['inventory'] = _insert_batches(Inventory, (
+        {
+            'id': inventory_start + i,
+            'product_id': product_id,
+            'quantity': rng.randint(0, 500),
+            'last_updated': now
+        }
+        for i, product_id in enumerate(product_ids)
+    ), batch_size)
+    inventory_ids = {product_id: inventory_start + i for i, product_id in enumerate(product_ids)}
+
+    # Customers and suppliers
+    def person_rows(start, count, with_contact):
+        for i in range(count):
+            row = {
+                'id': start + i,
+                'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'phone': f'09{rng.randint(10000000, 99999999)}',
+                'email': None,
+                'address': None,
+                'notes': None,
+                'created_at': now - timedelta(days=rng.randint(0, days))
+            }
+            if with_contact:
+                row['contact_person'] = row['name']
+            yield row
+
+    customer_start = _next_id(Customer)
+    counts['customers'] = _insert_batches(Customer, person_rows(customer_start, customers, False), batch_size)
+    customer_ids = list(range(customer_start, customer_start + customers))
+
+    supplier_start = _next_id(Supplier)
+    counts['suppliers'] = _insert_batches(Supplier, person_rows(supplier_start, suppliers, True), batch_size)
+    supplier_ids = list(range(supplier_start, supplier_start + suppliers))
+
+    # Sales, purchases and their items are generated together, so the
+    # document totals match their items
+    def documents(count, start, party_ids, prices, prefix):
+        headers = []
+        items = []
+        for i in range(count):
+            document_id = start + i
+            document_date = today - timedelta(days=rng.randint(0, days))
+            line_count = min(len(product_ids), rng.randint(1, max(1, 2 * items_per_sale - 1)))
+            lines = [(product_id, rng.randint(1, 10)) for product_id in rng.sample(product_ids, line_count)]
+            total = 0
+            for product_id, quantity in lines:
+                items.append((document_id, product_id, quantity, prices[product_id], document_date))
+                total += quantity * prices[product_id]
+            headers.append({
+                'id': document_id,
+                'invoice_number': f'{prefix}-{document_id:08d}',
+                'date': document_date,
+                'party_id': rng.choice(party_ids) if party_ids and rng.random() < 0.8 else None,
+                'total_amount': round(total, 2),
+                'payment_method': rng.choice(PAYMENT_METHODS),
+                'status': 'cancelled' if rng.random() < 0.02 else 'completed',
+                'created_at': datetime.combine(document_date, datetime.min.time()) + timedelta(seconds=rng.randint(0, 86399))
+            })
+            if len(headers) >= batch_size:
+                yield headers, items
+                headers = []
+                items = []
+        if headers:
+            yield headers, items
+
+    movement_start = _next_id(InventoryMovement)
+    movement_count = 0
+
+    def movement_rows(items, movement_type, reference_prefix):
+        nonlocal movement_count
+        for document_id, product_id, quantity, _, document_date in items:
+            movement_count += 1
+            yield {
+                'id': movement_start + movement_count - 1,
+                'inventory_id': inventory_ids[product_id],
+                'movement_type': movement_type,
+                'quantity': quantity,
+                'reference': f'{reference_prefix}-{document_id}',
+                'notes': None,
+                'timestamp': datetime.combine(document_date, datetime.min.time())
+            }
+
+    counts['sales'] = counts['sale_items'] = 0
+    if product_ids:
+        for headers, items in documents(sales, _next_id(Sale), customer_ids, sale_prices, 'INV'):
+            counts['sales'] += _insert_batches(Sale, (
+                {
+                    'id': h['id'], 'invoice_number': h['invoice_number'], 'customer_id': h['party_id'],
+                    'sale_date': h['date'], 'total_amount': h['total_amount'],
+                    'payment_method': h['payment_method'], 'status': h['status'],
+                    'notes': None, 'created_at': h['created_at']
+                }
+                for h in headers
+            ), batch_size)
+            counts['sale_items'] += _insert_batches(SaleItem, (
+                {'sale_id': sale_id, 'product_id': product_id, 'quantity': quantity, 'price': price,
+                 'cost': purchase_prices[product_id]}
+                for sale_id, product_id, quantity, price, _ in items
+            ), batch_size)
+            _insert_batches(InventoryMovement, movement_rows(items, 'out', 'INV'), batch_size)
+
+    counts['purchases'] = counts['purchase_items'] = 0
+    if product_ids:
+        for headers, items in documents(purchases, _next_id(Purchase), supplier_ids, purchase_prices, 'PUR'):
+            counts['purchases'] += _insert_batches(Purchase, (
+                {
+                    'id': h['id'], 'invoice_number': h['invoice_number'], 'supplier_id': h['party_id'],
+                    'purchase_date': h['date'], 'total_amount': h['total_amount'],
+                    'payment_method': h['payment_method'], 'status': h['status'],
+                    'notes': None, 'created_at': h['created_at']
+                }
+                for h in headers
+            ), batch_size)
+            counts['purchase_items'] += _insert_batches(PurchaseItem, (
+                {'purchase_id': purchase_id, 'product_id': product_id, 'quantity': quantity, 'price': price}
+                for purchase_id, product_id, quantity, price, _ in items
+            ), batch_size)
+            _insert_batches(InventoryMovement, movement_rows(items, 'in', 'PUR'), batch_size)
+
+    counts['inventory_movements'] = movement_count
+    mark_reference_changed(['categories', 'suppliers'])
+    db.session.commit()
+
+    # Derived tables
+    rebuild_daily_sales_summary()
+    rebuild_product_daily_sales()
+    rebuild_search_index()
+    rebuild_low_stock()
+
+    return counts
@@ -0,0 +1,164 @@
+import threading
+from types import MappingProxyType
+from flask import g, has_request_context
+from sqlalchemy import Integer, Text, cast, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Setting
+
+# Every setting with its type and default value
+SETTINGS = {
+    'store_name': (str, 'نظام إدارة المخزن'),
+    'store_address': (str, ''),
+    'store_phone': (str, ''),
+    'store_email': (str, ''),
+    'tax_rate': (float, 0.0),
+    'currency': (str, 'ر.س')
+}
+
+# Key of the row counting settings writes; workers reload when it changes
+VERSION_KEY = 'settings_version'
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+class SettingsSnapshot:
+    """Immutable, typed view of every setting at one version"""
+
+    def __init__(self, values, version):
+        self.values = MappingProxyType(values)
+        self.version = version
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self.values[key]
+        except KeyError:
+            raise AttributeError(key)
+
+
+def _convert(key, value):
+    """Convert a stored or submitted value to the setting's type"""
+    python_type, default = SETTINGS[key]
+    if value is None or value == '':
+        return default
+    return python_type(value)
+
+def _read_version():
+    value = db.session.execute(select(Setting.value).where(Setting.key == VERSION_KEY)).scalar()
+    return int(value or 0)
+
+def load_settings():
+    """
+    Load every setting in one query and make it the current snapshot
+
+    Stored values that do not convert to the setting's type fall back to
+    the default.
+
+    Returns:
+        SettingsSnapshot: The new snapshot
+    """
+    global _snapshot
+    rows = dict(db.session.execute(select(Setting.key, Setting.value)).all())
+
+    values = {}
+    for key, (python_type, default) in SETTINGS.items():
+        try:
+            values[key] = _convert(key, rows.get(key))
+        except ValueError:
+            values[key] = default
+
+    snapshot = SettingsSnapshot(values, int(rows.get(VERSION_KEY) or 0))
+    with _snapshot_lock:
+        _snapshot = snapshot
+    return snapshot
+
+def get_settings():
+    """
+    Get the current settings snapshot
+
+    The version row is checked at most once per request, and only by
+    requests that read a setting; the settings themselves are reloaded
+    only when another process has changed them.
+
+    Returns:
+        SettingsSnapshot: The settings
+    """
+    snapshot = _snapshot
+    if has_request_context():
+        if g.get('settings_checked') and snapshot is not None:
+            return snapshot
+        g.settings_checked = True
+
+    if snapshot is None or _read_version() != snapshot.version:
+        snapshot = load_settings()
+    return snapshot
+
+def get_setting(key):
+    """Get the typed value of one setting"""
+    return get_settings()[key]
+
+def update_settings(values):
+    """
+    Save several settings in one transaction and bump the settings version
+
+    Args:
+        values (dict): key -> new value (converted to the setting's type)
+
+    Returns:
+        SettingsSnapshot: The new snapshot
+
+    Raises:
+        KeyError: If a key is not a registered setting
+        ValueError: If a value does not convert to the setting's type
+    """
+    rows = [{'key': key, 'value': str(_convert(key, value))} for key, value in values.items()]
+
+    table = Setting.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={'value': statement.excluded.value}
+    )
+    if rows:
+        db.session.execute(statement, rows)
+
+    # Incremented in SQL, so concurrent writers never reuse a version
+    bump = sqlite_insert(table).values(key=VERSION_KEY, value='1')
+    db.session.execute(bump.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={'value': cast(cast(table.c.value, Integer) + 1, Text)}
+    ))
+    db.session.commit()
+
+    if has_request_context():
+        g.settings_checked = True
+    return load_settings()
+
+def format_money(amount):
+    """Format an amount with two decimals and the configured currency"""
+    return f'{amount or 0:,.2f} {get_setting("currency")}'
+
+
+class _TemplateSettings:
+    """Lets templates read settings without a query unless they use one"""
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        return getattr(get_settings(), key)
+
+
+def init_settings(app):
+    """
+    Expose the settings to templates as store_settings, with the money filter
+
+    Args:
+        app (Flask): The application
+    """
+    app.context_processor(lambda: {'store_settings': _TemplateSettings()})
+    app.add_template_filter(format_money, 'money')
@@ -0,0 +1,127 @@
+from datetime import datetime
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Product, Inventory
+from low_stock import mark_stock_changed
+from sync import mark_products_changed
+
+
+class InsufficientStockError(Exception):
+    """Raised when a stock decrement would take a product below zero"""
+
+    def __init__(self, product_ids):
+        super().__init__(f'Insufficient stock for products: {sorted(product_ids)}')
+        self.product_ids = list(product_ids)
+
+
+def load_stock_levels(product_ids):
+    """
+    Load the inventory rows for a set of products in a single query
+
+    Args:
+        product_ids (iterable): IDs of the products to load
+
+    Returns:
+        dict: product_id -> row with product_id, name, purchase_price,
+            inventory_id and quantity (inventory_id/quantity are None when
+            the product has no inventory record)
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    rows = db.session.query(
+        Product.id.label('product_id'),
+        Product.name,
+        Product.purchase_price,
+        Inventory.id.label('inventory_id'),
+        Inventory.quantity
+    ).outerjoin(
+        Inventory, Inventory.product_id == Product.id
+    ).filter(
+        Product.id.in_(product_ids)
+    ).all()
+
+    return {row.product_id: row for row in rows}
+
+def decrement_stock(quantities):
+    """
+    Atomically decrement stock for several products
+
+    Every product is decremented with a conditional
+    ``UPDATE ... SET quantity = quantity - :q WHERE quantity >= :q``, sent as
+    one executemany. If any row fails the condition (for example because a
+    concurrent sale took the stock first), InsufficientStockError is raised
+    and the caller must roll back the transaction.
+
+    Args:
+        quantities (dict): product_id -> quantity to remove
+    """
+    params = [
+        {'p': product_id, 'q': quantity}
+        for product_id, quantity in quantities.items()
+        if quantity > 0
+    ]
+    if not params:
+        return
+
+    statement = update(Inventory.__table__).where(
+        Inventory.product_id == bindparam('p'),
+        Inventory.quantity >= bindparam('q')
+    ).values(
+        quantity=Inventory.quantity - bindparam('q')
+    )
+    result = db.session.connection().execute(statement, params)
+
+    if result.rowcount != len(params):
+        raise InsufficientStockError([param['p'] for param in params])
+
+    mark_stock_changed(quantities.keys())
+    mark_products_changed(quantities.keys())
+
+def increment_stock(quantities):
+    """
+    Atomically add stock for several products
+
+    Every product is incremented with one
+    ``INSERT ... ON CONFLICT (product_id) DO UPDATE SET quantity = quantity + :q``,
+    sent as one executemany, so concurrent changes are never overwritten and
+    products without an inventory record get one. The statement takes
+    SQLite's write lock, so the quantities read back afterwards are exactly
+    the result of this transaction's increments.
+
+    Args:
+        quantities (dict): product_id -> quantity to add
+
+    Returns:
+        dict: product_id -> row with inventory_id and quantity (the new
+            quantity, after the increment)
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return {}
+
+    now = datetime.utcnow()
+    table = Inventory.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={
+            'quantity': table.c.quantity + statement.excluded.quantity,
+            'last_updated': statement.excluded.last_updated
+        }
+    )
+    db.session.execute(statement, [
+        {'product_id': product_id, 'quantity': quantity, 'last_updated': now}
+        for product_id, quantity in quantities.items()
+    ])
+
+    mark_stock_changed(quantities.keys())
+    mark_products_changed(quantities.keys())
+
+    rows = db.session.execute(select(
+        Inventory.product_id,
+        Inventory.id.label('inventory_id'),
+        Inventory.quantity
+    ).where(Inventory.product_id.in_(quantities.keys())))
+    return {row.product_id: row for row in rows}
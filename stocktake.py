@@ -0,0 +1,326 @@
+from datetime import datetime
+from sqlalchemy import bindparam, case, func, insert, literal, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Product, Inventory, InventoryMovement, InventoryTransaction, Stocktake, StocktakeLine
+from low_stock import mark_stock_changed
+from sync import mark_products_changed
+
+
+class StocktakeError(Exception):
+    """Raised when a stocktake is not in a state that allows the operation"""
+
+
+def open_stocktake(name, user_id=None, category_id=None, notes=None):
+    """
+    Open a count session and snapshot the current stock
+
+    Every inventory row (of one category, if given) is copied into the
+    session's lines with a single INSERT ... SELECT.
+
+    Args:
+        name (str): Name of the session
+        user_id (int): User opening the session
+        category_id (int): Count only this category (default: all products)
+        notes (str): Free-text notes
+
+    Returns:
+        Stocktake: The new session
+    """
+    stocktake = Stocktake(name=name, category_id=category_id, notes=notes, started_by=user_id)
+    db.session.add(stocktake)
+    db.session.flush()
+
+    snapshot = select(
+        literal(stocktake.id),
+        Inventory.product_id,
+        Inventory.quantity
+    ).select_from(Inventory).join(Product, Inventory.product_id == Product.id)
+    if category_id:
+        snapshot = snapshot.where(Product.category_id == category_id)
+
+    db.session.execute(insert(StocktakeLine.__table__).from_select(
+        ['stocktake_id', 'product_id', 'snapshot_quantity'], snapshot
+    ))
+    db.session.commit()
+    return stocktake
+
+def _check_open(stocktake):
+    if stocktake.status != 'open':
+        raise StocktakeError(f'Stocktake {stocktake.id} is {stocktake.status}')
+
+def record_counts(stocktake, counts, replace=False):
+    """
+    Record a batch of scanned counts
+
+    Codes are matched against barcodes and SKUs in one query, and all lines
+    are written with one executemany upsert. Each line also stores the live
+    stock at the moment of recording, so sales made after the snapshot are
+    not mistaken for a variance. Products added after the session started
+    get a line with a zero snapshot.
+
+    Args:
+        stocktake (Stocktake): An open session
+        counts (iterable): (barcode or SKU, quantity) pairs; repeated codes
+            are summed
+        replace (bool): Replace earlier counts of the products instead of
+            adding to them
+
+    Returns:
+        tuple: (number of products recorded, list of unknown codes)
+
+    Raises:
+        StocktakeError: If the session is not open
+        ValueError: If a quantity is not a whole number of zero or more
+    """
+    _check_open(stocktake)
+
+    quantities = {}
+    for code, quantity in counts:
+        code = str(code).strip()
+        if not code:
+            continue
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f'Invalid quantity for {code}: {quantity!r}')
+        if quantity < 0:
+            raise ValueError(f'Invalid quantity for {code}: {quantity}')
+        quantities[code] = quantities.get(code, 0) + quantity
+    if not quantities:
+        return 0, []
+
+    codes = list(quantities)
+    products = {}
+    for product_id, barcode, sku in db.session.execute(select(
+        Product.id, Product.barcode, Product.sku
+    ).where(or_(Product.barcode.in_(codes), Product.sku.in_(codes)))):
+        if barcode in quantities:
+            products[barcode] = product_id
+        if sku in quantities:
+            products.setdefault(sku, product_id)
+
+    counted = {}
+    for code, quantity in quantities.items():
+        if code in products:
+            counted[products[code]] = counted.get(products[code], 0) + quantity
+    unknown = [code for code in codes if code not in products]
+    if not counted:
+        return 0, unknown
+
+    live = dict(db.session.execute(select(
+        Inventory.product_id, Inventory.quantity
+    ).where(Inventory.product_id.in_(counted.keys()))).all())
+
+    now = datetime.utcnow()
+    table = StocktakeLine.__table__
+    statement = sqlite_insert(table)
+    counted_quantity = statement.excluded.counted_quantity
+    if not replace:
+        counted_quantity = func.coalesce(table.c.counted_quantity, 0) + counted_quantity
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.stocktake_id, table.c.product_id],
+        set_={
+            'counted_quantity': counted_quantity,
+            'expected_quantity': statement.excluded.expected_quantity,
+            'counted_at': statement.excluded.counted_at
+        }
+    )
+    db.session.execute(statement, [{
+        'stocktake_id': stocktake.id,
+        'product_id': product_id,
+        'snapshot_quantity': 0,
+        'expected_quantity': live.get(product_id, 0),
+        'counted_quantity': quantity,
+        'counted_at': now
+    } for product_id, quantity in counted.items()])
+    db.session.commit()
+
+    return len(counted), unknown
+
+def parse_scans(text):
+    """
+    Parse scanner input, one 'code', 'code,quantity' or 'code quantity' per line
+
+    A line with only a code counts one unit.
+
+    Args:
+        text (str): The scanned lines
+
+    Returns:
+        list: (code, quantity) pairs
+
+    Raises:
+        ValueError: If a quantity is not a whole number
+    """
+    counts = []
+    for line in (text or '').splitlines():
+        parts = line.replace(',', ' ').replace('\t', ' ').split()
+        if not parts:
+            continue
+        if len(parts) > 2:
+            raise ValueError(f'Invalid line: {line}')
+        counts.append((parts[0], int(parts[1]) if len(parts) == 2 else 1))
+    return counts
+
+def get_stocktake_summary(stocktake):
+    """
+    Get the progress and variance totals of a session in one query
+
+    Args:
+        stocktake (Stocktake): The session
+
+    Returns:
+        dict: lines, counted, with_variance, variance_units and
+            variance_value (at purchase price)
+    """
+    variance = StocktakeLine.counted_quantity - StocktakeLine.expected_quantity
+    is_counted = StocktakeLine.counted_quantity.isnot(None)
+    row = db.session.execute(select(
+        func.count(StocktakeLine.id).label('lines'),
+        func.coalesce(func.sum(case((is_counted, 1), else_=0)), 0).label('counted'),
+        func.coalesce(func.sum(case((is_counted & (variance != 0), 1), else_=0)), 0).label('with_variance'),
+        func.coalesce(func.sum(variance), 0).label('variance_units'),
+        func.coalesce(func.sum(variance * Product.purchase_price), 0).label('variance_value')
+    ).select_from(StocktakeLine).join(
+        Product, StocktakeLine.product_id == Product.id
+    ).where(StocktakeLine.stocktake_id == stocktake.id)).one()
+
+    return {
+        'lines': row.lines,
+        'counted': row.counted,
+        'with_variance': row.with_variance,
+        'variance_units': row.variance_units,
+        'variance_value': row.variance_value
+    }
+
+def get_variances(stocktake, limit=None):
+    """
+    Get the counted lines whose count differs from the expected stock
+
+    Args:
+        stocktake (Stocktake): The session
+        limit (int): Maximum number of lines
+
+    Returns:
+        list: (StocktakeLine, Product) tuples, largest absolute variance first
+    """
+    variance = StocktakeLine.counted_quantity - StocktakeLine.expected_quantity
+    query = db.session.query(StocktakeLine, Product).join(
+        Product, StocktakeLine.product_id == Product.id
+    ).filter(
+        StocktakeLine.stocktake_id == stocktake.id,
+        StocktakeLine.counted_quantity.isnot(None),
+        variance != 0
+    ).order_by(func.abs(variance).desc(), Product.id)
+
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+def post_stocktake(stocktake, user_id=None):
+    """
+    Apply the variances of a session to the stock in one transaction
+
+    The variance of each counted line (count minus the stock when it was
+    counted) is added to the current stock, so sales made during the count
+    are kept. Inventory rows, InventoryMovement and InventoryTransaction
+    rows are written with executemany statements. Uncounted lines are left
+    unchanged.
+
+    Args:
+        stocktake (Stocktake): An open session
+        user_id (int): User posting the session
+
+    Returns:
+        int: Number of products adjusted
+
+    Raises:
+        StocktakeError: If the session is not open (or was posted meanwhile)
+    """
+    _check_open(stocktake)
+    now = datetime.utcnow()
+
+    # Claiming the session first takes the write lock, so the stock read
+    # below cannot change before it is updated
+    claimed = db.session.execute(update(Stocktake.__table__).where(
+        Stocktake.id == stocktake.id,
+        Stocktake.status == 'open'
+    ).values(status='posted', posted_at=now, posted_by=user_id))
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        raise StocktakeError(f'Stocktake {stocktake.id} is no longer open')
+
+    lines = db.session.execute(select(
+        StocktakeLine.id,
+        StocktakeLine.product_id,
+        (StocktakeLine.counted_quantity - StocktakeLine.expected_quantity).label('variance'),
+        Inventory.id.label('inventory_id'),
+        Inventory.quantity
+    ).join(
+        Inventory, Inventory.product_id == StocktakeLine.product_id
+    ).where(
+        StocktakeLine.stocktake_id == stocktake.id,
+        StocktakeLine.counted_quantity.isnot(None),
+        StocktakeLine.counted_quantity != StocktakeLine.expected_quantity
+    )).all()
+
+    adjustments = []
+    for line in lines:
+        after = max(line.quantity + line.variance, 0)
+        if after != line.quantity:
+            adjustments.append((line, after))
+
+    if adjustments:
+        db.session.execute(update(Inventory.__table__).where(
+            Inventory.id == bindparam('inventory')
+        ).values(quantity=bindparam('after'), last_updated=now), [
+            {'inventory': line.inventory_id, 'after': after} for line, after in adjustments
+        ])
+
+        reference = f'STK-{stocktake.id}'
+        notes = f'جرد المخزون: {stocktake.name}'
+        db.session.execute(insert(InventoryMovement.__table__), [{
+            'inventory_id': line.inventory_id,
+            'movement_type': 'in' if after > line.quantity else 'out',
+            'quantity': abs(after - line.quantity),
+            'reference': reference,
+            'notes': notes,
+            'timestamp': now
+        } for line, after in adjustments])
+        db.session.execute(insert(InventoryTransaction.__table__), [{
+            'product_id': line.product_id,
+            'quantity_before': line.quantity,
+            'quantity_change': after - line.quantity,
+            'quantity_after': after,
+            'transaction_type': 'adjustment',
+            'reference_type': 'stocktake',
+            'reference_id': stocktake.id,
+            'notes': notes,
+            'timestamp': now,
+            'user_id': user_id
+        } for line, after in adjustments])
+
+        db.session.execute(update(StocktakeLine.__table__).where(
+            StocktakeLine.id == bindparam('line')
+        ).values(adjustment=bindparam('change')), [
+            {'line': line.id, 'change': after - line.quantity} for line, after in adjustments
+        ])
+
+        product_ids = [line.product_id for line, _ in adjustments]
+        mark_stock_changed(product_ids)
+        mark_products_changed(product_ids)
+
+    db.session.commit()
+    db.session.refresh(stocktake)
+    return len(adjustments)
+
+def cancel_stocktake(stocktake):
+    """
+    Cancel an open session without changing the stock
+
+    Raises:
+        StocktakeError: If the session is not open
+    """
+    _check_open(stocktake)
+    stocktake.status = 'cancelled'
+    db.session.commit()
@@ -0,0 +1,338 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Sale, SaleItem, Product, DailySalesSummary, ProductDailySales
+
+
+def _as_date(value):
+    """Normalize a date or datetime value to a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def apply_sale_to_summary(sale_date, revenue, items_sold, cost, sales_count=1):
+    """
+    Add a sale's totals to the daily sales summary row for its date
+
+    The row is upserted in the current session so the summary is committed
+    (or rolled back) together with the sale itself. Cancellations pass
+    negative amounts and sales_count=-1.
+
+    Args:
+        sale_date (date): The date of the sale
+        revenue (float): Sale total amount
+        items_sold (int): Number of units sold
+        cost (float): Purchase cost of the units sold
+        sales_count (int): Number of sales to add (default: 1)
+    """
+    table = DailySalesSummary.__table__
+    statement = sqlite_insert(table).values(
+        date=_as_date(sale_date),
+        revenue=revenue,
+        sales_count=sales_count,
+        items_sold=items_sold,
+        cost=cost,
+        updated_at=datetime.utcnow()
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.date],
+        set_={
+            'revenue': table.c.revenue + statement.excluded.revenue,
+            'sales_count': table.c.sales_count + statement.excluded.sales_count,
+            'items_sold': table.c.items_sold + statement.excluded.items_sold,
+            'cost': table.c.cost + statement.excluded.cost,
+            'updated_at': statement.excluded.updated_at
+        }
+    )
+    db.session.execute(statement)
+
+def apply_sale_items_to_product_sales(sale_date, items, sign=1):
+    """
+    Add a sale's items to the per-product daily sales rows for its date
+
+    Lines for the same product are merged and every product row is upserted
+    with one executemany, in the current session so the fact table is
+    committed (or rolled back) together with the sale. Cancellations pass
+    sign=-1.
+
+    Args:
+        sale_date (date): The date of the sale
+        items (iterable): (product_id, quantity, revenue, cost) per sale line
+        sign (int): 1 to add the sale, -1 to remove it
+    """
+    totals = {}
+    for product_id, quantity, revenue, cost in items:
+        row = totals.setdefault(product_id, [0, 0, 0])
+        row[0] += quantity
+        row[1] += revenue
+        row[2] += cost
+
+    if not totals:
+        return
+
+    table = ProductDailySales.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.product_id, table.c.date],
+        set_={
+            'quantity': table.c.quantity + statement.excluded.quantity,
+            'revenue': table.c.revenue + statement.excluded.revenue,
+            'cost': table.c.cost + statement.excluded.cost,
+            'updated_at': statement.excluded.updated_at
+        }
+    )
+
+    sale_date = _as_date(sale_date)
+    now = datetime.utcnow()
+    db.session.execute(statement, [{
+        'product_id': product_id,
+        'date': sale_date,
+        'quantity': sign * quantity,
+        'revenue': sign * revenue,
+        'cost': sign * cost,
+        'updated_at': now
+    } for product_id, (quantity, revenue, cost) in totals.items()])
+
+def rebuild_product_daily_sales(start_date=None, end_date=None):
+    """
+    Recompute the per-product daily sales table from the sales tables
+
+    Costs use the unit cost stored on each sale item; items without one fall
+    back to the product's current purchase price.
+
+    Args:
+        start_date (date): First date to rebuild (default: all history)
+        end_date (date): Last date to rebuild (default: all history)
+
+    Returns:
+        int: Number of rows written
+    """
+    query = select(
+        SaleItem.product_id,
+        Sale.sale_date,
+        func.sum(SaleItem.quantity),
+        func.sum(SaleItem.quantity * SaleItem.price),
+        func.sum(SaleItem.quantity * func.coalesce(SaleItem.cost, Product.purchase_price, 0)),
+        literal(datetime.utcnow(), ProductDailySales.updated_at.type)
+    ).join(
+        Sale, SaleItem.sale_id == Sale.id
+    ).join(
+        Product, SaleItem.product_id == Product.id
+    ).where(Sale.status == 'completed')
+
+    delete_query = ProductDailySales.query
+
+    if start_date:
+        query = query.where(Sale.sale_date >= start_date)
+        delete_query = delete_query.filter(ProductDailySales.date >= start_date)
+
+    if end_date:
+        query = query.where(Sale.sale_date <= end_date)
+        delete_query = delete_query.filter(ProductDailySales.date <= end_date)
+
+    delete_query.delete(synchronize_session=False)
+
+    table = ProductDailySales.__table__
+    result = db.session.execute(insert(table).from_select(
+        ['product_id', 'date', 'quantity', 'revenue', 'cost', 'updated_at'],
+        query.group_by(SaleItem.product_id, Sale.sale_date)
+    ))
+    db.session.commit()
+
+    return result.rowcount
+
+def get_product_profit(start_date=None, end_date=None, limit=None, order_by='profit'):
+    """
+    Get sales, cost and profit per product over a date range, inclusive
+
+    This is a single grouped query over product_daily_sales joined to the
+    products for their names, so it does not depend on the number of sale
+    items in the range.
+
+    Args:
+        start_date (date): First date of the range (default: all history)
+        end_date (date): Last date of the range (default: all history)
+        limit (int): Only return the top N products
+        order_by (str): 'profit', 'revenue', 'quantity' or 'margin'
+
+    Returns:
+        list: One dict per product with product_id, name, sku, quantity,
+            revenue, cost, profit and margin (percent of revenue)
+    """
+    quantity = func.sum(ProductDailySales.quantity)
+    revenue = func.sum(ProductDailySales.revenue)
+    cost = func.sum(ProductDailySales.cost)
+    profit = revenue - cost
+    margin = func.coalesce(profit * 100.0 / func.nullif(revenue, 0), 0)
+    sort_columns = {'profit': profit, 'revenue': revenue, 'quantity': quantity, 'margin': margin}
+
+    # Aggregate (and cut to the top N) before joining, so only the
+    # returned products are looked up
+    totals = select(
+        ProductDailySales.product_id,
+        quantity.label('quantity'),
+        revenue.label('revenue'),
+        cost.label('cost'),
+        profit.label('profit'),
+        margin.label('margin')
+    )
+
+    if start_date:
+        totals = totals.where(ProductDailySales.date >= start_date)
+    if end_date:
+        totals = totals.where(ProductDailySales.date <= end_date)
+
+    totals = totals.group_by(ProductDailySales.product_id).having(quantity != 0).order_by(
+        sort_columns.get(order_by, profit).desc(), ProductDailySales.product_id
+    )
+    if limit:
+        totals = totals.limit(limit)
+    totals = totals.subquery()
+
+    query = select(
+        Product.id,
+        Product.name,
+        Product.sku,
+        totals.c.quantity,
+        totals.c.revenue,
+        totals.c.cost,
+        totals.c.profit,
+        totals.c.margin
+    ).join(
+        Product, totals.c.product_id == Product.id
+    ).order_by(totals.c[order_by if order_by in sort_columns else 'profit'].desc(), Product.id)
+
+    return [{
+        'product_id': row.id,
+        'name': row.name,
+        'sku': row.sku,
+        'quantity': row.quantity,
+        'revenue': row.revenue,
+        'cost': row.cost,
+        'profit': row.profit,
+        'margin': row.margin
+    } for row in db.session.execute(query)]
+
+def rebuild_daily_sales_summary(start_date=None, end_date=None):
+    """
+    Recompute the daily sales summary from the sales tables
+
+    Args:
+        start_date (date): First date to rebuild (default: all history)
+        end_date (date): Last date to rebuild (default: all history)
+
+    Returns:
+        int: Number of summary rows written
+    """
+    sales_query = db.session.query(
+        Sale.sale_date,
+        func.coalesce(func.sum(Sale.total_amount), 0),
+        func.count(Sale.id)
+    ).filter(Sale.status == 'completed')
+
+    items_query = db.session.query(
+        Sale.sale_date,
+        func.coalesce(func.sum(SaleItem.quantity), 0),
+        func.coalesce(func.sum(SaleItem.quantity * func.coalesce(SaleItem.cost, Product.purchase_price, 0)), 0)
+    ).join(
+        SaleItem, SaleItem.sale_id == Sale.id
+    ).join(
+        Product, SaleItem.product_id == Product.id
+    ).filter(Sale.status == 'completed')
+
+    delete_query = DailySalesSummary.query
+
+    if start_date:
+        sales_query = sales_query.filter(Sale.sale_date >= start_date)
+        items_query = items_query.filter(Sale.sale_date >= start_date)
+        delete_query = delete_query.filter(DailySalesSummary.date >= start_date)
+
+    if end_date:
+        sales_query = sales_query.filter(Sale.sale_date <= end_date)
+        items_query = items_query.filter(Sale.sale_date <= end_date)
+        delete_query = delete_query.filter(DailySalesSummary.date <= end_date)
+
+    rows = {}
+    now = datetime.utcnow()
+    for sale_date, revenue, sales_count in sales_query.group_by(Sale.sale_date):
+        rows[sale_date] = {
+            'date': sale_date,
+            'revenue': revenue,
+            'sales_count': sales_count,
+            'items_sold': 0,
+            'cost': 0,
+            'updated_at': now
+        }
+
+    for sale_date, items_sold, cost in items_query.group_by(Sale.sale_date):
+        if sale_date in rows:
+            rows[sale_date]['items_sold'] = items_sold
+            rows[sale_date]['cost'] = cost
+
+    delete_query.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(DailySalesSummary.__table__.insert(), list(rows.values()))
+    db.session.commit()
+
+    return len(rows)
+
+def get_daily_sales(start_date, end_date):
+    """
+    Get per-day sales totals between two dates, inclusive
+
+    Days without sales are returned with zero totals.
+
+    Args:
+        start_date (date): First date of the range
+        end_date (date): Last date of the range
+
+    Returns:
+        list: One dict per day with date, total, count, items_sold and cost
+    """
+    summaries = DailySalesSummary.query.filter(
+        DailySalesSummary.date.between(start_date, end_date)
+    ).all()
+    by_date = {summary.date: summary for summary in summaries}
+
+    days = []
+    date = start_date
+    while date <= end_date:
+        summary = by_date.get(date)
+        days.append({
+            'date': date.strftime('%Y-%m-%d'),
+            'total': summary.revenue if summary else 0,
+            'count': summary.sales_count if summary else 0,
+            'items_sold': summary.items_sold if summary else 0,
+            'cost': summary.cost if summary else 0
+        })
+        date += timedelta(days=1)
+
+    return days
+
+def get_sales_totals(start_date, end_date):
+    """
+    Get aggregated sales totals between two dates, inclusive
+
+    Args:
+        start_date (date): First date of the range
+        end_date (date): Last date of the range
+
+    Returns:
+        dict: revenue, count, items_sold, cost and profit for the range
+    """
+    revenue, sales_count, items_sold, cost = db.session.query(
+        func.coalesce(func.sum(DailySalesSummary.revenue), 0),
+        func.coalesce(func.sum(DailySalesSummary.sales_count), 0),
+        func.coalesce(func.sum(DailySalesSummary.items_sold), 0),
+        func.coalesce(func.sum(DailySalesSummary.cost), 0)
+    ).filter(
+        DailySalesSummary.date.between(start_date, end_date)
+    ).one()
+
+    return {
+        'revenue': revenue,
+        'count': sales_count,
+        'items_sold': items_sold,
+        'cost': cost,
+        'profit': revenue - cost
+    }
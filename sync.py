@@ -0,0 +1,232 @@
+import gzip
+from datetime import datetime
+from flask import jsonify, request
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Product, Inventory, ProductChange
+from database import RoutingSession
+from pagination import encode_cursor, decode_cursor
+
+# Session.info key holding the product IDs changed in the current transaction
+CHANGED_KEY = 'sync_changed'
+
+DEFAULT_SYNC_PAGE_SIZE = 1000
+MAX_SYNC_PAGE_SIZE = 5000
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+_CURSOR_COLUMNS = [ProductChange.seq, Product.id]
+
+
+def mark_products_changed(product_ids, session=None):
+    """
+    Record that products, their prices or their stock changed
+
+    ORM changes to Product and Inventory rows are picked up automatically;
+    code that writes them with Core statements must call this so the
+    change feed is updated when the transaction commits.
+
+    Args:
+        product_ids (iterable): IDs of the changed products
+        session (Session): The session (default: db.session)
+    """
+    session = session or db.session
+    session.info.setdefault(CHANGED_KEY, set()).update(product_ids)
+
+def get_sync_version(session=None):
+    """Get the sequence number of the last recorded change"""
+    session = session or db.session
+    return session.execute(select(func.coalesce(func.max(ProductChange.seq), 0))).scalar()
+
+def get_last_change(session=None):
+    """
+    Get the sequence number and time of the last recorded change
+
+    Returns:
+        tuple: (seq, changed_at), or (0, None) if nothing changed yet
+    """
+    session = session or db.session
+    row = session.execute(
+        select(ProductChange.seq, ProductChange.changed_at).order_by(ProductChange.seq.desc()).limit(1)
+    ).first()
+    return (row.seq, row.changed_at) if row else (0, None)
+
+def record_product_changes(product_ids, session=None):
+    """
+    Give changed products a new place at the end of the change feed
+
+    Each product gets its own sequence number, above every earlier one.
+    Products that no longer exist are recorded as deleted.
+
+    Args:
+        product_ids (iterable): IDs of the changed products
+        session (Session): The session (default: db.session)
+    """
+    session = session or db.session
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+
+    existing = set(session.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    # Called after the transaction's writes, so it holds SQLite's write
+    # lock and no other writer can take the same numbers
+    start = get_sync_version(session) + 1
+    now = datetime.utcnow()
+
+    table = ProductChange.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={
+            'seq': statement.excluded.seq,
+            'deleted': statement.excluded.deleted,
+            'changed_at': statement.excluded.changed_at
+        }
+    )
+    session.execute(statement, [
+        {'product_id': product_id, 'seq': start + offset, 'deleted': product_id not in existing, 'changed_at': now}
+        for offset, product_id in enumerate(product_ids)
+    ])
+
+def _catalog_columns():
+    return [
+        Product.id,
+        Product.name,
+        Product.barcode,
+        Product.sku,
+        Product.category_id,
+        Product.sale_price,
+        Product.min_quantity,
+        Product.updated_at,
+        Inventory.quantity,
+        Inventory.last_updated
+    ]
+
+def _serialize_row(row):
+    stamps = [value for value in (row.updated_at, row.last_updated) if value is not None]
+    return {
+        'id': row.id,
+        'name': row.name,
+        'barcode': row.barcode,
+        'sku': row.sku,
+        'category_id': row.category_id,
+        'sale_price': row.sale_price,
+        'min_quantity': row.min_quantity,
+        'quantity': row.quantity or 0,
+        'updated_at': max(stamps).isoformat() if stamps else None
+    }
+
+def get_catalog_changes(cursor=None, limit=DEFAULT_SYNC_PAGE_SIZE):
+    """
+    Get one page of the product catalog feed
+
+    Without a cursor the feed starts with every product, in ID order, and
+    then continues with the products changed since that full pass began, in
+    change order. Deleted products appear as {'id': ..., 'deleted': True}.
+    A client stores next_cursor and passes it back on its next call.
+
+    Args:
+        cursor (str): The next_cursor of the previous page
+        limit (int): Maximum number of products in the page
+
+    Returns:
+        dict: items, next_cursor, has_more and full (whether the page
+            belongs to the initial full pass)
+
+    Raises:
+        ValueError: If the cursor is not valid
+    """
+    if cursor:
+        values = decode_cursor(cursor, _CURSOR_COLUMNS)
+        if values is None or not isinstance(values[0], int) or not isinstance(values[1], (int, type(None))):
+            raise ValueError('Invalid sync cursor')
+        seq, after_id = values
+    else:
+        # Changes made during the full pass are picked up after it
+        seq, after_id = get_sync_version(), 0
+
+    if after_id is not None:
+        rows = db.session.execute(select(*_catalog_columns()).outerjoin(
+            Inventory, Inventory.product_id == Product.id
+        ).where(Product.id > after_id).order_by(Product.id).limit(limit + 1)).all()
+        last_page = len(rows) <= limit
+        rows = rows[:limit]
+        # After the last page of the full pass the client continues with
+        # the changes, so there is always more to fetch
+        return {
+            'items': [_serialize_row(row) for row in rows],
+            'next_cursor': encode_cursor((seq, None if last_page else rows[-1].id)),
+            'has_more': True,
+            'full': True
+        }
+
+    rows = db.session.execute(select(
+        *_catalog_columns(),
+        ProductChange.product_id.label('change_id'),
+        ProductChange.seq,
+        ProductChange.deleted
+    ).select_from(ProductChange).outerjoin(
+        Product, Product.id == ProductChange.product_id
+    ).outerjoin(
+        Inventory, Inventory.product_id == ProductChange.product_id
+    ).where(ProductChange.seq > seq).order_by(ProductChange.seq).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [
+        {'id': row.change_id, 'deleted': True} if row.deleted or row.id is None else _serialize_row(row)
+        for row in rows
+    ]
+    if rows:
+        seq = rows[-1].seq
+    return {
+        'items': items,
+        'next_cursor': encode_cursor((seq, None)),
+        'has_more': has_more,
+        'full': False
+    }
+
+def compressed_jsonify(payload):
+    """
+    Build a JSON response, gzip-compressed when the client accepts it
+
+    Args:
+        payload: The JSON-serializable body
+
+    Returns:
+        Response: The response
+    """
+    response = jsonify(payload)
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) >= MIN_COMPRESS_SIZE and request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    """Record products whose row or inventory was flushed"""
+    product_ids = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Product):
+            product_ids.add(instance.id)
+        elif isinstance(instance, Inventory):
+            product_ids.add(instance.product_id)
+    product_ids.discard(None)
+    if product_ids:
+        mark_products_changed(product_ids, session)
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _record_product_changes(session):
+    """Append the changed products to the feed in the committing transaction"""
+    session.flush()
+    product_ids = session.info.pop(CHANGED_KEY, None)
+    if product_ids:
+        record_product_changes(product_ids, session)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop(CHANGED_KEY, None)
@@ -0,0 +1,39 @@
+import os
+import pytest
+from models import db, User
+from seed import seed_database
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The application on a small seeded SQLite database with every migration applied"""
+    path = tmp_path_factory.mktemp('db') / 'test.db'
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['AUDIT_WRITE_BEHIND'] = '0'
+    from app import app, create_tables
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    create_tables()
+    with app.app_context():
+        seed_database(products=500, sales=2000, purchases=300, customers=200, suppliers=20)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    return app
+
+@pytest.fixture
+def app_context(app):
+    with app.test_request_context():
+        yield
+        db.session.rollback()
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as the admin user"""
+    client = app.test_client()
+    with app.app_context():
+        admin_id = User.query.filter_by(username='admin').one().id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    return client
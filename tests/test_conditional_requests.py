@@ -0,0 +1,49 @@
+import pytest
+from models import db, Product
+
+
+@pytest.fixture
+def product_id(app):
+    with app.app_context():
+        return db.session.query(Product.id).order_by(Product.id).first().id
+
+
+def assert_revalidates(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.get_json() is not None
+    etag = response.headers['ETag']
+
+    cached = client.get(path, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.get_data() == b''
+    assert cached.headers['ETag'] == etag
+    return response
+
+
+def test_products_list(client):
+    response = assert_revalidates(client, '/api/products')
+    assert all(item['quantity'] > 0 for item in response.get_json())
+
+def test_product(client, product_id):
+    response = assert_revalidates(client, f'/api/product/{product_id}')
+    assert response.get_json()['id'] == product_id
+
+def test_product_not_found(client):
+    assert client.get('/api/product/999999').status_code == 404
+
+def test_low_stock(client):
+    response = assert_revalidates(client, '/api/low-stock')
+    assert all(item['low'] for item in response.get_json()['items'])
+
+def test_product_change_invalidates_list(client, app, product_id):
+    etag = client.get('/api/products').headers['ETag']
+
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        product.sale_price += 1
+        db.session.commit()
+
+    response = client.get('/api/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,32 @@
+import pytest
+from models import db
+from index_advisor import capture_queries
+from export import (
+    generate_product_report, generate_inventory_report, generate_sales_report, generate_purchases_report,
+    stream_product_report, stream_inventory_report, stream_sales_report, stream_purchases_report
+)
+
+
+@pytest.mark.parametrize('generate', [
+    generate_product_report, generate_inventory_report, generate_sales_report, generate_purchases_report
+])
+def test_report_runs_one_query(app_context, tmp_path, monkeypatch, generate):
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    queries = capture_queries([db.engine], lambda: paths.append(generate('csv')), unique=False)
+
+    assert len(queries) == 1
+    with open(tmp_path / paths[0], encoding='utf-8') as f:
+        assert sum(1 for _ in f) > 100
+
+
+@pytest.mark.parametrize('stream', [
+    stream_product_report, stream_inventory_report, stream_sales_report, stream_purchases_report
+])
+def test_streamed_report_runs_one_query(app_context, stream):
+    chunks = []
+    queries = capture_queries([db.engine], lambda: chunks.extend(stream()), unique=False)
+
+    assert len(queries) == 1
+    assert ''.join(chunks).count('\n') > 100
+
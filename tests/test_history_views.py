@@ -0,0 +1,15 @@
+from models import db, Inventory
+
+
+def test_inventory_movements(client, app):
+    response = client.get('/inventory/movements')
+    assert response.status_code == 200
+
+    with app.app_context():
+        product_id = db.session.query(Inventory.product_id).order_by(Inventory.id).first().product_id
+    page = client.get(f'/inventory/movements?format=json&product_id={product_id}&type=out').get_json()
+    assert all(item['product_id'] == product_id and item['movement_type'] == 'out' for item in page['items'])
+
+def test_activities(client):
+    assert client.get('/activities').status_code == 200
+    assert 'items' in client.get('/activities?format=json').get_json()
@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+from models import db, Sale, SaleItem, Purchase, InventoryTransaction, InventoryMovement, UserActivity
+from index_advisor import capture_queries, analyze_queries, explain, find_scans, existing_indexes, propose_index
+from pagination import keyset_paginate
+from summaries import get_daily_sales, get_sales_totals, get_product_profit
+from inventory_stats import get_inventory_value, get_inventory_summary, get_category_values
+from low_stock import get_low_stock_products, count_low_stock
+from export import product_report_query, sales_report_query, purchases_report_query
+
+
+def run_indexed_queries():
+    """Issue the lookups of the hot routes, each of which must be served by an index"""
+    end = date.today()
+    start = end - timedelta(days=30)
+
+    get_daily_sales(start, end)
+    get_sales_totals(start, end)
+    get_low_stock_products(limit=20)
+    count_low_stock()
+
+    keyset_paginate(Sale.query, Sale.created_at, Sale.id, per_page=20)
+    keyset_paginate(Purchase.query, Purchase.created_at, Purchase.id, per_page=20)
+    keyset_paginate(InventoryMovement.query, InventoryMovement.timestamp, InventoryMovement.id, per_page=20)
+    keyset_paginate(UserActivity.query, UserActivity.timestamp, UserActivity.id, per_page=20)
+    Sale.query.filter(Sale.status == 'completed', Sale.sale_date >= start).order_by(Sale.sale_date.desc()).limit(20).all()
+    Purchase.query.filter(Purchase.status == 'completed').order_by(Purchase.purchase_date.desc()).limit(20).all()
+    SaleItem.query.filter(SaleItem.sale_id == 1).all()
+    SaleItem.query.filter(SaleItem.product_id == 1).all()
+    InventoryTransaction.query.filter(InventoryTransaction.product_id == 1).order_by(
+        InventoryTransaction.timestamp.desc()).limit(20).all()
+
+def run_full_reads():
+    """Issue the aggregates and reports of the hot routes, which read whole tables by design"""
+    end = date.today()
+    start = end - timedelta(days=30)
+
+    get_product_profit(start, end, limit=20)
+    get_inventory_value('low')
+    get_inventory_summary()
+    get_category_values()
+    db.session.execute(product_report_query().limit(20)).all()
+    db.session.execute(sales_report_query().limit(20)).all()
+    db.session.execute(purchases_report_query().limit(20)).all()
+
+
+def test_hot_lookups_do_not_scan(app_context):
+    queries = capture_queries([db.engine], run_indexed_queries)
+    assert len(queries) >= 12
+
+    with db.engine.connect() as connection:
+        scans = [
+            (' '.join(statement.split()), find_scans(explain(connection, statement, parameters)))
+            for statement, parameters in queries
+        ]
+    assert [(statement, tables) for statement, tables in scans if tables] == []
+
+def test_full_reads_only_scan_their_driving_table(app_context):
+    queries = capture_queries([db.engine], run_full_reads)
+
+    with db.engine.connect() as connection:
+        results = analyze_queries(connection, queries)
+
+    # The aggregate subquery of get_product_profit is materialized as anon_1
+    allowed = {'anon_1', 'inventory', 'products', 'sales', 'purchases'}
+    assert [result['scans'] for result in results if set(result['scans']) - allowed or len(result['scans']) > 1] == []
+    assert [result['proposals'] for result in results if result['proposals']] == []
+
+
+def test_propose_index_for_filtered_scan():
+    statement = 'SELECT sales.id FROM sales WHERE sales.status = ? AND sales.sale_date >= ? ORDER BY sales.sale_date'
+    assert propose_index(statement, 'sales') == 'CREATE INDEX ix_sales_status_sale_date ON sales (status, sale_date)'
+
+def test_propose_index_skips_whole_table_aggregates():
+    statement = (
+        'SELECT categories.id, sum(inventory.quantity * products.purchase_price) AS value FROM inventory '
+        'JOIN products ON inventory.product_id = products.id '
+        'LEFT OUTER JOIN categories ON products.category_id = categories.id '
+        'GROUP BY categories.id ORDER BY sum(inventory.quantity * products.purchase_price) DESC'
+    )
+    assert propose_index(statement, 'inventory') is None
+
+def test_propose_index_skips_existing_indexes(app_context):
+    statement = 'SELECT inventory.id FROM inventory WHERE inventory.quantity < ?'
+    with db.engine.connect() as connection:
+        indexes = existing_indexes(connection, 'inventory')
+    assert ['quantity'] in indexes
+    assert propose_index(statement, 'inventory') == 'CREATE INDEX ix_inventory_quantity ON inventory (quantity)'
+    assert propose_index(statement, 'inventory', indexes) is None
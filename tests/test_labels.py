@@ -0,0 +1,35 @@
+from models import db, Product
+from utils import barcode_cache
+
+
+def products_without_barcode():
+    return Product.query.filter(db.or_(Product.barcode.is_(None), Product.barcode == '')).count()
+
+
+def test_unsupported_type_is_rejected_before_barcodes_are_saved(client, app):
+    with app.app_context():
+        product = db.session.query(Product).order_by(Product.id).first()
+        product.barcode = None
+        db.session.commit()
+        missing = products_without_barcode()
+
+        response = client.post('/products/labels', data={'selection': 'missing', 'barcode_type': 'bogus'})
+
+        assert response.status_code == 302
+        assert products_without_barcode() == missing
+
+def test_label_sheet_is_sent_as_pdf(client, app, tmp_path, monkeypatch):
+    monkeypatch.setattr(barcode_cache, 'directory', str(tmp_path))
+    with app.app_context():
+        product_ids = [row.id for row in db.session.query(Product.id).filter(Product.barcode != '').order_by(Product.id).limit(3)]
+
+    response = client.post('/products/labels', data={
+        'selection': 'ids',
+        'product_ids': ', '.join(map(str, product_ids)),
+        'barcode_type': 'code128'
+    })
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.get_data().startswith(b'%PDF')
+    assert response.headers['X-Labels-Printed'] == '3'
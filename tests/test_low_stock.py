@@ -0,0 +1,59 @@
+import low_stock
+from sqlalchemy import select, update
+from models import db, Inventory, LowStockFlag, Product
+from low_stock import count_low_stock, get_low_stock_changes, get_low_stock_version, refresh_low_stock
+from inventory_stats import get_inventory_summary, stock_status_filter
+
+
+def make_low(product_id):
+    db.session.execute(update(Inventory.__table__).where(Inventory.product_id == product_id).values(quantity=0))
+    refresh_low_stock([product_id])
+
+
+def test_change_committed_during_the_read_is_not_skipped(app_context, monkeypatch):
+    since = get_low_stock_version()
+    product_id = db.session.execute(select(Product.id).join(
+        Inventory, Inventory.product_id == Product.id
+    ).outerjoin(
+        LowStockFlag, LowStockFlag.product_id == Product.id
+    ).where(
+        Inventory.quantity > Product.min_quantity,
+        LowStockFlag.product_id.is_(None)
+    ).limit(1)).scalar()
+
+    # A change that commits just before get_low_stock_changes reads the version
+    read_version = low_stock.get_low_stock_version
+    def change_then_version():
+        make_low(product_id)
+        return read_version()
+    monkeypatch.setattr(low_stock, 'get_low_stock_version', change_then_version)
+
+    version, changes = get_low_stock_changes(since)
+    seen = {change['product_id'] for change in changes}
+    if product_id not in seen:
+        # The next poll must return it
+        monkeypatch.setattr(low_stock, 'get_low_stock_version', read_version)
+        _, changes = get_low_stock_changes(version)
+        seen.update(change['product_id'] for change in changes)
+    assert product_id in seen
+
+def test_dashboard_shows_the_low_stock_count(client, app):
+    with app.app_context():
+        count = count_low_stock()
+    assert f'<p class="card-text display-6">{count}</p>' in client.get('/').get_data(as_text=True)
+
+def test_low_status_matches_the_low_stock_set(app_context):
+    low = db.session.query(Inventory.product_id).join(Product, Product.id == Inventory.product_id).filter(
+        stock_status_filter('low')
+    ).count()
+    summary = get_inventory_summary()
+
+    assert low == count_low_stock()
+    assert summary['low_stock'] == count_low_stock()
+    assert summary['out_of_stock'] <= summary['low_stock']
+
+def test_inventory_page_filters_by_status(client, app):
+    with app.app_context():
+        count = count_low_stock()
+    body = client.get('/inventory?status=low').get_data(as_text=True)
+    assert body.count('/product/transactions/') == count
@@ -0,0 +1,65 @@
+import pytest
+from flask import Flask, Response, stream_with_context
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from profiler import init_profiler, get_route_stats, reset_route_stats
+
+
+@pytest.fixture
+def profiled():
+    """A small profiled app with its own in-memory database"""
+    app = Flask(__name__)
+    app.config['SQL_PROFILER_ENABLED'] = True
+    init_profiler(app)
+    engine = create_engine('sqlite://')
+
+    def run(count):
+        with engine.connect() as connection:
+            for _ in range(count):
+                connection.execute(text('SELECT 1'))
+
+    @app.route('/plain')
+    def plain():
+        run(2)
+        return 'ok'
+
+    @app.route('/stream')
+    def stream():
+        run(1)
+        def rows():
+            for _ in range(3):
+                run(1)
+                yield 'row\n'
+        return Response(stream_with_context(rows()))
+
+    @app.route('/failing')
+    def failing():
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM missing'))
+            connection.execute(text('SELECT 1'))
+            assert not connection.info
+        return 'ok'
+
+    reset_route_stats()
+    yield app.test_client()
+    reset_route_stats()
+
+
+def test_plain_response_gets_headers(profiled):
+    response = profiled.get('/plain')
+    assert response.headers['X-DB-Queries'] == '2'
+    assert get_route_stats()[0]['total_queries'] == 2
+
+def test_streamed_queries_are_counted(profiled):
+    response = profiled.get('/stream')
+    assert response.get_data() == b'row\n' * 3
+
+    assert 'X-DB-Queries' not in response.headers
+    stats, = get_route_stats()
+    assert (stats['endpoint'], stats['requests'], stats['total_queries']) == ('stream', 1, 4)
+
+def test_failed_statement_leaves_no_state(profiled):
+    response = profiled.get('/failing')
+    assert response.status_code == 200
+    assert response.headers['X-DB-Queries'] == '1'
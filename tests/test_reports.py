@@ -0,0 +1,51 @@
+import uuid
+from models import db, Inventory, Product
+
+
+def test_reports_page_renders(client):
+    assert client.get('/reports').status_code == 200
+
+def test_profit_report_uses_stored_cost(client, app):
+    with app.app_context():
+        product = db.session.query(Product).join(Inventory).filter(Inventory.quantity >= 5).order_by(Product.id).first()
+        product_id, cost = product.id, product.purchase_price
+
+        before = client.get('/reports/profit?format=json&start_date=2030-05-01&end_date=2030-05-01').get_json()
+        assert before['items'] == []
+
+        response = client.post('/sales/add', data={
+            'invoice_number': f'INV-{uuid.uuid4().hex[:8]}',
+            'sale_date': '2030-05-01',
+            'payment_method': 'cash',
+            'product_id[]': [str(product_id)],
+            'quantity[]': ['2'],
+            'unit_price[]': [str(cost + 5)]
+        })
+        assert response.status_code == 302
+
+        # A later purchase price change must not move the profit of the sale
+        product.purchase_price = cost + 100
+        db.session.commit()
+
+    body = client.get('/reports/profit?format=json&start_date=2030-05-01&end_date=2030-05-01').get_json()
+    assert [(row['product_id'], row['quantity']) for row in body['items']] == [(product_id, 2)]
+    assert body['total_profit'] == 10
+    assert client.get('/reports/profit?start_date=2030-05-01').status_code == 200
+
+def test_top_selling_report_is_ordered_by_quantity(client):
+    body = client.get('/reports/top-selling?format=json&limit=5').get_json()
+    quantities = [row['quantity'] for row in body['items']]
+
+    assert len(quantities) == 5
+    assert quantities == sorted(quantities, reverse=True)
+
+def test_customers_report(client):
+    body = client.get('/reports/customers?format=json&limit=3').get_json()
+    totals = [row['total'] for row in body['items']]
+
+    assert len(totals) == 3
+    assert totals == sorted(totals, reverse=True)
+    assert client.get('/reports/customers').status_code == 200
+
+def test_malformed_report_date_is_rejected(client):
+    assert client.get('/reports/profit?start_date=yesterday').status_code == 400
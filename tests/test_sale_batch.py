@@ -0,0 +1,90 @@
+import uuid
+import pytest
+from models import db, Inventory, Sale, SaleItem
+
+
+@pytest.fixture
+def stocked(app):
+    """(product_id, quantity) of two products with stock"""
+    with app.app_context():
+        return [tuple(row) for row in db.session.query(Inventory.product_id, Inventory.quantity).filter(
+            Inventory.quantity >= 20
+        ).order_by(Inventory.product_id).limit(2)]
+
+
+def make_sale(product_id, quantity=1, price=10.0, **extra):
+    return dict({
+        'key': str(uuid.uuid4()),
+        'invoice_number': f'OFF-{uuid.uuid4().hex[:8]}',
+        'sale_date': '2026-01-15',
+        'items': [{'product_id': product_id, 'quantity': quantity, 'price': price}]
+    }, **extra)
+
+def upload(client, sales):
+    response = client.post('/api/sales/batch', json={'sales': sales})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_upload_creates_sales_and_stock_movements(client, app, stocked):
+    (product_id, quantity), _ = stocked
+    body = upload(client, [make_sale(product_id, quantity=2, price=12.5)])
+
+    assert body['created'] == 1
+    sale_id = body['results'][0]['sale_id']
+    with app.app_context():
+        assert db.session.get(Sale, sale_id).total_amount == 25.0
+        item = SaleItem.query.filter_by(sale_id=sale_id).one()
+        assert (item.product_id, item.quantity, item.price) == (product_id, 2, 12.5)
+        assert Inventory.query.filter_by(product_id=product_id).one().quantity == quantity - 2
+
+def test_repeated_upload_returns_duplicates(client, stocked):
+    sales = [make_sale(stocked[0][0]), make_sale(stocked[1][0])]
+    first = upload(client, sales)
+    second = upload(client, sales)
+
+    assert first['created'] == 2
+    assert second['duplicate'] == 2
+    assert [r['sale_id'] for r in second['results']] == [r['sale_id'] for r in first['results']]
+
+@pytest.mark.parametrize('item', [
+    {'price': 'nan'},
+    {'price': 'Infinity'},
+    {'price': float('inf')},
+    {'price': -1},
+    {'quantity': 2.9},
+    {'quantity': '2.5'},
+    {'quantity': 0},
+    {'quantity': True},
+    {'product_id': 'abc'}
+])
+def test_invalid_line_is_rejected_without_blocking_the_chunk(client, stocked, item):
+    bad = make_sale(stocked[1][0])
+    bad['items'][0].update(item)
+    body = upload(client, [make_sale(stocked[0][0]), bad])
+
+    assert [r['status'] for r in body['results']] == ['created', 'rejected']
+    assert body['retry'] == 0
+
+def test_whole_float_quantity_is_accepted(client, stocked):
+    body = upload(client, [make_sale(stocked[0][0], quantity=2.0)])
+    assert body['created'] == 1
+
+def test_unknown_product_and_short_stock_are_rejected(client, stocked):
+    product_id, quantity = stocked[0]
+    body = upload(client, [make_sale(999999), make_sale(product_id, quantity=quantity + 1000)])
+
+    assert [r['status'] for r in body['results']] == ['rejected', 'rejected']
+    assert 'Unknown product' in body['results'][0]['error']
+    assert 'Insufficient stock' in body['results'][1]['error']
+
+def test_non_list_body_is_a_bad_request(client):
+    assert client.post('/api/sales/batch', json=[1, 2]).status_code == 400
+    assert client.post('/api/sales/batch', json={'sales': 'x'}).status_code == 400
+
+def test_storage_error_rejects_only_the_faulty_sale(client, stocked, monkeypatch):
+    # Let a NaN price through validation so the insert itself fails
+    monkeypatch.setattr('sale_batch._finite_number', float)
+    body = upload(client, [make_sale(stocked[0][0]), make_sale(stocked[1][0], price='nan')])
+
+    assert [r['status'] for r in body['results']] == ['created', 'rejected']
@@ -0,0 +1,100 @@
+import uuid
+import pytest
+from models import db, Inventory, InventoryMovement, InventoryTransaction, Product, Sale, SaleItem, Supplier
+
+
+@pytest.fixture
+def stocked(app):
+    """(product_id, quantity) of two products with stock"""
+    with app.app_context():
+        return [tuple(row) for row in db.session.query(Inventory.product_id, Inventory.quantity).filter(
+            Inventory.quantity >= 20
+        ).order_by(Inventory.product_id.desc()).limit(2)]
+
+
+def stock_of(product_id):
+    return Inventory.query.filter_by(product_id=product_id).one().quantity
+
+def sale_form(lines, **extra):
+    return dict({
+        'invoice_number': f'INV-{uuid.uuid4().hex[:8]}',
+        'sale_date': '2026-01-15',
+        'payment_method': 'card',
+        'product_id[]': [str(product_id) for product_id, _, _ in lines],
+        'quantity[]': [str(quantity) for _, quantity, _ in lines],
+        'unit_price[]': [str(price) for _, _, price in lines]
+    }, **extra)
+
+def add_sale(client, lines, **extra):
+    form = sale_form(lines, **extra)
+    response = client.post('/sales/add', data=form)
+    return response, Sale.query.filter_by(invoice_number=form['invoice_number']).one_or_none()
+
+
+def test_add_sale_decrements_stock_and_stores_cost(client, app, stocked):
+    (first, first_quantity), (second, second_quantity) = stocked
+    with app.app_context():
+        response, sale = add_sale(client, [(first, 2, 10), (second, 1, 4.5), (first, 1, 10)])
+
+        assert response.status_code == 302
+        assert (sale.total_amount, sale.payment_method) == (34.5, 'card')
+        assert stock_of(first) == first_quantity - 3
+        assert stock_of(second) == second_quantity - 1
+        purchase_price = db.session.get(Product, first).purchase_price
+        assert {item.cost for item in SaleItem.query.filter_by(sale_id=sale.id, product_id=first)} == {purchase_price}
+        assert InventoryMovement.query.filter_by(reference=f'INV-{sale.id}', movement_type='out').count() == 3
+
+@pytest.mark.parametrize('price', ['-1', 'nan', 'inf'])
+def test_add_sale_rejects_invalid_prices(client, app, stocked, price):
+    product_id, quantity = stocked[0]
+    with app.app_context():
+        response, sale = add_sale(client, [(product_id, 1, price)])
+
+        assert response.status_code == 200
+        assert sale is None
+        assert stock_of(product_id) == quantity
+
+def test_add_sale_rejects_short_stock(client, app, stocked):
+    product_id, quantity = stocked[0]
+    with app.app_context():
+        response, sale = add_sale(client, [(product_id, quantity + 1, 10)])
+
+        assert response.status_code == 200
+        assert sale is None
+        assert stock_of(product_id) == quantity
+
+def test_add_sale_form_renders(client):
+    assert client.get('/sales/add').status_code == 200
+
+def test_cancel_sale_returns_stock_once(client, app, stocked):
+    product_id, quantity = stocked[0]
+    with app.app_context():
+        _, sale = add_sale(client, [(product_id, 4, 10)])
+        assert stock_of(product_id) == quantity - 4
+
+        assert client.post(f'/sales/cancel/{sale.id}').status_code == 302
+        assert client.post(f'/sales/cancel/{sale.id}').status_code == 302
+
+        db.session.expire_all()
+        assert db.session.get(Sale, sale.id).status == 'cancelled'
+        assert stock_of(product_id) == quantity
+        assert InventoryMovement.query.filter_by(reference=f'INV-CANCEL-{sale.id}', movement_type='in').count() == 1
+
+def test_add_purchase_increments_stock(client, app, stocked):
+    product_id, quantity = stocked[0]
+    with app.app_context():
+        supplier_id = Supplier.query.first().id
+        response = client.post('/purchases/add', data={
+            'invoice_number': f'PUR-{uuid.uuid4().hex[:8]}',
+            'purchase_date': '2026-01-15',
+            'supplier_id': supplier_id,
+            'payment_method': 'cash',
+            'items-0-product_id': product_id,
+            'items-0-quantity': 5,
+            'items-0-price': 3.0
+        })
+
+        assert response.status_code == 302
+        assert stock_of(product_id) == quantity + 5
+        transaction = InventoryTransaction.query.filter_by(product_id=product_id).order_by(InventoryTransaction.id.desc()).first()
+        assert (transaction.quantity_before, transaction.quantity_after) == (quantity, quantity + 5)
@@ -0,0 +1,13 @@
+from settings_registry import SETTINGS, update_settings
+
+
+def test_pages_use_the_store_settings(client, app):
+    with app.app_context():
+        update_settings({'store_name': 'متجر الاختبار', 'currency': 'XYZ'})
+    try:
+        page = client.get('/products').get_data(as_text=True)
+        assert 'متجر الاختبار' in page
+        assert ' XYZ</td>' in page
+    finally:
+        with app.app_context():
+            update_settings({'store_name': SETTINGS['store_name'][1], 'currency': SETTINGS['currency'][1]})
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm.exc import StaleDataError
+import user_cache
+from models import db, User
+from user_cache import USER_CACHE_TTL, invalidate_user, load_cached_user
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        return User.query.filter_by(username='admin').one().id
+
+
+def deactivate_elsewhere(user_id, is_active):
+    """Change the row the way another worker would: no eviction in this process"""
+    with db.engine.begin() as connection:
+        connection.execute(update(User.__table__).where(User.id == user_id).values(
+            is_active=is_active, version=User.__table__.c.version + 1
+        ))
+
+
+def test_other_workers_changes_are_seen_after_the_ttl(app_context, user_id, monkeypatch):
+    assert USER_CACHE_TTL <= 5
+    invalidate_user()
+    assert load_cached_user(user_id).is_active
+
+    deactivate_elsewhere(user_id, False)
+    try:
+        # Still cached within the TTL
+        assert load_cached_user(user_id).is_active
+
+        monkeypatch.setitem(user_cache._settings, 'ttl', 0)
+        invalidate_user()
+        assert not load_cached_user(user_id).is_active
+    finally:
+        deactivate_elsewhere(user_id, True)
+        invalidate_user()
+
+def test_user_updates_are_optimistically_locked(app_context, user_id):
+    user = db.session.get(User, user_id)
+    deactivate_elsewhere(user_id, True)
+
+    user.full_name = 'stale edit'
+    with pytest.raises(StaleDataError):
+        db.session.commit()
+    db.session.rollback()
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, select
+from models import db, User
+from database import RoutingSession
+
+# Defaults for the USER_CACHE_* config keys. The TTL is how long a user
+# deactivated or demoted by another worker process keeps the cached
+# is_active and role in this one, so it is kept short.
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 5
+
+# Session.info key holding the IDs of users changed in the current transaction
+CHANGED_KEY = 'user_cache_changed'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_settings = {'size': USER_CACHE_SIZE, 'ttl': USER_CACHE_TTL}
+
+
+class UserSnapshot:
+    """
+    Detached, read-only copy of the fields every request needs
+
+    It is what current_user is for logged-in users. Reading any other
+    attribute (email, full_name, ...) loads the User row through the
+    current session; code that changes the user must load the User itself.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, role, is_active, version):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_active = is_active
+        self.version = version
+
+    def get_id(self):
+        return str(self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(db.session.get(User, self.id), name)
+
+    def __eq__(self, other):
+        return isinstance(other, (UserSnapshot, User)) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username} v{self.version}>'
+
+
+def init_user_cache(app):
+    """
+    Configure the cache from USER_CACHE_SIZE and USER_CACHE_TTL (seconds)
+
+    Args:
+        app (Flask): The application
+    """
+    _settings['size'] = app.config.get('USER_CACHE_SIZE', USER_CACHE_SIZE)
+    _settings['ttl'] = app.config.get('USER_CACHE_TTL', USER_CACHE_TTL)
+
+def load_cached_user(user_id):
+    """
+    Get the snapshot of a user, querying the database only on a cache miss
+
+    Changes made in this process evict the entry when they commit. A
+    change committed by another worker process is not seen here until the
+    entry expires after USER_CACHE_TTL seconds: until then a deactivated
+    user stays logged in and a demoted admin keeps the admin role. Checking
+    User.version on every request would cost the same primary-key query the
+    cache exists to save, so the TTL is the bound.
+
+    Args:
+        user_id (str): The ID stored in the login session
+
+    Returns:
+        UserSnapshot: The user, or None if it does not exist
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry is not None and entry[1] > now:
+            _cache.move_to_end(user_id)
+            return entry[0]
+
+    row = db.session.execute(select(
+        User.id, User.username, User.role, User.is_active, User.version
+    ).where(User.id == user_id)).first()
+    if row is None:
+        invalidate_user(user_id)
+        return None
+
+    snapshot = UserSnapshot(row.id, row.username, row.role, bool(row.is_active), row.version)
+    with _cache_lock:
+        _cache[user_id] = (snapshot, now + _settings['ttl'])
+        _cache.move_to_end(user_id)
+        while len(_cache) > _settings['size']:
+            _cache.popitem(last=False)
+    return snapshot
+
+def invalidate_user(user_id=None):
+    """
+    Drop a user's snapshot from this process's cache
+
+    Args:
+        user_id (int): The user (default: every user)
+    """
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    """Record users whose row was updated or deleted (their version changed)"""
+    user_ids = {
+        instance.id for instance in list(session.dirty) + list(session.deleted)
+        if isinstance(instance, User)
+    }
+    if user_ids:
+        session.info.setdefault(CHANGED_KEY, set()).update(user_ids)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _evict_changed_users(session):
+    for user_id in session.info.pop(CHANGED_KEY, ()):
+        invalidate_user(user_id)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop(CHANGED_KEY, None)
@@ -1,4 +1,8 @@
 import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 import barcode
 from barcode.writer import ImageWriter
 from io import BytesIO
@@ -11,6 +15,140 @@ def generate_random_barcode(length=12):
     """Generate a random barcode number of specified length"""
     return ''.join(random.choices(string.digits, k=length))
 
+BARCODE_DIR = 'static/barcodes'
+BARCODE_CACHE_DIR = os.path.join(BARCODE_DIR, 'cache')
+
+
+class BarcodeCache:
+    """
+    Two-tier cache of rendered barcode PNG images
+
+    Images are keyed by a hash of (value, symbology, writer options). The
+    memory tier is an LRU bounded by the total size of the cached images;
+    the disk tier keeps one content-addressed file per key, so a render is
+    only ever done once per distinct barcode.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, directory=BARCODE_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(barcode_value, barcode_type, writer_options=None):
+        """Build the cache key for a barcode"""
+        options = json.dumps(writer_options or {}, sort_keys=True, default=str)
+        raw = f'{barcode_type}\0{barcode_value}\0{options}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, image):
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return
+            if len(image) > self.max_bytes:
+                return
+            self._images[key] = image
+            self._size += len(image)
+            while self._size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _lookup(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def get_png(self, barcode_value, barcode_type='code128', writer_options=None):
+        """
+        Get a barcode as PNG bytes, rendering it only on a cache miss
+
+        Args:
+            barcode_value (str): The value to encode in the barcode
+            barcode_type (str): The type of barcode to generate
+            writer_options (dict): Options passed to the image writer
+
+        Returns:
+            bytes: The PNG image data
+        """
+        key = self.make_key(barcode_value, barcode_type, writer_options)
+
+        image = self._lookup(key)
+        if image is not None:
+            return image
+
+        path = os.path.join(self.directory, f'{key}.png')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                image = f.read()
+        else:
+            image = render_barcode_png(barcode_value, barcode_type, writer_options)
+            self._write_file(path, image)
+
+        self._remember(key, image)
+        return image
+
+    def get_file(self, barcode_value, barcode_type='code128', writer_options=None):
+        """
+        Get the path of the cached PNG file for a barcode, rendering it only on a miss
+
+        This only uses the disk tier, so it is safe to call from worker
+        processes that share the cache directory.
+
+        Args:
+            barcode_value (str): The value to encode in the barcode
+            barcode_type (str): The type of barcode to generate
+            writer_options (dict): Options passed to the image writer
+
+        Returns:
+            str: Path to the PNG file
+        """
+        key = self.make_key(barcode_value, barcode_type, writer_options)
+        path = os.path.join(self.directory, f'{key}.png')
+        if not os.path.exists(path):
+            self._write_file(path, render_barcode_png(barcode_value, barcode_type, writer_options))
+        return path
+
+    def _write_file(self, path, image):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial image
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """Empty the memory tier"""
+        with self._lock:
+            self._images.clear()
+            self._size = 0
+
+
+barcode_cache = BarcodeCache()
+
+
+def render_barcode_png(barcode_value, barcode_type='code128', writer_options=None):
+    """
+    Render a barcode to PNG bytes, bypassing the cache
+
+    Args:
+        barcode_value (str): The value to encode in the barcode
+        barcode_type (str): The type of barcode to generate
+        writer_options (dict): Options passed to the image writer
+
+    Returns:
+        bytes: The PNG image data
+    """
+    output = BytesIO()
+    barcode_class = barcode.get_barcode_class(barcode_type)
+    barcode_instance = barcode_class(barcode_value, writer=ImageWriter())
+    barcode_instance.write(output, writer_options)
+    return output.getvalue()
+
 def generate_barcode_base64(barcode_value, barcode_type='code128'):
     """
     Generate a barcode image and return it as a base64 encoded string
@@ -25,22 +163,16 @@ def generate_barcode_base64(barcode_value, barcode_type='code128'):
     if not barcode_value:
         barcode_value = generate_random_barcode()
     
-    # Create a BytesIO object to store the image
-    output = BytesIO()
-    
-    # Create the barcode
+    # Get the barcode image (rendered only on a cache miss)
     try:
-        barcode_class = barcode.get_barcode_class(barcode_type)
-        barcode_instance = barcode_class(barcode_value, writer=ImageWriter())
-        barcode_instance.write(output)
+        image = barcode_cache.get_png(barcode_value, barcode_type)
     except Exception as e:
         # If there's an error, return None
         print(f"Error generating barcode: {e}")
         return None
     
-    # Get the image data and encode it as base64
-    output.seek(0)
-    encoded_image = base64.b64encode(output.getvalue()).decode('utf-8')
+    # Encode the image data as base64
+    encoded_image = base64.b64encode(image).decode('utf-8')
     
     return encoded_image
 
@@ -48,6 +180,9 @@ def generate_barcode_file(barcode_value, filename, barcode_type='code128'):
     """
     Generate a barcode image and save it to a file
     
+    The file is only written when it does not exist yet; the image itself
+    comes from the barcode cache.
+    
     Args:
         barcode_value (str): The value to encode in the barcode
         filename (str): The filename to save the barcode to (without extension)
@@ -61,14 +196,16 @@ def generate_barcode_file(barcode_value, filename, barcode_type='code128'):
     
     # Create the barcode
     try:
-        barcode_class = barcode.get_barcode_class(barcode_type)
-        barcode_instance = barcode_class(barcode_value, writer=ImageWriter())
+        image = barcode_cache.get_png(barcode_value, barcode_type)
         
         # Ensure the static/barcodes directory exists
-        os.makedirs('static/barcodes', exist_ok=True)
+        os.makedirs(BARCODE_DIR, exist_ok=True)
         
-        # Save the barcode to a file
-        filepath = barcode_instance.save(f'static/barcodes/{filename}')
+        # Save the barcode to a file unless an identical one is already there
+        filepath = f'{BARCODE_DIR}/{filename}.png'
+        if not os.path.exists(filepath) or os.path.getsize(filepath) != len(image):
+            with open(filepath, 'wb') as f:
+                f.write(image)
         return filepath
     except Exception as e:
         # If there's an error, return None